@@ -0,0 +1,297 @@
+#!/usr/bin/python
+'''
+Microbenchmarks of the Python and ctypes overhead of shader.py and the
+modules built on it. They run against StubGl, whose GL functions do nothing,
+so no window, GL context or GPU is needed.
+
+    python benchmarks/bench.py [--quick] [--output results.json]
+        [--baseline baseline.json] [--tolerance 1.0]
+        [--save-baseline baseline.json]
+
+Each result is the best of several repeats, in seconds per call. Results are
+compared with the baseline, by default benchmarks/baseline.json, and any
+more than 'tolerance' slower than it make the run exit with status 1.
+Timings vary between machines, so record the baseline, with
+--save-baseline, on the machine which will compare against it.
+'''
+
+from argparse import ArgumentParser
+import json
+from os.path import dirname, exists, join
+import platform
+import sys
+from timeit import default_timer
+
+import fixpath
+
+import numpy
+
+import glbackend
+# no window or display is needed
+glbackend.select('fake')
+
+from shader import buildAll, FragmentShader, ShaderProgram, VertexShader
+from stubgl import StubGl
+from uniformblock import UniformBlock
+from vertexbuffer import VertexArray, VertexBuffer
+import shader
+import uniformblock
+import vertexbuffer
+
+
+defaultBaseline = join(dirname(__file__), 'baseline.json')
+
+vertexSource = 'attribute vec4 position;\nvoid main() { gl_Position = position; }\n'
+fragmentSource = 'void main() { gl_FragColor = vec4(1.0); }\n'
+
+
+def install(stub):
+    for module in (shader, uniformblock, vertexbuffer):
+        module.gl = stub
+
+
+def createProgram(chunks=1):
+    return ShaderProgram(
+        VertexShader([vertexSource] * chunks),
+        FragmentShader([fragmentSource] * chunks),
+    )
+
+
+def createBuiltProgram():
+    install(StubGl())
+    program = createProgram()
+    program.build()
+    return program
+
+
+def loop(function, calls):
+    def run(_):
+        for _ in xrange(calls):
+            function()
+    return run
+
+
+# each benchmark generates (name, setup, run, calls), where run is passed the
+# result of setup, and makes the given number of calls to the code measured
+benchmarks = []
+
+def benchmark(function):
+    benchmarks.append(function)
+    return function
+
+
+@benchmark
+def srcToArray(calls, sizes):
+    for chunks in sizes['chunks']:
+        shader = VertexShader([vertexSource] * chunks)
+        yield ('srcToArray[chunks=%d]' % (chunks,), None,
+            loop(shader._srcToArray, calls), calls)
+
+
+@benchmark
+def getParam(calls, sizes):
+    program = createBuiltProgram()
+    yield ('get', None,
+        loop(lambda: program._get(shader.gl.GL_LINK_STATUS), calls), calls)
+
+
+@benchmark
+def getInfoLog(calls, sizes):
+    for length in (0, 1024):
+        def setup(length=length):
+            program = createProgram()
+            program.build()
+            install(StubGl('x' * length))
+            return program
+        def run(program):
+            for _ in xrange(calls):
+                program.getInfoLog()
+        yield 'getInfoLog[bytes=%d]' % (length,), setup, run, calls
+
+
+@benchmark
+def compileShader(calls, sizes):
+    calls = max(calls // 10, 1)
+    for chunks in sizes['chunks']:
+        def setup(chunks=chunks):
+            install(StubGl())
+            return [VertexShader([vertexSource] * chunks)
+                for _ in xrange(calls)]
+        def run(shaders):
+            for shader in shaders:
+                shader.compile()
+        yield 'compile[chunks=%d]' % (chunks,), setup, run, calls
+
+
+@benchmark
+def build(calls, sizes):
+    for count in sizes['programs']:
+        def setup(count=count):
+            install(StubGl())
+            return [createProgram() for _ in xrange(count)]
+        yield 'buildAll[programs=%d]' % (count,), setup, buildAll, count
+
+
+@benchmark
+def use(calls, sizes):
+    program = createBuiltProgram()
+    yield 'use[bound]', None, loop(program.use, calls), calls
+
+    other = createProgram()
+    other.build()
+    def alternate():
+        program.use()
+        other.use()
+    yield 'use[alternating]', None, loop(alternate, calls // 2), calls // 2 * 2
+
+
+@benchmark
+def uniforms(calls, sizes):
+    program = createBuiltProgram()
+    program.setUniformf('scale', 1.0)
+    yield ('setUniformf[unchanged]', None,
+        loop(lambda: program.setUniformf('scale', 1.0), calls), calls)
+
+    def changing(program):
+        for value in xrange(calls):
+            program.setUniformf('scale', value)
+    yield 'setUniformf[changed]', lambda: program, changing, calls
+
+    matrix = range(16)
+    def changingMatrix(program):
+        for value in xrange(calls):
+            matrix[0] = value
+            program.setUniformMatrix('transform', matrix)
+    yield 'setUniformMatrix[changed]', lambda: program, changingMatrix, calls
+
+
+@benchmark
+def buffers(calls, sizes):
+    install(StubGl())
+    data = numpy.zeros(256, dtype=numpy.float32)
+    buffer = VertexBuffer(numpy.zeros(1024, dtype=numpy.float32))
+    yield ('VertexBuffer.setSubData', None,
+        loop(lambda: buffer.setSubData(0, data), calls), calls)
+
+    program = createBuiltProgram()
+    program.attributes = {'position': 0}
+    vao = VertexArray(program)
+    vao.setAttribute('position', buffer, 4)
+    yield ('VertexArray.draw', None,
+        loop(lambda: vao.draw(shader.gl.GL_TRIANGLES), calls), calls)
+
+    block = UniformBlock('Camera', [('view', 'mat4'), ('time', 'float')], 0)
+    block.upload()
+    def upload(block):
+        for value in xrange(calls):
+            block['time'] = value
+            block.upload()
+    yield 'UniformBlock.upload', lambda: block, upload, calls
+
+
+
+def runBenchmarks(calls, sizes, repeats, names=None):
+    results = {}
+    for function in benchmarks:
+        for name, setup, run, count in function(calls, sizes):
+            if names and not any(part in name for part in names):
+                continue
+            best = None
+            for _ in xrange(repeats):
+                state = setup() if setup is not None else None
+                start = default_timer()
+                run(state)
+                elapsed = default_timer() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            results[name] = best / count
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns a list of (name, baseline, result) for each result more than
+    tolerance slower than its baseline.
+    '''
+    regressions = []
+    for name, perCall in sorted(results.iteritems()):
+        expected = baseline.get(name)
+        if expected is not None and perCall > expected * (1 + tolerance):
+            regressions.append((name, expected, perCall))
+    return regressions
+
+
+def report(results, baseline):
+    print '%-32s %12s %12s %8s' % ('benchmark', 'us/call', 'baseline', 'ratio')
+    for name, perCall in sorted(results.iteritems()):
+        expected = baseline.get(name)
+        if expected is None:
+            print '%-32s %12.3f' % (name, perCall * 1e6)
+        else:
+            print '%-32s %12.3f %12.3f %8.2f' % (
+                name, perCall * 1e6, expected * 1e6, perCall / expected)
+
+
+def save(fname, results, quick):
+    output = {
+        'python': platform.python_version(),
+        'quick': quick,
+        'results': results,
+    }
+    f = open(fname, 'w')
+    try:
+        json.dump(output, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+
+
+def load(fname):
+    f = open(fname)
+    try:
+        return json.load(f)['results']
+    finally:
+        f.close()
+
+
+def main(args=None):
+    parser = ArgumentParser(description='Benchmark shader.py overhead.')
+    parser.add_argument('names', nargs='*',
+        help='only run benchmarks whose names contain one of these')
+    parser.add_argument('--quick', action='store_true',
+        help='fewer calls and smaller sizes, eg. for CI smoke tests')
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', default=defaultBaseline)
+    parser.add_argument('--tolerance', type=float, default=1.0,
+        help='fraction slower than the baseline which fails the run')
+    parser.add_argument('--save-baseline', metavar='FILE',
+        help='write the results as the new baseline')
+    options = parser.parse_args(args)
+
+    if options.quick:
+        calls = 1000
+        sizes = {'chunks': [1, 100], 'programs': [1, 100]}
+    else:
+        calls = 10000
+        sizes = {'chunks': [1, 10, 100], 'programs': [1, 100, 10000]}
+    results = runBenchmarks(calls, sizes, options.repeats, options.names)
+
+    baseline = {}
+    if options.baseline and exists(options.baseline):
+        baseline = load(options.baseline)
+    report(results, baseline)
+    if options.output:
+        save(options.output, results, options.quick)
+    if options.save_baseline:
+        save(options.save_baseline, results, options.quick)
+        return 0
+
+    regressions = compare(results, baseline, options.tolerance)
+    for name, expected, perCall in regressions:
+        print 'REGRESSION %s: %.3f us/call, baseline %.3f' % (
+            name, perCall * 1e6, expected * 1e6)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+from os.path import abspath, dirname, join
+from sys import path
+path.append(join(dirname(__file__), '..'))
+
@@ -0,0 +1,160 @@
+'''
+Compute programs, dispatched over shader storage buffers held in NumPy
+arrays, to move per element work out of Python loops and onto the GPU.
+
+    particles = StorageBuffer(positions, binding=0)
+    step = ComputeProgram(ComputeShader([source]))
+    step.setUniformf('dt', 1 / 60.0)
+    step.dispatchItems(len(positions))
+    particles.read()
+
+read() copies the results straight back into the array the buffer was made
+from, or any other array of the same size, with no intermediate Python
+object. Alternatively, mapped() gives a NumPy view of the buffer's memory
+while it is mapped:
+
+    with particles.mapped() as view:
+        total = view['mass'].sum()
+
+Requires NumPy, and OpenGL 4.3 or GL_ARB_compute_shader, as provided by
+Mesa's llvmpipe.
+'''
+
+from contextlib import contextmanager
+from ctypes import c_int, c_ubyte, c_uint
+
+import numpy
+
+from glbackend import getGl
+from shader import ShaderProgram
+from vertexbuffer import getBufferAddress, VertexBuffer
+
+
+gl = getGl()
+
+
+# from OpenGL 4.3 and 4.4, which pyglet doesn't define
+GL_SHADER_STORAGE_BUFFER = 0x90D2
+GL_COMPUTE_WORK_GROUP_SIZE = 0x8267
+GL_BUFFER_UPDATE_BARRIER_BIT = 0x0200
+GL_SHADER_STORAGE_BARRIER_BIT = 0x2000
+GL_CLIENT_MAPPED_BUFFER_BARRIER_BIT = 0x4000
+
+# makes the results of a dispatch visible to later reads of the buffers it
+# wrote, whether by shaders, glGetBufferSubData or mapping
+DEFAULT_BARRIERS = GL_SHADER_STORAGE_BARRIER_BIT | \
+    GL_BUFFER_UPDATE_BARRIER_BIT | GL_CLIENT_MAPPED_BUFFER_BARRIER_BIT
+
+
+# glDispatchCompute, once looked up
+_dispatchCompute = None
+
+
+def _getDispatchCompute():
+    global _dispatchCompute
+    if _dispatchCompute is None:
+        try:
+            _dispatchCompute = gl.glDispatchCompute
+        except AttributeError:
+            _dispatchCompute = gl.lib.link_GL(
+                'glDispatchCompute', None, [c_uint, c_uint, c_uint])
+    return _dispatchCompute
+
+
+
+class StorageBuffer(VertexBuffer):
+
+    def __init__(self, data, binding, usage=gl.GL_DYNAMIC_COPY):
+        '''
+        Create a shader storage buffer holding a copy of the given NumPy
+        array, bound to the given binding point, as declared in the shader
+        by layout(std430, binding=...).
+        '''
+        self.data = numpy.ascontiguousarray(data)
+        self.binding = binding
+        VertexBuffer.__init__(self, self.data, GL_SHADER_STORAGE_BUFFER, usage)
+        self.bindBase()
+
+
+    def bindBase(self):
+        gl.glBindBufferBase(GL_SHADER_STORAGE_BUFFER, self.binding, self.id)
+
+
+    def read(self, out=None):
+        '''
+        Copy the buffer's contents into out, by default the array the buffer
+        was created from, and return it.
+        '''
+        if out is None:
+            out = self.data
+        address, size = getBufferAddress(out)
+        if size != self.size:
+            raise ValueError('cannot read buffer of %d bytes into %d' %
+                (self.size, size))
+        self.bind()
+        gl.glGetBufferSubData(self.target, 0, size, address)
+        return out
+
+
+    @contextmanager
+    def mapped(self, access=gl.GL_MAP_READ_BIT):
+        '''
+        Map the buffer, yielding a NumPy view of its memory with the dtype
+        and shape of the array it was created from. The view is only valid
+        inside the with block.
+        '''
+        self.bind()
+        address = gl.glMapBufferRange(self.target, 0, self.size, access)
+        try:
+            memory = (c_ubyte * self.size).from_address(address)
+            yield numpy.ctypeslib.as_array(memory).view(
+                self.data.dtype).reshape(self.data.shape)
+        finally:
+            self.bind()
+            gl.glUnmapBuffer(self.target)
+
+
+
+class ComputeProgram(ShaderProgram):
+    '''
+    A program made of a single ComputeShader stage.
+    '''
+
+    def __init__(self, *shaders):
+        ShaderProgram.__init__(self, *shaders)
+        self._workGroupSize = None
+
+
+    def getWorkGroupSize(self):
+        '''
+        Returns the local size declared by the shader, as (x, y, z).
+        '''
+        if self._workGroupSize is None:
+            if self.id is None:
+                self.build()
+            size = (c_int * 3)()
+            gl.glGetProgramiv(self.id, GL_COMPUTE_WORK_GROUP_SIZE, size)
+            self._workGroupSize = tuple(size)
+        return self._workGroupSize
+
+
+    def dispatch(self, x, y=1, z=1, barriers=DEFAULT_BARRIERS):
+        '''
+        Run x by y by z work groups, then wait on a memory barrier so their
+        writes are seen by whatever reads the buffers next.
+        '''
+        self.use()
+        _getDispatchCompute()(x, y, z)
+        if barriers:
+            gl.glMemoryBarrier(barriers)
+
+
+    def dispatchItems(self, x, y=1, z=1, barriers=DEFAULT_BARRIERS):
+        '''
+        Run enough work groups to cover x by y by z invocations. The shader
+        must ignore invocations beyond the end of its data, when the counts
+        aren't multiples of its local size.
+        '''
+        localX, localY, localZ = self.getWorkGroupSize()
+        self.dispatch(-(-x // localX), -(-y // localY), -(-z // localZ),
+            barriers)
@@ -1,11 +1,12 @@
 #!/usr/bin/python
 
 '''
-This source draws a small (20 pixel) dark red square
+This source draws a small (20 pixel) square from a vertex buffer.
 The vertex shader scales and rotates it by 45 degrees to form a 300 pixel
 diamond shape. The fragment shader colors it pale green.
 '''
 
+from array import array
 from sys import exit
 
 from pyglet import app, gl
@@ -15,6 +16,7 @@ from pyglet.window import Window
 import fixpath; fixpath
 
 from shader import FragmentShader, ShaderError, ShaderProgram, VertexShader
+from vertexbuffer import VertexArray, VertexBuffer
 
 
 def read_source(fname):
@@ -35,6 +37,7 @@ def install_shaders(fragment, vertex):
 
     shader = ShaderProgram(fshader, vshader)
     shader.use()
+    return shader
 
 
 def on_resize(width, height):
@@ -46,19 +49,21 @@ def on_resize(width, height):
     return EVENT_HANDLED
 
 
-def draw_red_square():
-    gl.glColor3ub(127, 0, 0)
-    gl.glBegin(gl.GL_QUADS)
-    gl.glVertex2f(-10, -10)
-    gl.glVertex2f(10, -10)
-    gl.glVertex2f(10, 10)
-    gl.glVertex2f(-10, 10)
-    gl.glEnd()
+def create_square(shader):
+    positions = VertexBuffer(array('f', [
+        -10, -10,
+        10, -10,
+        10, 10,
+        -10, 10,
+    ]))
+    square = VertexArray(shader)
+    square.setAttribute('position', positions, 2)
+    return square
 
 
-def on_draw(win):
+def on_draw(win, square):
     win.clear()
-    draw_red_square()
+    square.draw(gl.GL_TRIANGLE_FAN)
 
 
 def main():
@@ -67,12 +72,13 @@ def main():
     try:
 
         try:
-            install_shaders('allGreen.frag', 'zoomRotate.vert')
+            shader = install_shaders('allGreen.frag', 'zoomRotate.vert')
         except ShaderError, e:
             print str(e)
             return 2
+        square = create_square(shader)
         
-        win.on_draw = lambda: on_draw(win)
+        win.on_draw = lambda: on_draw(win, square)
         app.run()
     finally:
         win.close()
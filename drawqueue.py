@@ -0,0 +1,220 @@
+'''
+Collects draws through a frame, then issues them sorted by the state they
+need, so that each program, set of textures and vertex array is bound once
+for all the draws using it, rather than once for each draw.
+
+    queue = DrawQueue()
+    for thing in scene:
+        queue.submit(thing.program, thing.vertexArray,
+            uniforms={'transform': thing.matrix},
+            textures={'diffuse': thing.texture})
+    queue.flush()
+
+Draws are sorted first by layer, which orders passes, such as a sky drawn
+before everything else. Within a layer, opaque draws come first, sorted by
+program, then textures, then vertex array. Transparent draws follow them,
+sorted back to front by depth, since blending depends on their order, and
+draws of equal depth keep the order in which they were submitted.
+
+Textures are bound through textures.getTextureUnits(), to the units of the
+program's sampler uniforms they are named by, which are set to match.
+'''
+
+from glbackend import getGl
+from shader import samplerTypes
+from textures import getSamplerUnit, getTextureUnits
+
+
+gl = getGl()
+
+
+# types of uniforms set with setUniformf, setUniformMatrix and setUniformi.
+# Others, such as non-square matrices and unsigned ints, have no setter
+_floatTypes = frozenset([
+    gl.GL_FLOAT, gl.GL_FLOAT_VEC2, gl.GL_FLOAT_VEC3, gl.GL_FLOAT_VEC4])
+_matrixTypes = frozenset([
+    gl.GL_FLOAT_MAT2, gl.GL_FLOAT_MAT3, gl.GL_FLOAT_MAT4])
+_intTypes = frozenset([
+    gl.GL_INT, gl.GL_INT_VEC2, gl.GL_INT_VEC3, gl.GL_INT_VEC4,
+    gl.GL_BOOL, gl.GL_BOOL_VEC2, gl.GL_BOOL_VEC3, gl.GL_BOOL_VEC4,
+]) | samplerTypes
+
+
+def _setTyped(program, name, uniformType, value):
+    if not hasattr(value, '__len__'):
+        value = (value,)
+    if uniformType in _matrixTypes:
+        program.setUniformMatrix(name, value)
+    elif uniformType in _floatTypes:
+        program.setUniformf(name, *value)
+    elif uniformType in _intTypes:
+        program.setUniformi(name, *value)
+    else:
+        raise ValueError('uniform %s of type 0x%04X cannot be set' %
+            (name, uniformType))
+
+
+def setUniform(program, name, value):
+    '''
+    Set a uniform with the setter for its type, found by reflection, or
+    from the type of the value, for uniforms which aren't reflected. The
+    value of an array uniform is a sequence of its elements, which are set
+    one at a time. Raises ValueError for types with no setter.
+    '''
+    uniform = program.uniforms.get(name)
+    if uniform is not None:
+        if uniform.size == 1:
+            _setTyped(program, name, uniform.type, value)
+            return
+        if not hasattr(value, '__len__') or len(value) > uniform.size:
+            raise ValueError('uniform %s is an array of %d, so takes a '
+                'sequence of up to %d elements' %
+                (name, uniform.size, uniform.size))
+        for index, element in enumerate(value):
+            _setTyped(program, '%s[%d]' % (name, index), uniform.type,
+                element)
+        return
+    if not hasattr(value, '__len__'):
+        value = (value,)
+    if len(value) > 4 or hasattr(value[0], '__len__'):
+        program.setUniformMatrix(name, value)
+    elif any(isinstance(item, float) for item in value):
+        program.setUniformf(name, *value)
+    else:
+        program.setUniformi(name, *value)
+
+
+
+class DrawItem(object):
+
+    def __init__(self, program, geometry, uniforms, textures, mode, first,
+        count, instances, layer, transparent, depth):
+        self.program = program
+        # a vertexbuffer.VertexArray
+        self.geometry = geometry
+        # dict of uniform name to value
+        self.uniforms = uniforms
+        # sorted tuple of (sampler uniform name, (target, texture id)), or
+        # of (texture unit, (target, texture id))
+        self.textures = textures
+        self.mode = mode
+        self.first = first
+        self.count = count
+        # number of instances to draw, or None for a draw without instancing
+        self.instances = instances
+        self.layer = layer
+        self.transparent = transparent
+        self.depth = depth
+
+
+    def getSortKey(self):
+        if self.transparent:
+            # farthest first
+            return (self.layer, 1, -self.depth)
+        return (self.layer, 0,
+            id(self.program), self.textures, id(self.geometry))
+
+
+
+def _getUnit(program, key):
+    if isinstance(key, basestring):
+        return getSamplerUnit(program, key)
+    return key
+
+
+def countSwitches(items):
+    '''
+    Returns the number of program, texture and vertex array changes needed
+    to draw the given items in order.
+    '''
+    programs = textures = geometries = 0
+    program = geometry = None
+    bound = {}
+    for item in items:
+        if item.program is not program:
+            program = item.program
+            programs += 1
+        for key, texture in item.textures:
+            unit = _getUnit(program, key)
+            if unit is not None and bound.get(unit) != texture:
+                bound[unit] = texture
+                textures += 1
+        if item.geometry is not geometry:
+            geometry = item.geometry
+            geometries += 1
+    return programs, textures, geometries
+
+
+
+class DrawQueue(object):
+
+    def __init__(self):
+        self.items = []
+        # stats from the last flush()
+        self.stats = {}
+        # total switches saved by sorting, over all flushes
+        self.switchesSaved = 0
+
+
+    def submit(self, program, geometry, uniforms=None, textures=(),
+        mode=gl.GL_TRIANGLES, first=0, count=None, instances=None, layer=0,
+        transparent=False, depth=0.0):
+        '''
+        Queue a draw of geometry, a VertexArray, with the given program,
+        uniform values and textures. A texture is a (target, texture id)
+        pair, and textures is a dict of sampler uniform name to texture, or
+        a list of textures to bind to units 0, 1 and so on, for programs
+        whose samplers are set to those units. The depth of transparent
+        draws, eg. the distance from the camera, orders them back to front.
+        '''
+        if uniforms is None:
+            uniforms = {}
+        if isinstance(textures, dict):
+            textures = tuple(sorted(textures.iteritems()))
+        else:
+            textures = tuple(enumerate(textures))
+        self.items.append(DrawItem(program, geometry, uniforms,
+            textures, mode, first, count, instances, layer,
+            transparent, depth))
+
+
+    def flush(self):
+        '''
+        Issue the queued draws, in sorted order, and empty the queue.
+        Returns a dict of stats about the draws.
+        '''
+        items, self.items = self.items, []
+        unsorted = countSwitches(items)
+        # a stable sort, so equal keys stay in the order submitted
+        items.sort(key=DrawItem.getSortKey)
+
+        program = geometry = None
+        units = getTextureUnits()
+        for item in items:
+            if item.program is not program:
+                program = item.program
+                program.use()
+            for name, value in item.uniforms.iteritems():
+                setUniform(program, name, value)
+            for key, texture in item.textures:
+                if isinstance(key, basestring):
+                    units.bindProgramTextures(program, {key: texture})
+                else:
+                    units.bindTexture(key, *texture)
+            if item.geometry is not geometry:
+                geometry = item.geometry
+                geometry.bind()
+            geometry.drawBound(
+                item.mode, item.first, item.count, item.instances)
+
+        programs, textures, geometries = countSwitches(items)
+        saved = sum(unsorted) - (programs + textures + geometries)
+        self.switchesSaved += saved
+        self.stats = {
+            'draws': len(items),
+            'programSwitches': programs,
+            'textureSwitches': textures,
+            'geometrySwitches': geometries,
+            'switchesSaved': saved,
+        }
+        return self.stats
@@ -0,0 +1,100 @@
+'''
+Chooses the object through which shader.py, and the modules built on it,
+make their GL calls. Each of those modules calls getGl() when it is first
+imported, so the backend has to be chosen before then, either by calling
+select(), or with the SHADER_GL_BACKEND environment variable, as one of:
+
+    pyglet  pyglet.gl itself. The default.
+
+    lean    pyglet.gl's functions, but called without the errcheck which
+            pyglet attaches to each of them when pyglet.options['debug_gl']
+            is on, as it is by default. That check calls glGetError after
+            every GL call. Each function is resolved once, on first use,
+            and cached.
+
+    fake    a stubgl.StubGl, whose functions do nothing. pyglet is never
+            imported, so no display is needed, eg. for tests and benchmarks.
+
+select() also accepts any object providing the same names as pyglet.gl.
+'''
+
+from ctypes import _CFuncPtr, c_void_p, cast
+import os
+
+
+def _createPyglet():
+    from pyglet import gl
+    return gl
+
+
+def _createLean():
+    from pyglet import gl
+    return LeanGl(gl)
+
+
+def _createFake():
+    from stubgl import StubGl
+    return StubGl()
+
+
+backends = {
+    'pyglet': _createPyglet,
+    'lean': _createLean,
+    'fake': _createFake,
+}
+
+_gl = None
+
+
+def select(backend):
+    '''
+    Choose the backend, by name, or by passing the backend object itself.
+    Returns the backend object.
+    '''
+    global _gl
+    if isinstance(backend, basestring):
+        if backend not in backends:
+            raise ValueError('unknown GL backend %r, expected one of %s' %
+                (backend, ', '.join(sorted(backends))))
+        backend = backends[backend]()
+    _gl = backend
+    return _gl
+
+
+def getGl():
+    if _gl is None:
+        select(os.environ.get('SHADER_GL_BACKEND', 'pyglet'))
+    return _gl
+
+
+def _withoutErrcheck(function):
+    '''
+    Returns a ctypes function which calls the same address as the given one,
+    with the same argument and return types, but no errcheck.
+    '''
+    if not isinstance(function, _CFuncPtr) or function.errcheck is None:
+        # eg. pyglet's placeholders for functions the driver lacks
+        return function
+    address = cast(function, c_void_p).value
+    lean = type(function)(address)
+    lean.restype = function.restype
+    lean.argtypes = function.argtypes
+    return lean
+
+
+
+class LeanGl(object):
+
+    def __init__(self, gl):
+        self._gl = gl
+
+
+    def __getattr__(self, name):
+        value = getattr(self._gl, name)
+        if name.startswith('GL_'):
+            setattr(self, name, value)
+        elif name.startswith('gl') and callable(value):
+            value = _withoutErrcheck(value)
+            setattr(self, name, value)
+        # others, such as current_context, can change, so aren't cached
+        return value
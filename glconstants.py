@@ -0,0 +1,154 @@
+'''
+The values of the GL enums used by this package, so that backends other than
+pyglet, such as stubgl.StubGl, can provide them without importing pyglet.
+'''
+
+# errors
+GL_NO_ERROR = 0x0000
+GL_INVALID_ENUM = 0x0500
+GL_INVALID_VALUE = 0x0501
+GL_INVALID_OPERATION = 0x0502
+GL_OUT_OF_MEMORY = 0x0505
+GL_INVALID_FRAMEBUFFER_OPERATION = 0x0506
+
+# booleans
+GL_FALSE = 0x0000
+GL_TRUE = 0x0001
+
+# data types
+GL_BYTE = 0x1400
+GL_UNSIGNED_BYTE = 0x1401
+GL_SHORT = 0x1402
+GL_UNSIGNED_SHORT = 0x1403
+GL_INT = 0x1404
+GL_UNSIGNED_INT = 0x1405
+GL_FLOAT = 0x1406
+GL_DOUBLE = 0x140A
+
+# primitives
+GL_POINTS = 0x0000
+GL_LINES = 0x0001
+GL_LINE_LOOP = 0x0002
+GL_LINE_STRIP = 0x0003
+GL_TRIANGLES = 0x0004
+GL_TRIANGLE_STRIP = 0x0005
+GL_TRIANGLE_FAN = 0x0006
+
+# buffers
+GL_ARRAY_BUFFER = 0x8892
+GL_ELEMENT_ARRAY_BUFFER = 0x8893
+GL_UNIFORM_BUFFER = 0x8A11
+GL_PIXEL_PACK_BUFFER = 0x88EB
+GL_PIXEL_UNPACK_BUFFER = 0x88EC
+GL_STREAM_DRAW = 0x88E0
+GL_STREAM_READ = 0x88E1
+GL_STATIC_DRAW = 0x88E4
+GL_DYNAMIC_DRAW = 0x88E8
+GL_DYNAMIC_COPY = 0x88EA
+GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT = 0x8A34
+
+# buffer mapping and sync objects
+GL_MAP_READ_BIT = 0x0001
+GL_MAP_WRITE_BIT = 0x0002
+GL_SYNC_GPU_COMMANDS_COMPLETE = 0x9117
+GL_SYNC_FLUSH_COMMANDS_BIT = 0x0001
+GL_ALREADY_SIGNALED = 0x911A
+GL_TIMEOUT_EXPIRED = 0x911B
+GL_CONDITION_SATISFIED = 0x911C
+GL_WAIT_FAILED = 0x911D
+
+# textures
+GL_TEXTURE_2D = 0x0DE1
+GL_TEXTURE0 = 0x84C0
+GL_TEXTURE_MAG_FILTER = 0x2800
+GL_TEXTURE_MIN_FILTER = 0x2801
+GL_TEXTURE_WRAP_S = 0x2802
+GL_TEXTURE_WRAP_T = 0x2803
+GL_LINEAR = 0x2601
+
+# pixel formats
+GL_RED = 0x1903
+GL_RG = 0x8227
+GL_RGB = 0x1907
+GL_RGBA = 0x1908
+GL_RGBA8 = 0x8058
+GL_DEPTH_COMPONENT = 0x1902
+GL_DEPTH24_STENCIL8 = 0x88F0
+GL_PACK_ALIGNMENT = 0x0D05
+
+# framebuffers
+GL_FRAMEBUFFER = 0x8D40
+GL_READ_FRAMEBUFFER = 0x8CA8
+GL_FRAMEBUFFER_BINDING = 0x8CA6
+GL_FRAMEBUFFER_COMPLETE = 0x8CD5
+GL_RENDERBUFFER = 0x8D41
+GL_COLOR_ATTACHMENT0 = 0x8CE0
+GL_DEPTH_STENCIL_ATTACHMENT = 0x821A
+GL_VIEWPORT = 0x0BA2
+
+# shaders and programs
+GL_VERTEX_SHADER = 0x8B31
+GL_FRAGMENT_SHADER = 0x8B30
+GL_GEOMETRY_SHADER = 0x8DD9
+GL_COMPILE_STATUS = 0x8B81
+GL_LINK_STATUS = 0x8B82
+GL_INFO_LOG_LENGTH = 0x8B84
+GL_ACTIVE_ATTRIBUTES = 0x8B89
+GL_ACTIVE_ATTRIBUTE_MAX_LENGTH = 0x8B8A
+GL_ACTIVE_UNIFORMS = 0x8B86
+GL_ACTIVE_UNIFORM_MAX_LENGTH = 0x8B87
+GL_PROGRAM_SEPARABLE = 0x8258
+
+# program pipeline stages
+GL_VERTEX_SHADER_BIT = 0x0001
+GL_FRAGMENT_SHADER_BIT = 0x0002
+GL_GEOMETRY_SHADER_BIT = 0x0004
+
+# uniform types
+GL_FLOAT_VEC2 = 0x8B50
+GL_FLOAT_VEC3 = 0x8B51
+GL_FLOAT_VEC4 = 0x8B52
+GL_INT_VEC2 = 0x8B53
+GL_INT_VEC3 = 0x8B54
+GL_INT_VEC4 = 0x8B55
+GL_BOOL = 0x8B56
+GL_BOOL_VEC2 = 0x8B57
+GL_BOOL_VEC3 = 0x8B58
+GL_BOOL_VEC4 = 0x8B59
+GL_FLOAT_MAT2 = 0x8B5A
+GL_FLOAT_MAT3 = 0x8B5B
+GL_FLOAT_MAT4 = 0x8B5C
+GL_SAMPLER_1D = 0x8B5D
+GL_SAMPLER_2D = 0x8B5E
+GL_SAMPLER_3D = 0x8B5F
+GL_SAMPLER_CUBE = 0x8B60
+GL_SAMPLER_1D_SHADOW = 0x8B61
+GL_SAMPLER_2D_SHADOW = 0x8B62
+GL_SAMPLER_2D_RECT = 0x8B63
+GL_SAMPLER_1D_ARRAY = 0x8DC0
+GL_SAMPLER_2D_ARRAY = 0x8DC1
+GL_SAMPLER_BUFFER = 0x8DC2
+GL_SAMPLER_2D_ARRAY_SHADOW = 0x8DC4
+GL_SAMPLER_CUBE_SHADOW = 0x8DC5
+GL_SAMPLER_2D_MULTISAMPLE = 0x9108
+GL_INT_SAMPLER_2D = 0x8DCA
+GL_INT_SAMPLER_3D = 0x8DCB
+GL_INT_SAMPLER_CUBE = 0x8DCC
+GL_INT_SAMPLER_2D_ARRAY = 0x8DCF
+GL_UNSIGNED_INT_SAMPLER_2D = 0x8DD2
+GL_UNSIGNED_INT_SAMPLER_3D = 0x8DD3
+GL_UNSIGNED_INT_SAMPLER_CUBE = 0x8DD4
+GL_UNSIGNED_INT_SAMPLER_2D_ARRAY = 0x8DD7
+
+# uniform blocks
+GL_ACTIVE_UNIFORM_BLOCKS = 0x8A36
+GL_ACTIVE_UNIFORM_BLOCK_MAX_NAME_LENGTH = 0x8A35
+GL_UNIFORM_BLOCK_DATA_SIZE = 0x8A40
+GL_UNIFORM_BLOCK_ACTIVE_UNIFORMS = 0x8A42
+GL_UNIFORM_BLOCK_ACTIVE_UNIFORM_INDICES = 0x8A43
+GL_UNIFORM_OFFSET = 0x8A3B
+
+# program binaries
+GL_PROGRAM_BINARY_RETRIEVABLE_HINT = 0x8257
+GL_PROGRAM_BINARY_LENGTH = 0x8741
+GL_NUM_PROGRAM_BINARY_FORMATS = 0x87FE
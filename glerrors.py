@@ -0,0 +1,218 @@
+'''
+A single setting for how GL errors are found, with one of these policies:
+
+    CALL        glGetError is called after every GL call, and a GLError
+                naming the call is raised straight away. The slowest, for
+                development.
+
+    FRAME       glGetError is drained once, in endFrame(), so errors cost
+                almost nothing until they happen, but are only attributed
+                to the frame in which they happened. For production.
+
+    CALLBACK    The driver reports errors through a GL_KHR_debug callback,
+                with synchronous output, so that each error is attributed to
+                the frame and to the program in use when it happened. Falls
+                back to FRAME when GL_KHR_debug isn't available.
+
+For FRAME and CALLBACK, shader.py also stops checking query results for
+error codes, and the errors found are raised, or returned, by endFrame().
+
+    errors = ErrorPolicy(FRAME)
+    errors.install(shader, vertexbuffer)
+    while running:
+        draw()
+        errors.endFrame()
+
+pyglet.gl itself calls glGetError after every call while
+pyglet.options['debug_gl'] is on, so FRAME and CALLBACK are only faster with
+that off, or with the 'lean' glbackend.
+'''
+
+from ctypes import c_char_p, c_int, c_uint, c_void_p, CFUNCTYPE
+import sys
+
+import glbackend
+import shader
+from shader import ShaderError
+
+
+CALL = 'call'
+FRAME = 'frame'
+CALLBACK = 'callback'
+policies = (CALL, FRAME, CALLBACK)
+
+
+# from GL_KHR_debug, which pyglet doesn't define
+GL_DEBUG_OUTPUT = 0x92E0
+GL_DEBUG_OUTPUT_SYNCHRONOUS = 0x8242
+GL_DEBUG_TYPE_ERROR = 0x824C
+GL_DEBUG_SEVERITY_HIGH = 0x9146
+
+if sys.platform == 'win32':
+    from ctypes import WINFUNCTYPE
+    GLDEBUGPROC = WINFUNCTYPE(
+        None, c_uint, c_uint, c_uint, c_uint, c_int, c_char_p, c_void_p)
+else:
+    GLDEBUGPROC = CFUNCTYPE(
+        None, c_uint, c_uint, c_uint, c_uint, c_int, c_char_p, c_void_p)
+
+
+errorNames = {
+    0x0500: 'GL_INVALID_ENUM',
+    0x0501: 'GL_INVALID_VALUE',
+    0x0502: 'GL_INVALID_OPERATION',
+    0x0503: 'GL_STACK_OVERFLOW',
+    0x0504: 'GL_STACK_UNDERFLOW',
+    0x0505: 'GL_OUT_OF_MEMORY',
+    0x0506: 'GL_INVALID_FRAMEBUFFER_OPERATION',
+}
+
+# glGetError can keep returning errors when there is no context, so draining
+# it stops after this many
+MAX_ERRORS = 32
+
+
+class GLError(ShaderError): pass
+
+
+def getErrorName(error):
+    return errorNames.get(error, '0x%04X' % (error,))
+
+
+
+class ErrorReport(object):
+
+    def __init__(self, frame, program, message):
+        self.frame = frame
+        # id of the program in use, or None if unknown
+        self.program = program
+        self.message = message
+
+
+    def __str__(self):
+        if self.program is None:
+            return 'frame %d: %s' % (self.frame, self.message)
+        return 'frame %d, program %s: %s' % (
+            self.frame, self.program, self.message)
+
+
+
+class CheckingGl(object):
+    '''
+    Wraps a GL backend so that each GL function called is followed by a call
+    to glGetError, raising GLError if it returns an error.
+    '''
+
+    def __init__(self, target):
+        self.target = target
+
+
+    def __getattr__(self, name):
+        value = getattr(self.target, name)
+        if not name.startswith('gl') or not callable(value) or \
+            name == 'glGetError':
+            return value
+        getError = self.target.glGetError
+        def checked(*args):
+            result = value(*args)
+            error = getError()
+            if error:
+                raise GLError('%s from %s%r' %
+                    (getErrorName(error), name, args))
+            return result
+        checked.__name__ = name
+        # cache it, so __getattr__ is only called once per function
+        setattr(self, name, checked)
+        return checked
+
+
+
+class ErrorPolicy(object):
+
+    def __init__(self, policy=FRAME, raiseErrors=True, gl=None):
+        if policy not in policies:
+            raise ValueError('unknown error policy %r, expected one of %s' %
+                (policy, ', '.join(policies)))
+        if gl is None:
+            gl = glbackend.getGl()
+        self.gl = gl
+        self.policy = policy
+        # if false, endFrame() returns errors instead of raising them
+        self.raiseErrors = raiseErrors
+        self.frame = 0
+        self.pending = []
+        self._installed = []
+        self._callback = None
+
+
+    def _isDebugSupported(self):
+        return self.gl.gl_info.have_extension('GL_KHR_debug')
+
+
+    def install(self, *modules):
+        '''
+        Apply the policy to the given modules, such as shader and
+        vertexbuffer, which must include shader.
+        '''
+        if self.policy == CALLBACK and not self._isDebugSupported():
+            self.policy = FRAME
+        for module in modules:
+            self._installed.append((module, module.gl))
+            if self.policy == CALL:
+                module.gl = CheckingGl(module.gl)
+        shader.checkQueries = self.policy == CALL
+        if self.policy == CALLBACK:
+            self._enableCallback()
+
+
+    def uninstall(self):
+        if self._callback is not None:
+            self.gl.glDisable(GL_DEBUG_OUTPUT)
+            self._callback = None
+        while self._installed:
+            module, original = self._installed.pop()
+            module.gl = original
+        shader.checkQueries = True
+
+
+    def _enableCallback(self):
+        setCallback = self.gl.lib.link_GL(
+            'glDebugMessageCallback', None, [GLDEBUGPROC, c_void_p])
+        # kept, since GL only holds a pointer to it
+        self._callback = GLDEBUGPROC(self._onDebugMessage)
+        setCallback(self._callback, None)
+        self.gl.glEnable(GL_DEBUG_OUTPUT)
+        # so the callback is made during the call which caused the error
+        self.gl.glEnable(GL_DEBUG_OUTPUT_SYNCHRONOUS)
+
+
+    def _onDebugMessage(self, source, type, id, severity, length, message,
+        userParam):
+        # exceptions can't be raised through GL, so they wait for endFrame
+        if type == GL_DEBUG_TYPE_ERROR or severity == GL_DEBUG_SEVERITY_HIGH:
+            self.pending.append(ErrorReport(
+                self.frame, shader.getCurrentProgram(), message))
+
+
+    def _drainErrors(self):
+        for _ in xrange(MAX_ERRORS):
+            error = self.gl.glGetError()
+            if not error:
+                break
+            self.pending.append(
+                ErrorReport(self.frame, None, getErrorName(error)))
+
+
+    def endFrame(self):
+        '''
+        Call once per frame, after drawing. Raises GLError describing the
+        errors found during the frame, or if raiseErrors is false, returns a
+        list of ErrorReport for them.
+        '''
+        if self.policy == FRAME:
+            self._drainErrors()
+        errors, self.pending = self.pending, []
+        self.frame += 1
+        if errors and self.raiseErrors:
+            raise GLError('\n'.join(str(error) for error in errors))
+        return errors
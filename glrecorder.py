@@ -0,0 +1,217 @@
+'''
+Records the GL calls made by shader.py and friends, frame by frame, so that
+tests can put budgets on them, eg. at most 3 glUseProgram calls per frame,
+and catch regressions without needing a GPU.
+
+A RecordingGl stands in for pyglet.gl in the modules it is installed in,
+logging each GL function called, with its arguments, before passing the
+call on to its target. The target is a StubGl by default, so nothing is
+drawn, but it can be pyglet.gl itself, to record a real application.
+
+    recorder = RecordingGl()
+    recorder.install(shader, vertexbuffer)
+    with recorder.frame() as frame:
+        scene.draw()
+    frame.assertBudget(glUseProgram=3, stateChanges=20, redundant=0)
+    recorder.uninstall()
+
+Calls made outside of a frame(), eg. while loading, are recorded in
+recorder.setup.
+'''
+
+from contextlib import contextmanager
+from ctypes import Array
+
+from stubgl import StubGl
+
+
+class BudgetError(AssertionError): pass
+
+
+# prefixes of the GL functions which change state, rather than query it,
+# create objects, or draw
+stateChangePrefixes = (
+    'glActiveTexture', 'glBind', 'glBlend', 'glCullFace', 'glDepth',
+    'glDisable', 'glEnable', 'glPolygonMode', 'glUniform', 'glUseProgram',
+    'glVertexAttribPointer', 'glViewport',
+)
+
+
+def isStateChange(name):
+    return name.startswith(stateChangePrefixes)
+
+
+def _snapshot(arg):
+    # copy arrays, such as uniform matrices, so the record isn't changed when
+    # the caller reuses them, and so they compare by value
+    if isinstance(arg, Array):
+        return tuple(arg)
+    return arg
+
+
+class Frame(object):
+
+    def __init__(self, number):
+        self.number = number
+        # list of (function name, args)
+        self.calls = []
+
+
+    def getCount(self, name=None):
+        if name is None:
+            return len(self.calls)
+        return sum(1 for called, _ in self.calls if called == name)
+
+
+    def getCounts(self):
+        counts = {}
+        for name, _ in self.calls:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+    def getStateChanges(self):
+        return sum(1 for name, _ in self.calls if isStateChange(name))
+
+
+    def _getStateKey(self, name, args, program, texture):
+        '''
+        Returns the piece of GL state which a call sets, and the value it is
+        set to, or None for calls which aren't tracked.
+        '''
+        if name == 'glUseProgram':
+            return name, args
+        if name.startswith('glUniform'):
+            # uniforms belong to the program in use
+            return ('glUniform', program, args[0]), (name, args[1:])
+        if name in ('glBindBuffer', 'glBindBufferBase', 'glBindFramebuffer',
+            'glBindSampler', 'glBindVertexArray'):
+            # the last argument is the id bound, the others say where to
+            return (name,) + args[:-1], args[-1]
+        if name == 'glBindTexture':
+            # textures belong to the active texture unit
+            return (name, texture, args[0]), args[1]
+        if name == 'glActiveTexture':
+            return name, args
+        if name in ('glEnable', 'glDisable'):
+            return ('enabled', args[0]), name
+        return None
+
+
+    def getRedundant(self):
+        '''
+        Returns a dict of the number of calls to each function which set
+        state to the value it already had, eg. glUseProgram with the id of
+        the program already in use. State from before the frame is unknown,
+        so the first call setting each piece of state isn't counted.
+        '''
+        state = {}
+        redundant = {}
+        program = None
+        texture = None
+        for name, args in self.calls:
+            keyValue = self._getStateKey(name, args, program, texture)
+            if keyValue is None:
+                continue
+            key, value = keyValue
+            if key in state and state[key] == value:
+                redundant[name] = redundant.get(name, 0) + 1
+            state[key] = value
+            if name == 'glUseProgram':
+                program = args[0]
+            elif name == 'glActiveTexture':
+                texture = args[0]
+        return redundant
+
+
+    def summary(self):
+        lines = ['frame %s: %d calls, %d state changes' %
+            (self.number, self.getCount(), self.getStateChanges())]
+        counts = self.getCounts()
+        redundant = self.getRedundant()
+        for name in sorted(counts):
+            line = '  %-32s %6d' % (name, counts[name])
+            if name in redundant:
+                line += ' (%d redundant)' % (redundant[name],)
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+    def assertBudget(self, total=None, stateChanges=None, redundant=None,
+        **functions):
+        '''
+        Raise BudgetError if this frame made more than the given number of
+        GL calls in total, state changes, redundant calls, or calls to each
+        function given as a keyword argument, eg. glUseProgram=3.
+        '''
+        overruns = []
+        def check(label, count, budget):
+            if budget is not None and count > budget:
+                overruns.append('%s: %d, budget %d' % (label, count, budget))
+        check('total calls', self.getCount(), total)
+        check('state changes', self.getStateChanges(), stateChanges)
+        check('redundant calls', sum(self.getRedundant().values()), redundant)
+        for name, budget in sorted(functions.iteritems()):
+            check(name, self.getCount(name), budget)
+        if overruns:
+            raise BudgetError('GL call budget exceeded in frame %s:\n  %s\n%s'
+                % (self.number, '\n  '.join(overruns), self.summary()))
+
+
+
+class RecordingGl(object):
+
+    def __init__(self, target=None, maxFrames=None):
+        if target is None:
+            target = StubGl()
+        self.target = target
+        # the oldest frames are dropped once there are more than this
+        self.maxFrames = maxFrames
+        self.setup = Frame(None)
+        self.current = self.setup
+        self.frames = []
+        self.frameCount = 0
+        self._installed = []
+
+
+    def __getattr__(self, name):
+        value = getattr(self.target, name)
+        if not name.startswith('gl') or not callable(value):
+            # constants, or attributes like current_context and gl_info
+            return value
+        def record(*args):
+            self.current.calls.append((name, tuple(map(_snapshot, args))))
+            return value(*args)
+        record.__name__ = name
+        # cache it, so __getattr__ is only called once per function
+        setattr(self, name, record)
+        return record
+
+
+    @contextmanager
+    def frame(self):
+        frame = Frame(self.frameCount)
+        self.frameCount += 1
+        previous, self.current = self.current, frame
+        try:
+            yield frame
+        finally:
+            self.current = previous
+            self.frames.append(frame)
+            if self.maxFrames is not None and len(self.frames) > self.maxFrames:
+                del self.frames[0]
+
+
+    def install(self, *modules):
+        '''
+        Replace the gl of each of the given modules with this recorder.
+        '''
+        for module in modules:
+            self._installed.append((module, module.gl))
+            module.gl = self
+
+
+    def uninstall(self):
+        while self._installed:
+            module, original = self._installed.pop()
+            module.gl = original
@@ -0,0 +1,107 @@
+'''
+Reloads shaders while an application runs, whenever their files are edited.
+
+Shaders are created through a Preprocessor, whose dependency graph tells
+which shaders a changed file affects, so #included files are watched too.
+Files are polled, by calling poll() every so often, say from a
+pyglet.clock.schedule_interval callback, which costs one stat per file.
+
+Only the stages whose expanded sources changed are recompiled, and only the
+watched programs which use those stages are relinked, keeping their uniform
+values. A stage which fails to compile, or a program which fails to link, is
+left as it was, so the last working program stays bound, and the error is
+kept in 'errors' instead of being raised into the render loop.
+'''
+
+from preprocess import Preprocessor
+from shader import ShaderError
+
+
+class HotReloader(object):
+
+    def __init__(self, preprocessor=None):
+        if preprocessor is None:
+            preprocessor = Preprocessor()
+        self.preprocessor = preprocessor
+        self.programs = []
+        # messages for the failures during the most recent poll()
+        self.errors = []
+        self.compiles = 0
+        self.links = 0
+
+
+    def createShader(self, shaderClass, fname):
+        shader = self.preprocessor.createShader(shaderClass, fname)
+        # relinking after a reload reuses the unchanged shaders
+        shader.keepAfterLink = True
+        return shader
+
+
+    def watch(self, program):
+        if program not in self.programs:
+            self.programs.append(program)
+
+
+    def unwatch(self, program):
+        if program in self.programs:
+            self.programs.remove(program)
+
+
+    def _addError(self, error):
+        self.errors.append(self.preprocessor.translateLog(str(error)))
+
+
+    def _compile(self, updates):
+        candidates = []
+        for shader, sources in updates:
+            candidate = shader.__class__(sources)
+            candidate.startCompile()
+            candidates.append((shader, candidate))
+        replacements = {}
+        for shader, candidate in candidates:
+            self.compiles += 1
+            try:
+                candidate.finishCompile()
+            except ShaderError, e:
+                self._addError(e)
+                continue
+            replacements[shader] = candidate
+        return replacements
+
+
+    def _relink(self, replacements):
+        relinked = []
+        for program in self.programs:
+            stages = dict(
+                (shader, replacements[shader])
+                for shader in program.shaders
+                if shader in replacements
+            )
+            if not stages:
+                continue
+            self.links += 1
+            try:
+                program.relink(stages)
+            except ShaderError, e:
+                self._addError(e)
+                continue
+            relinked.append(program)
+        return relinked
+
+
+    def poll(self):
+        '''
+        Reload the shaders whose files have changed. Returns the list of
+        watched programs which were relinked.
+        '''
+        self.errors = []
+        try:
+            updates = self.preprocessor.getUpdates()
+        except (IOError, ShaderError), e:
+            self._addError(e)
+            return []
+        replacements = self._compile(updates)
+        relinked = self._relink(replacements)
+        for shader, candidate in replacements.iteritems():
+            shader.replaceWith(candidate)
+        return relinked
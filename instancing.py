@@ -0,0 +1,132 @@
+'''
+Per instance attributes held in a NumPy structured array, with one element
+per instance, drawn with a single glDrawArraysInstanced or
+glDrawElementsInstanced call however many instances there are.
+
+    offsets = InstanceBuffer(numpy.zeros(1000,
+        dtype=[('offset', numpy.float32, 2), ('color', numpy.uint8, 4)]))
+    offsets.attach(square)
+    offsets[10:20] = moved
+    offsets.upload()
+    square.drawInstanced(gl.GL_TRIANGLE_FAN, len(offsets))
+
+Each field of the array becomes an attribute of the same name. Fields of
+shape (columns, rows), such as (4, 4) for a mat4, are matrices, fed to
+consecutive attribute locations one column at a time. Only the range of
+instances changed since the last upload is sent to GL, with one
+glBufferSubData, so the Python cost of a frame doesn't grow with the number
+of instances.
+
+Requires NumPy.
+'''
+
+import numpy
+
+from glbackend import getGl
+from vertexbuffer import VertexBuffer
+
+
+gl = getGl()
+
+
+glTypes = {
+    numpy.dtype(numpy.int8): gl.GL_BYTE,
+    numpy.dtype(numpy.uint8): gl.GL_UNSIGNED_BYTE,
+    numpy.dtype(numpy.int16): gl.GL_SHORT,
+    numpy.dtype(numpy.uint16): gl.GL_UNSIGNED_SHORT,
+    numpy.dtype(numpy.int32): gl.GL_INT,
+    numpy.dtype(numpy.uint32): gl.GL_UNSIGNED_INT,
+    numpy.dtype(numpy.float32): gl.GL_FLOAT,
+    numpy.dtype(numpy.float64): gl.GL_DOUBLE,
+}
+
+
+
+class InstanceBuffer(VertexBuffer):
+
+    def __init__(self, data, usage=gl.GL_DYNAMIC_DRAW):
+        if data.dtype.names is None:
+            raise ValueError('instance data must be a structured array')
+        self.data = numpy.ascontiguousarray(data)
+        VertexBuffer.__init__(self, self.data, usage=usage)
+        self.uploads = 0
+        self.bytesUploaded = 0
+        # (start, end) range of instances changed since the last upload
+        self._dirty = None
+
+
+    def __len__(self):
+        return len(self.data)
+
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+
+    def __setitem__(self, key, value):
+        '''
+        Set instances by index, slice or array of indices, or a whole field
+        by name, marking them to be uploaded.
+        '''
+        self.data[key] = value
+        if isinstance(key, basestring):
+            self.markDirty()
+        elif isinstance(key, slice):
+            start, end, step = key.indices(len(self.data))
+            if step < 0:
+                start, end = end + 1, start + 1
+            if start < end:
+                self.markDirty(start, end)
+        elif numpy.isscalar(key):
+            if key < 0:
+                key += len(self.data)
+            self.markDirty(key, key + 1)
+        else:
+            indices = numpy.arange(len(self.data))[key]
+            if indices.size:
+                self.markDirty(indices.min(), indices.max() + 1)
+
+
+    def markDirty(self, start=0, end=None):
+        '''
+        Mark the instances from start to end to be uploaded, after writing
+        to self.data directly.
+        '''
+        if end is None:
+            end = len(self.data)
+        if self._dirty is None:
+            self._dirty = (start, end)
+        else:
+            self._dirty = (min(self._dirty[0], start), max(self._dirty[1], end))
+
+
+    def upload(self):
+        if self._dirty is None:
+            return
+        start, end = self._dirty
+        itemSize = self.data.dtype.itemsize
+        self.setSubData(start * itemSize, self.data[start:end])
+        self.uploads += 1
+        self.bytesUploaded += (end - start) * itemSize
+        self._dirty = None
+
+
+    def attach(self, vertexArray, divisor=1, normalized=()):
+        '''
+        Source an attribute of the given VertexArray from each field of the
+        instance data, advancing once every divisor instances. Integer
+        fields named in normalized are mapped to the range 0 to 1, or -1 to
+        1 if signed.
+        '''
+        itemSize = self.data.dtype.itemsize
+        for name in self.data.dtype.names:
+            fieldType, offset = self.data.dtype.fields[name][:2]
+            base, shape = fieldType.base, fieldType.shape
+            if base not in glTypes:
+                raise ValueError('unsupported type %s of instance field %s' %
+                    (base, name))
+            columns = shape[0] if len(shape) == 2 else 1
+            vertexArray.setAttribute(name, self,
+                fieldType.itemsize // base.itemsize, glTypes[base],
+                normalized=name in normalized, stride=itemSize, offset=offset,
+                divisor=divisor, columns=columns)
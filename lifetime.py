@@ -0,0 +1,186 @@
+'''
+Keeps a record of the GL objects alive in each GL context, such as shaders,
+programs, buffers and vertex arrays, along with a weak reference to the
+Python object owning each one, so that they can all be deleted at once when
+the context is torn down:
+
+    lifetime.releaseContext()
+    window.close()
+
+With leak tracking on, where each object was created is recorded too, so
+objects which outlive their use can be found:
+
+    lifetime.trackLeaks = True
+    ...
+    print lifetime.report()
+
+Owners report their objects with created() and deleted(). Each owner must
+have a delete() method which deletes its GL object. An owner collected
+without being deleted leaves its object alive, to be reported, and deleted
+by releaseContext().
+'''
+
+from ctypes import byref, c_uint
+import traceback
+from weakref import ref, WeakKeyDictionary
+
+from glbackend import getGl
+
+
+gl = getGl()
+
+
+# if true, the stack is recorded as each object is created, for report()
+trackLeaks = False
+
+# number of stack frames recorded for each object
+STACK_DEPTH = 8
+
+
+# (kind, id): LiveObject, for each GL context
+_live = WeakKeyDictionary()
+# the same, for objects created without a current context
+_liveWithoutContext = {}
+
+# kind: function deleting objects of that kind, for those whose owners have
+# been collected
+_deleteFunctions = {
+    'buffer': 'glDeleteBuffers',
+    'framebuffer': 'glDeleteFramebuffers',
+    'pipeline': 'glDeleteProgramPipelines',
+    'renderbuffer': 'glDeleteRenderbuffers',
+    'sampler': 'glDeleteSamplers',
+    'texture': 'glDeleteTextures',
+    'vertex array': 'glDeleteVertexArrays',
+}
+
+
+class LiveObject(object):
+
+    def __init__(self, kind, id, owner, stack):
+        # eg. 'shader', 'program', 'buffer'
+        self.kind = kind
+        self.id = id
+        # a weak reference, so the owner, and eg. the data or sources it
+        # holds, can be freed without deleting it
+        self.owner = ref(owner)
+        # tuple of (filename, line, function, text), innermost last, or None
+        self.stack = stack
+
+
+    def getWhere(self):
+        '''
+        Returns where the object was created, as 'file:line in function',
+        or '' if it wasn't recorded.
+        '''
+        if not self.stack:
+            return ''
+        filename, line, function, _ = self.stack[-1]
+        return '%s:%d in %s' % (filename, line, function)
+
+
+    def delete(self):
+        '''
+        Delete the object through its owner, or directly if the owner has
+        been collected.
+        '''
+        owner = self.owner()
+        if owner is not None:
+            owner.delete()
+        elif self.kind == 'shader':
+            gl.glDeleteShader(self.id)
+        elif self.kind == 'program':
+            gl.glDeleteProgram(self.id)
+        else:
+            getattr(gl, _deleteFunctions[self.kind])(
+                1, byref(c_uint(self.id)))
+
+
+    def __repr__(self):
+        return '<%s %s %s>' % (self.kind, self.id, self.getWhere())
+
+
+
+def _getLive(context):
+    if context is None:
+        return _liveWithoutContext
+    live = _live.get(context)
+    if live is None:
+        live = _live[context] = {}
+    return live
+
+
+def created(kind, id, owner):
+    stack = None
+    if trackLeaks:
+        # leave out this function's own frame
+        stack = tuple(traceback.extract_stack(limit=STACK_DEPTH + 1)[:-1])
+    _getLive(gl.current_context)[(kind, id)] = \
+        LiveObject(kind, id, owner, stack)
+
+
+def deleted(kind, id):
+    key = (kind, id)
+    live = _getLive(gl.current_context)
+    if live.pop(key, None) is not None:
+        return
+    # eg. deleted while a context sharing its objects is current
+    for live in _live.values() + [_liveWithoutContext]:
+        if live.pop(key, None) is not None:
+            return
+
+
+def getLiveObjects(context=None):
+    '''
+    Returns a list of the LiveObjects of the given context, by default the
+    current one.
+    '''
+    if context is None:
+        context = gl.current_context
+    return _getLive(context).values()
+
+
+def getCounts(context=None):
+    '''
+    Returns a dict of the number of objects alive of each kind.
+    '''
+    counts = {}
+    for obj in getLiveObjects(context):
+        counts[obj.kind] = counts.get(obj.kind, 0) + 1
+    return counts
+
+
+def report(context=None):
+    '''
+    Returns a description of the live objects, counted by kind, and then by
+    where they were created, if trackLeaks was on.
+    '''
+    objects = getLiveObjects(context)
+    lines = []
+    for kind, count in sorted(getCounts(context).iteritems()):
+        lines.append('%d %s%s' % (count, kind, '' if count == 1 else 's'))
+        places = {}
+        for obj in objects:
+            if obj.kind == kind:
+                where = obj.getWhere() or 'unknown'
+                places[where] = places.get(where, 0) + 1
+        for where, placeCount in sorted(places.iteritems()):
+            lines.append('    %d from %s' % (placeCount, where))
+    return '\n'.join(lines)
+
+
+def releaseContext(context=None):
+    '''
+    Delete every live object of the given context, by default the current
+    one, which must be current. Returns the number deleted.
+    '''
+    if context is None:
+        context = gl.current_context
+    live = _getLive(context)
+    objects = live.values()
+    for obj in objects:
+        # deleting one owner can delete others, eg. a program its shaders
+        if live.get((obj.kind, obj.id)) is obj:
+            obj.delete()
+    live.clear()
+    return len(objects)
@@ -0,0 +1,248 @@
+'''
+Separable programs combined in program pipelines, using
+GL_ARB_separate_shader_objects, so that with many vertex shaders and many
+fragment shaders, each shader is compiled and linked once, on its own,
+rather than linking a program for every combination used.
+
+    pipelines = PipelineCache()
+    lit = pipelines.get(terrainVertex, litFragment)
+    lit.setUniformMatrix('transform', matrix)
+    lit.use()
+
+Each stage is linked into a separable StageProgram, shared by all the
+pipelines using it. A ProgramPipeline can be used in most places a
+ShaderProgram can, such as DrawQueue and VertexArray, and swapping one of
+its stages, with setStage(), rebinds that stage without linking anything.
+Uniforms are set on each stage program which has them, with
+glProgramUniform*, so setting them doesn't need the pipeline bound.
+'''
+
+from ctypes import byref, c_uint
+from weakref import WeakKeyDictionary
+
+from glbackend import getGl
+import lifetime
+import shader
+from shader import assignSamplerUnits, ShaderProgram
+
+
+gl = getGl()
+
+
+stageBits = {
+    gl.GL_VERTEX_SHADER: gl.GL_VERTEX_SHADER_BIT,
+    gl.GL_FRAGMENT_SHADER: gl.GL_FRAGMENT_SHADER_BIT,
+    gl.GL_GEOMETRY_SHADER: gl.GL_GEOMETRY_SHADER_BIT,
+}
+
+
+# id of the pipeline most recently bound in each GL context
+_currentPipeline = WeakKeyDictionary()
+
+
+def getCurrentPipeline():
+    context = gl.current_context
+    if context is None:
+        return None
+    return _currentPipeline.get(context)
+
+
+def _setCurrentPipeline(pipelineId):
+    context = gl.current_context
+    if context is not None:
+        _currentPipeline[context] = pipelineId
+
+
+
+class StageProgram(ShaderProgram):
+    '''
+    A separable program linked from a single shader.
+    '''
+
+    separable = True
+
+    def __init__(self, stage):
+        ShaderProgram.__init__(self, stage)
+        self.stage = stage
+        self.stageBit = stageBits[stage.type]
+
+
+    def _upload(self, location, values, upload):
+        upload(location, values, self.id)
+
+
+
+class ProgramPipeline(object):
+
+    def __init__(self, stagePrograms):
+        # stage bit: StageProgram
+        self.stages = {}
+        for program in stagePrograms:
+            self.stages[program.stageBit] = program
+        self.id = None
+        self.attributes = {}
+        self.uniforms = {}
+        self.samplerUnits = {}
+
+
+    def getName(self):
+        return ' + '.join(
+            self.stages[bit].getName() for bit in sorted(self.stages))
+
+
+    def build(self):
+        '''
+        Build any stage programs not yet built, and create the pipeline.
+        '''
+        unbuilt = [program for program in self.stages.itervalues()
+            if program.id is None]
+        # issue all the compiles and links before waiting for any
+        for program in unbuilt:
+            program.startBuild()
+        for program in unbuilt:
+            program.finishBuild()
+        if self.id is None:
+            pipelineId = c_uint(0)
+            gl.glGenProgramPipelines(1, byref(pipelineId))
+            self.id = pipelineId.value
+            lifetime.created('pipeline', self.id, self)
+            for bit, program in self.stages.iteritems():
+                gl.glUseProgramStages(self.id, bit, program.id)
+        self._reflect()
+        return ''
+
+
+    def _reflect(self):
+        vertex = self.stages.get(gl.GL_VERTEX_SHADER_BIT)
+        self.attributes = vertex.attributes if vertex is not None else {}
+        self.uniforms = {}
+        for program in self.stages.itervalues():
+            self.uniforms.update(program.uniforms)
+        # units are assigned across all stages, so they don't collide
+        self.samplerUnits = assignSamplerUnits(self.uniforms)
+
+
+    def setStage(self, program):
+        '''
+        Use the given StageProgram for its stage, in place of the current
+        one, without linking.
+        '''
+        self.stages[program.stageBit] = program
+        if self.id is not None:
+            if program.id is None:
+                program.build()
+            gl.glUseProgramStages(self.id, program.stageBit, program.id)
+            self._reflect()
+
+
+    def bind(self):
+        # a program in use takes precedence over the bound pipeline
+        if shader.getCurrentProgram() != 0:
+            shader.useFixedFunction()
+        if getCurrentPipeline() != self.id:
+            gl.glBindProgramPipeline(self.id)
+            _setCurrentPipeline(self.id)
+
+
+    def use(self):
+        if self.id is None:
+            self.build()
+        self.bind()
+
+
+    def _setUniform(self, setter, name, *args):
+        if self.id is None:
+            self.build()
+        # elements of array uniforms are reflected by the array's name
+        baseName = name.split('[')[0]
+        for program in self.stages.itervalues():
+            if name in program.uniforms or baseName in program.uniforms:
+                getattr(program, setter)(name, *args)
+
+
+    def setUniformf(self, name, *values):
+        self._setUniform('setUniformf', name, *values)
+
+
+    def setUniformi(self, name, *values):
+        self._setUniform('setUniformi', name, *values)
+
+
+    def setUniformMatrix(self, name, values, transpose=False):
+        self._setUniform('setUniformMatrix', name, values, transpose)
+
+
+    def delete(self):
+        '''
+        Delete the pipeline object. Its stage programs are left alone, since
+        other pipelines may use them.
+        '''
+        if self.id is not None:
+            gl.glDeleteProgramPipelines(1, byref(c_uint(self.id)))
+            lifetime.deleted('pipeline', self.id)
+            if getCurrentPipeline() == self.id:
+                _setCurrentPipeline(None)
+            self.id = None
+
+
+
+class PipelineCache(object):
+    '''
+    Creates a StageProgram for each distinct shader, and a ProgramPipeline
+    for each distinct set of stages, reusing them when asked again.
+    '''
+
+    def __init__(self):
+        # (shader type, source hash): StageProgram
+        self.stagePrograms = {}
+        # frozenset of stage program keys: ProgramPipeline
+        self.pipelines = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def _getKey(self, stage):
+        return (stage.type, stage.getSourceHash())
+
+
+    def getStageProgram(self, stage):
+        key = self._getKey(stage)
+        program = self.stagePrograms.get(key)
+        if program is None:
+            program = StageProgram(stage)
+            self.stagePrograms[key] = program
+        return program
+
+
+    def get(self, *stages):
+        '''
+        Returns the pipeline combining the given shaders, one per stage.
+        '''
+        key = frozenset(self._getKey(stage) for stage in stages)
+        pipeline = self.pipelines.get(key)
+        if pipeline is not None:
+            self.hits += 1
+            return pipeline
+        self.misses += 1
+        pipeline = ProgramPipeline(
+            [self.getStageProgram(stage) for stage in stages])
+        self.pipelines[key] = pipeline
+        return pipeline
+
+
+    def getStats(self):
+        return {
+            'stagePrograms': len(self.stagePrograms),
+            'pipelines': len(self.pipelines),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+    def delete(self):
+        for pipeline in self.pipelines.itervalues():
+            pipeline.delete()
+        for program in self.stagePrograms.itervalues():
+            program.delete()
+        self.pipelines = {}
+        self.stagePrograms = {}
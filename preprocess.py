@@ -0,0 +1,276 @@
+'''
+Expands #include "file" directives in GLSL sources.
+
+Each file's expansion is memoized, and is only redone when the file, or a
+file it includes, has changed, which is detected by mtime and then confirmed
+by a hash of the contents. A reverse dependency graph records which files
+include which, so that update() re-expands and recompiles only the shaders
+affected by a change.
+
+The expanded source contains #line directives, so compile errors refer to
+the original line numbers. GLSL #line directives can only name source
+strings by number, so each file is given a number, and translateLog()
+converts the numbers in a compile log back to filenames. Line numbers follow
+GLSL 3.30 and later, in which '#line n' makes the next line be line n.
+'''
+
+from hashlib import sha1
+import os
+import re
+
+from shader import ShaderError
+
+
+class PreprocessError(ShaderError): pass
+
+
+def findVersionLine(lines):
+    '''
+    Returns the index of the #version line, if only blank lines and comments
+    come before it, or None.
+    '''
+    inComment = False
+    for index, line in enumerate(lines):
+        text = line.strip()
+        while text:
+            if inComment:
+                end = text.find('*/')
+                if end == -1:
+                    text = ''
+                else:
+                    inComment = False
+                    text = text[end + 2:].lstrip()
+            elif text.startswith('/*'):
+                inComment = True
+                text = text[2:]
+            elif text.startswith('//'):
+                text = ''
+            else:
+                break
+        if not text:
+            continue
+        if _versionPattern.match(text):
+            return index
+        return None
+    return None
+
+
+_includePattern = re.compile(r'^\s*#\s*include\s+["<]([^">]+)[">]')
+
+_versionPattern = re.compile(r'^\s*#\s*version\b')
+
+# matches the start of error lines from common drivers, eg. '0(12)' or '0:12'
+_logPattern = re.compile(r'^([^\d\n]*)(\d+)([:(])(\d+)', re.MULTILINE)
+
+
+class _File(object):
+
+    def __init__(self, path, number):
+        self.path = path
+        self.number = number
+        self.mtime = None
+        self.hash = None
+        self.text = None
+        self.expanded = None
+        self.includes = []
+
+
+
+class Preprocessor(object):
+
+    def __init__(self, searchPath=()):
+        self.searchPath = list(searchPath)
+        # _File for each file read, keyed by absolute path
+        self.files = {}
+        # paths of the files, indexed by the numbers used in #line
+        self.paths = []
+        # the set of paths that directly include each path
+        self.dependents = {}
+        # the root file of each shader created by createShader
+        self.shaders = {}
+        self.expansions = 0
+
+
+    def _resolve(self, name, includedFrom):
+        directories = self.searchPath
+        if includedFrom is not None:
+            directories = [os.path.dirname(includedFrom)] + directories
+        for directory in directories:
+            path = os.path.abspath(os.path.join(directory, name))
+            if os.path.isfile(path):
+                return path
+        raise PreprocessError('cannot find #include "%s" from %s' %
+            (name, includedFrom))
+
+
+    def _getFile(self, path):
+        entry = self.files.get(path)
+        if entry is None:
+            entry = _File(path, len(self.paths))
+            self.files[path] = entry
+            self.paths.append(path)
+        return entry
+
+
+    def _read(self, entry):
+        f = open(entry.path)
+        try:
+            entry.text = f.read()
+        finally:
+            f.close()
+        entry.mtime = os.path.getmtime(entry.path)
+        entry.hash = sha1(entry.text).hexdigest()
+
+
+    def _hasChanged(self, entry):
+        try:
+            mtime = os.path.getmtime(entry.path)
+        except OSError:
+            return True
+        if mtime == entry.mtime:
+            return False
+        oldHash = entry.hash
+        self._read(entry)
+        return entry.hash != oldHash
+
+
+    def _expand(self, path, stack):
+        if path in stack:
+            raise PreprocessError('circular #include of %s' % (path,))
+        entry = self._getFile(path)
+        if entry.expanded is not None:
+            return entry.expanded
+        if entry.text is None:
+            self._read(entry)
+
+        for include in entry.includes:
+            self.dependents[include].discard(path)
+        entry.includes = []
+
+        lines = []
+        for number, line in enumerate(entry.text.splitlines(True)):
+            match = _includePattern.match(line)
+            if match is None:
+                lines.append(line)
+                continue
+            if not line.endswith('\n'):
+                line += '\n'
+            includePath = self._resolve(match.group(1), path)
+            entry.includes.append(includePath)
+            self.dependents.setdefault(includePath, set()).add(path)
+            included = self._expand(includePath, stack + [path])
+            if not included.endswith('\n'):
+                included += '\n'
+            lines.append('#line 1 %d\n' % (self.files[includePath].number,))
+            lines.append(included)
+            lines.append('#line %d %d\n' % (number + 2, entry.number))
+
+        entry.expanded = ''.join(lines)
+        self.expansions += 1
+        return entry.expanded
+
+
+    def expand(self, fname):
+        path = os.path.abspath(fname)
+        expanded = self._expand(path, [])
+        number = self.files[path].number
+        lines = expanded.splitlines(True)
+        index = findVersionLine(lines)
+        if index is None:
+            return '#line 1 %d\n%s' % (number, expanded)
+        # nothing but comments may come before #version, so the #line
+        # follows it
+        version = lines[index]
+        if not version.endswith('\n'):
+            version += '\n'
+        return '%s%s#line %d %d\n%s' % (''.join(lines[:index]), version,
+            index + 2, number, ''.join(lines[index + 1:]))
+
+
+    def createShader(self, shaderClass, fname):
+        shader = shaderClass([self.expand(fname)])
+        shader.name = fname
+        self.shaders[shader] = os.path.abspath(fname)
+        return shader
+
+
+    def _getAffected(self, paths):
+        affected = set()
+        pending = list(paths)
+        while pending:
+            path = pending.pop()
+            if path in affected:
+                continue
+            affected.add(path)
+            pending.extend(self.dependents.get(path, ()))
+        return affected
+
+
+    def getChanged(self):
+        return [
+            path for path, entry in self.files.iteritems()
+            if entry.text is not None and self._hasChanged(entry)
+        ]
+
+
+    def getUpdates(self):
+        '''
+        Re-expand the shaders created by createShader() whose files, or
+        files they include, have changed since they were expanded. Returns
+        a list of (shader, sources) for those whose sources have changed,
+        without modifying the shaders.
+        '''
+        affected = self._getAffected(self.getChanged())
+        if not affected:
+            return []
+        for path in affected:
+            self.files[path].expanded = None
+
+        updates = []
+        for shader, path in self.shaders.iteritems():
+            if path in affected:
+                sources = (self.expand(path),)
+                if sources != shader.sources:
+                    updates.append((shader, sources))
+        return updates
+
+
+    def update(self):
+        '''
+        Re-expand and recompile the shaders created by createShader() whose
+        files, or files they include, have changed since they were expanded.
+        Returns the list of shaders which were recompiled.
+        '''
+        changed = []
+        for shader, sources in self.getUpdates():
+            shader.setSources(sources)
+            changed.append(shader)
+        for shader in changed:
+            shader.startCompile()
+        for shader in changed:
+            shader.finishCompile()
+        return changed
+
+
+    def forget(self, shader):
+        self.shaders.pop(shader, None)
+
+
+    def getFileName(self, number):
+        if 0 <= number < len(self.paths):
+            return self.paths[number]
+        return None
+
+
+    def translateLog(self, log):
+        '''
+        Replace the source string numbers at the start of each line of a
+        compile log with the names of the files they refer to.
+        '''
+        def replace(match):
+            prefix, number, separator, line = match.groups()
+            fname = self.getFileName(int(number))
+            if fname is None:
+                return match.group(0)
+            return '%s%s%s%s' % (prefix, fname, separator, line)
+        return _logPattern.sub(replace, log)
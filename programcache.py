@@ -0,0 +1,198 @@
+'''
+An on-disk cache of linked program binaries, so that programs built in
+previous runs can be restored with glProgramBinary instead of being compiled
+and linked from source again.
+
+Entries are keyed by a hash of the driver strings and of each shader's type
+and sources. Files are written atomically, and the least recently used
+entries are evicted once the cache grows beyond maxBytes, so many processes
+can safely share one cache directory.
+'''
+
+from ctypes import byref, create_string_buffer, c_int, c_uint
+from hashlib import sha1
+import os
+from struct import calcsize, pack, unpack
+from tempfile import mkstemp
+
+from glbackend import getGl
+import lifetime
+
+
+gl = getGl()
+gl_info = gl.gl_info
+
+
+SUFFIX = '.bin'
+
+# each cache file starts with the binary format enum
+_header = '<I'
+_headerSize = calcsize(_header)
+
+
+class ProgramCache(object):
+
+    def __init__(self, directory, maxBytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        # bytes of entries in the directory, as found by the last evict()
+        # plus those stored since, or None until the directory is scanned
+        self.size = None
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # another process may have created it first
+                if not os.path.isdir(directory):
+                    raise
+
+
+    def isSupported(self):
+        count = c_int(0)
+        gl.glGetIntegerv(gl.GL_NUM_PROGRAM_BINARY_FORMATS, byref(count))
+        return count.value > 0
+
+
+    def getKey(self, program):
+        digest = sha1()
+        for driverString in (
+            gl_info.get_vendor(),
+            gl_info.get_renderer(),
+            gl_info.get_version(),
+        ):
+            digest.update('%s\0' % (driverString,))
+        for shader in program.shaders:
+            digest.update('%s:%s\0' % (shader.type, shader.getSourceHash()))
+        # bound locations are part of the linked binary
+        if program.attributeLocations:
+            for name, location in sorted(
+                program.attributeLocations.iteritems()):
+                digest.update('%s=%d\0' % (name, location))
+        return digest.hexdigest()
+
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+
+    def _read(self, path):
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        if len(data) <= _headerSize:
+            return None
+        binaryFormat, = unpack(_header, data[:_headerSize])
+        return binaryFormat, data[_headerSize:]
+
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+    def load(self, program):
+        '''
+        Restore the given program from the cache, setting program.id.
+        Returns False if there is no usable entry, in which case the caller
+        should build the program from source.
+        '''
+        path = self.getPath(self.getKey(program))
+        entry = self._read(path)
+        if entry is None:
+            self.misses += 1
+            return False
+        binaryFormat, binary = entry
+
+        program.id = gl.glCreateProgram()
+        lifetime.created('program', program.id, program)
+        gl.glProgramBinary(program.id, binaryFormat, binary, len(binary))
+        if not program.getLinkStatus():
+            # eg. after a driver update the binary format changes
+            lifetime.deleted('program', program.id)
+            gl.glDeleteProgram(program.id)
+            program.id = None
+            self._remove(path)
+            self.rejected += 1
+            self.misses += 1
+            return False
+
+        # touch the entry, so that eviction is least-recently-used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return True
+
+
+    def store(self, program):
+        length = program._get(gl.GL_PROGRAM_BINARY_LENGTH)
+        if length == 0:
+            return
+        buffer = create_string_buffer(length)
+        binaryFormat = c_uint(0)
+        gl.glGetProgramBinary(
+            program.id, length, None, byref(binaryFormat), buffer)
+        data = pack(_header, binaryFormat.value) + buffer.raw
+
+        path = self.getPath(self.getKey(program))
+        handle, tempPath = mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            try:
+                os.write(handle, data)
+            finally:
+                os.close(handle)
+        except OSError:
+            # eg. the disk is full
+            self._remove(tempPath)
+            raise
+        try:
+            os.rename(tempPath, path)
+        except OSError:
+            # on Windows, rename won't replace an existing entry. Entries
+            # with the same key are identical, so keep the existing one.
+            self._remove(tempPath)
+
+        # only scan the directory when the cache may have outgrown maxBytes.
+        # Entries stored by other processes are only counted by the scan.
+        if self.size is not None:
+            self.size += len(data)
+        if self.size is None or self.size > self.maxBytes:
+            self.evict()
+
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache fits in
+        maxBytes.
+        '''
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            self._remove(path)
+            total -= size
+        self.size = total
@@ -0,0 +1,348 @@
+'''
+Offscreen render targets, made of a framebuffer object with a colour texture
+and optionally a depth and stencil renderbuffer, and asynchronous reading of
+their pixels into NumPy through a ring of pixel buffer objects.
+
+    target = RenderTarget(256, 256)
+    reader = PixelReader(target)
+    for scene in scenes:
+        with target:
+            program.use()
+            scene.draw()
+        reader.start()
+        if len(reader.pending) > 1:
+            save(reader.collect())
+    while reader.pending:
+        save(reader.collect())
+
+start() only queues the copy of the target's pixels into a pixel buffer, so
+rendering of the next frame goes ahead while it happens, and collect(),
+called a frame later, usually finds it done. collect() returns a NumPy view
+of the mapped pixel buffer, of shape (height, width, channels), with the
+bottom row first, valid until the next call to collect() or release(), or
+to start() reusing its buffer. Copy it to keep it.
+
+The colour texture, target.texture, can be sampled by later passes, eg.
+with textures.TextureUnits. Without a display, such as on servers rendering
+with Mesa's llvmpipe, create the GL context with pyglet's headless option.
+
+Requires NumPy.
+'''
+
+from ctypes import byref, c_int, c_ubyte, c_uint
+
+import numpy
+
+from glbackend import getGl
+from glerrors import GLError
+import lifetime
+from shaderstats import perf_counter
+from streambuffer import WAIT_TIMEOUT
+from textures import getTextureUnits
+from vertexbuffer import getBufferAddress
+
+
+gl = getGl()
+
+
+framebufferStatusNames = {
+    0x8CD6: 'GL_FRAMEBUFFER_INCOMPLETE_ATTACHMENT',
+    0x8CD7: 'GL_FRAMEBUFFER_INCOMPLETE_MISSING_ATTACHMENT',
+    0x8CDB: 'GL_FRAMEBUFFER_INCOMPLETE_DRAW_BUFFER',
+    0x8CDC: 'GL_FRAMEBUFFER_INCOMPLETE_READ_BUFFER',
+    0x8CDD: 'GL_FRAMEBUFFER_UNSUPPORTED',
+    0x8D56: 'GL_FRAMEBUFFER_INCOMPLETE_MULTISAMPLE',
+}
+
+# pixel format: number of channels
+channelCounts = {
+    gl.GL_RED: 1,
+    gl.GL_RG: 2,
+    gl.GL_RGB: 3,
+    gl.GL_RGBA: 4,
+    gl.GL_DEPTH_COMPONENT: 1,
+}
+
+# pixel type: numpy dtype
+pixelTypes = {
+    gl.GL_UNSIGNED_BYTE: numpy.uint8,
+    gl.GL_UNSIGNED_SHORT: numpy.uint16,
+    gl.GL_FLOAT: numpy.float32,
+}
+
+
+
+class RenderTarget(object):
+
+    def __init__(self, width, height, internalFormat=gl.GL_RGBA8,
+        depth=True):
+        '''
+        Create a framebuffer of the given size, rendering into a texture of
+        the given internal format, with a depth and stencil renderbuffer
+        if depth is true. Raises GLError if the framebuffer is incomplete.
+        '''
+        self.width = width
+        self.height = height
+        self.internalFormat = internalFormat
+        self.id = None
+        self.texture = None
+        self.depth = None
+        self._saved = None
+        self._create(depth)
+
+
+    def _create(self, depth):
+        textureId = c_uint(0)
+        gl.glGenTextures(1, byref(textureId))
+        self.texture = textureId.value
+        lifetime.created('texture', self.texture, self)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, self.internalFormat,
+            self.width, self.height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+        # without mipmaps, the default minifying filter leaves it incomplete
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
+            gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
+            gl.GL_LINEAR)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
+        # that left the active unit, whichever it is, without a texture
+        getTextureUnits().invalidate()
+
+        framebufferId = c_uint(0)
+        gl.glGenFramebuffers(1, byref(framebufferId))
+        self.id = framebufferId.value
+        lifetime.created('framebuffer', self.id, self)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.id)
+        gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+            gl.GL_TEXTURE_2D, self.texture, 0)
+
+        if depth:
+            depthId = c_uint(0)
+            gl.glGenRenderbuffers(1, byref(depthId))
+            self.depth = depthId.value
+            lifetime.created('renderbuffer', self.depth, self)
+            gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.depth)
+            gl.glRenderbufferStorage(gl.GL_RENDERBUFFER,
+                gl.GL_DEPTH24_STENCIL8, self.width, self.height)
+            gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER,
+                gl.GL_DEPTH_STENCIL_ATTACHMENT, gl.GL_RENDERBUFFER, self.depth)
+
+        status = gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+        if status != gl.GL_FRAMEBUFFER_COMPLETE:
+            self.delete()
+            raise GLError('framebuffer incomplete: %s' %
+                (framebufferStatusNames.get(status, '0x%04X' % (status,)),))
+
+
+    def bind(self):
+        '''
+        Draw into, and read from, this target, over its whole area.
+        '''
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.id)
+        gl.glViewport(0, 0, self.width, self.height)
+
+
+    def __enter__(self):
+        '''
+        Bind the target, restoring the framebuffer and viewport in use
+        before on exit.
+        '''
+        framebuffer = c_int(0)
+        gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING, byref(framebuffer))
+        viewport = (c_int * 4)()
+        gl.glGetIntegerv(gl.GL_VIEWPORT, viewport)
+        self._saved = (framebuffer.value, tuple(viewport))
+        self.bind()
+        return self
+
+
+    def __exit__(self, *_):
+        framebuffer, viewport = self._saved
+        self._saved = None
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+        gl.glViewport(*viewport)
+
+
+    def readPixels(self, out=None, format=gl.GL_RGBA,
+        type=gl.GL_UNSIGNED_BYTE):
+        '''
+        Read the target's pixels into out, by default a new array of shape
+        (height, width, channels), and return it. This waits for rendering
+        to finish, so PixelReader is preferable for reading every frame.
+        '''
+        shape = (self.height, self.width, channelCounts[format])
+        dtype = numpy.dtype(pixelTypes[type])
+        if out is None:
+            out = numpy.empty(shape, dtype)
+        elif out.dtype != dtype:
+            raise ValueError('cannot read pixels of %s into %s' %
+                (dtype, out.dtype))
+        # raises TypeError for arrays which aren't contiguous
+        address, size = getBufferAddress(out)
+        expected = shape[0] * shape[1] * shape[2] * dtype.itemsize
+        if size != expected:
+            raise ValueError('cannot read %d bytes of pixels into %d' %
+                (expected, size))
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, self.id)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        gl.glReadPixels(0, 0, self.width, self.height, format, type, address)
+        return out
+
+
+    def delete(self):
+        if self.depth is not None:
+            gl.glDeleteRenderbuffers(1, byref(c_uint(self.depth)))
+            lifetime.deleted('renderbuffer', self.depth)
+            self.depth = None
+        if self.id is not None:
+            gl.glDeleteFramebuffers(1, byref(c_uint(self.id)))
+            lifetime.deleted('framebuffer', self.id)
+            self.id = None
+        if self.texture is not None:
+            gl.glDeleteTextures(1, byref(c_uint(self.texture)))
+            lifetime.deleted('texture', self.texture)
+            self.texture = None
+
+
+
+class PixelReader(object):
+
+    def __init__(self, target, buffers=3, format=gl.GL_RGBA,
+        type=gl.GL_UNSIGNED_BYTE, clock=perf_counter):
+        '''
+        Read the pixels of the given RenderTarget, in the given format and
+        type, through a ring of the given number of pixel buffers, so that
+        up to that many reads can be in flight at once.
+        '''
+        self.target = target
+        self.format = format
+        self.type = type
+        self.shape = (target.height, target.width, channelCounts[format])
+        self.dtype = numpy.dtype(pixelTypes[type])
+        self.size = self.shape[0] * self.shape[1] * self.shape[2] * \
+            self.dtype.itemsize
+        self.clock = clock
+        self.ids = []
+        # (buffer index, fence) for each read not yet collected, oldest first
+        self.pending = []
+        self.next = 0
+        # index of the buffer mapped by the last collect(), if still mapped
+        self.mapped = None
+        self.frames = 0
+        self.bytesRead = 0
+        self.waits = 0
+        self.waitTime = 0.0
+        for _ in xrange(buffers):
+            self._createBuffer()
+
+
+    def _createBuffer(self):
+        bufferId = c_uint(0)
+        gl.glGenBuffers(1, byref(bufferId))
+        self.ids.append(bufferId.value)
+        lifetime.created('buffer', bufferId.value, self)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, bufferId.value)
+        gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, self.size, None,
+            gl.GL_STREAM_READ)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+
+
+    def start(self):
+        '''
+        Queue a copy of the target's pixels into the next pixel buffer,
+        without waiting for rendering to finish. Leaves the target bound
+        for reading. Raises ValueError if every buffer holds a read not yet
+        collected.
+        '''
+        if len(self.pending) == len(self.ids):
+            raise ValueError('all %d pixel buffers are waiting to be '
+                'collected' % (len(self.ids),))
+        index = self.next
+        if self.mapped == index:
+            self.release()
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, self.target.id)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.ids[index])
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        # with a pack buffer bound, the pointer is an offset into it
+        gl.glReadPixels(0, 0, self.target.width, self.target.height,
+            self.format, self.type, None)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.pending.append((index, fence))
+        self.next = (index + 1) % len(self.ids)
+        self.frames += 1
+
+
+    def collect(self, wait=True):
+        '''
+        Returns a NumPy view of the pixels of the oldest read not yet
+        collected, waiting for it to finish, or if wait is false, returning
+        None if it hasn't.
+        '''
+        if not self.pending:
+            raise ValueError('no pixel read started')
+        index, fence = self.pending[0]
+        if not self._wait(fence, wait):
+            return None
+        del self.pending[0]
+        gl.glDeleteSync(fence)
+        self.release()
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.ids[index])
+        address = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, self.size,
+            gl.GL_MAP_READ_BIT)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self.mapped = index
+        self.bytesRead += self.size
+        memory = (c_ubyte * self.size).from_address(address)
+        return numpy.ctypeslib.as_array(memory).view(
+            self.dtype).reshape(self.shape)
+
+
+    def _wait(self, fence, wait):
+        result = gl.glClientWaitSync(fence, 0, 0)
+        if result in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+            return True
+        if not wait:
+            return False
+        self.waits += 1
+        start = self.clock()
+        while result == gl.GL_TIMEOUT_EXPIRED:
+            result = gl.glClientWaitSync(
+                fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, WAIT_TIMEOUT)
+        self.waitTime += self.clock() - start
+        if result == gl.GL_WAIT_FAILED:
+            raise GLError('waiting for pixel read failed')
+        return True
+
+
+    def release(self):
+        '''
+        Unmap the buffer returned by the last collect(), invalidating the
+        view of it.
+        '''
+        if self.mapped is not None:
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.ids[self.mapped])
+            gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+            self.mapped = None
+
+
+    def getMetrics(self):
+        return {
+            'frames': self.frames,
+            'bytesRead': self.bytesRead,
+            'waits': self.waits,
+            'waitTime': self.waitTime,
+        }
+
+
+    def delete(self):
+        for _, fence in self.pending:
+            gl.glDeleteSync(fence)
+        self.pending = []
+        self.release()
+        for bufferId in self.ids:
+            gl.glDeleteBuffers(1, byref(c_uint(bufferId)))
+            lifetime.deleted('buffer', bufferId)
+        self.ids = []
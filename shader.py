@@ -1,8 +1,15 @@
 from ctypes import (
-    byref, c_char, c_char_p, c_int, cast, create_string_buffer, pointer,
-    POINTER
+    byref, c_char, c_char_p, c_float, c_int, c_uint, cast, create_string_buffer,
+    pointer, POINTER
 )
-from pyglet import gl
+from hashlib import sha1
+from weakref import WeakKeyDictionary
+
+from glbackend import getGl
+import lifetime
+
+
+gl = getGl()
 
 
 class ShaderError(Exception): pass
@@ -18,23 +25,125 @@ shaderErrors = {
 }
 
 
+# whether _get() checks query results for error codes. glerrors turns this
+# off when errors are checked once per frame, or by a debug callback
+checkQueries = True
+
+
+# from GL_KHR_parallel_shader_compile, which pyglet doesn't define
+GL_COMPLETION_STATUS_KHR = 0x91B1
+
+# from OpenGL 4.3, which pyglet doesn't define
+GL_COMPUTE_SHADER = 0x91B9
+
+
+def _getParallelCompileExtension():
+    for vendor in ('KHR', 'ARB'):
+        if gl.gl_info.have_extension('GL_%s_parallel_shader_compile' % vendor):
+            return vendor
+    return None
+
+
+def _haveUniformBlocks():
+    # GL_ACTIVE_UNIFORM_BLOCKS is GL_INVALID_ENUM without them, eg. in the
+    # legacy 2.1 contexts of macOS
+    return gl.gl_info.have_version(3, 1) or \
+        gl.gl_info.have_extension('GL_ARB_uniform_buffer_object')
+
+
+def buildAll(programs):
+    '''
+    Build many programs at once. All the compiles and links are issued
+    before any status is queried, so the driver doesn't have to finish each
+    one before the next is submitted, and with parallel shader compile
+    extensions the driver compiles them concurrently.
+    Returns a list of each program's compile and link messages.
+
+    Every program is finished, even after one fails. The error of the first
+    to fail is then raised, with an errors attribute listing (program,
+    error) for each that failed.
+    '''
+    vendor = _getParallelCompileExtension()
+    if vendor is not None:
+        setThreads = gl.lib.link_GL(
+            'glMaxShaderCompilerThreads' + vendor, None, [c_uint])
+        # let the driver choose how many threads to use
+        setThreads(0xffffffff)
+    for program in programs:
+        program.startBuild()
+    messages = []
+    errors = []
+    for program in programs:
+        try:
+            messages.append(program.finishBuild())
+        except ShaderError, e:
+            errors.append((program, e))
+    if errors:
+        error = errors[0][1]
+        error.errors = errors
+        raise error
+    return messages
+
+
+# an optional shaderstats.ShaderStats, which is told about compiles, links,
+# binds and info log fetches. See shaderstats.enableStats()
+stats = None
+
+
+# id of the program most recently bound in each GL context, so that
+# redundant glUseProgram calls can be skipped
+_currentProgram = WeakKeyDictionary()
+
+
+def getCurrentProgram():
+    context = gl.current_context
+    if context is None:
+        return None
+    return _currentProgram.get(context)
+
+
+def _setCurrentProgram(programId):
+    context = gl.current_context
+    if context is not None:
+        _currentProgram[context] = programId
+
+
+def useFixedFunction():
+    gl.glUseProgram(0)
+    _setCurrentProgram(0)
+
+
 class _Shader(object):
 
     type = None
+    # identifies the shader in stats, if set
+    name = None
+    # if true, the shader object is kept once programs using it are linked,
+    # eg. to relink them quickly when hot reloading
+    keepAfterLink = False
 
     def __init__(self, sources):
         if isinstance(sources, basestring):
-            self.sources = [sources]
-        else:
-            self.sources = sources
+            sources = [sources]
+        # a tuple, so the sources can't change without setSources(), which
+        # getSourceHash() relies on
+        self.sources = tuple(sources)
         self.id = None
+        self.compiled = False
+        self.refs = 0
+        self.registry = None
+        # the message of a failed compile, raised again by later calls to
+        # finishCompile, eg. from other programs sharing the shader
+        self.error = None
+        # (sources, their hash), so the hash is only redone for new sources
+        self._sourceHash = (None, None)
         
         
     def _get(self, paramId):
         outvalue = c_int(0)
         gl.glGetShaderiv(self.id, paramId, byref(outvalue))
         value = outvalue.value
-        if value in shaderErrors.keys():
+        if checkQueries and value in shaderErrors:
             msg = '%s from glGetShader(%s, %s, &value)'
             raise ValueError(msg % (shaderErrors[value], self.id, paramId))
         return value
@@ -54,6 +163,8 @@ class _Shader(object):
             return ''
         buffer = create_string_buffer(length)
         gl.glGetShaderInfoLog(self.id, length, None, buffer)
+        if stats is not None:
+            stats.infoLogFetched(self)
         return buffer.value
 
 
@@ -63,16 +174,137 @@ class _Shader(object):
         return num, cast(pointer(all_source), POINTER(POINTER(c_char)))
         
 
-    def compile(self):
+    def setSources(self, sources):
+        '''
+        Replace this shader's sources, deleting the compiled shader object
+        if they have changed. Returns whether they changed.
+        '''
+        if isinstance(sources, basestring):
+            sources = [sources]
+        sources = tuple(sources)
+        if sources == self.sources:
+            return False
+        self.delete()
+        self.sources = sources
+        self.error = None
+        return True
+
+
+    def getSourceHash(self):
+        sources, hexdigest = self._sourceHash
+        if sources is self.sources:
+            return hexdigest
+        digest = sha1()
+        for source in self.sources:
+            digest.update('%d:%s' % (len(source), source))
+        self._sourceHash = (self.sources, digest.hexdigest())
+        return self._sourceHash[1]
+
+
+    def getName(self):
+        if self.name is not None:
+            return self.name
+        return '%s %s' % (self.__class__.__name__, self.getSourceHash()[:8])
+
+
+    def startCompile(self):
+        if self.id is not None:
+            return
+        if stats is not None:
+            start = stats.clock()
+
+        self.error = None
         self.id = gl.glCreateShader(self.type)
+        lifetime.created('shader', self.id, self)
 
         num, src = self._srcToArray()
         gl.glShaderSource(self.id, num, src, None)
         
         gl.glCompileShader(self.id)
+        if stats is not None:
+            stats.compileStarted(self, stats.clock() - start)
+
+
+    def isReady(self):
+        if self.compiled or self.error is not None or \
+            _getParallelCompileExtension() is None:
+            return True
+        return bool(self._get(GL_COMPLETION_STATUS_KHR))
 
-        if not self.getCompileStatus():
-            raise CompileError(self.getInfoLog())
+
+    def finishCompile(self):
+        if self.compiled:
+            return
+        if self.error is not None:
+            raise CompileError(self.error)
+        if stats is None:
+            compiled = self.getCompileStatus()
+        else:
+            start = stats.clock()
+            compiled = self.getCompileStatus()
+            stats.addCompileTime(self, stats.clock() - start)
+        if not compiled:
+            message = self.getInfoLog()
+            self.delete()
+            self.error = message
+            raise CompileError(message)
+        self.compiled = True
+
+
+    def compile(self):
+        self.startCompile()
+        self.finishCompile()
+
+
+    def replaceWith(self, other):
+        '''
+        Take over the sources and compiled shader object of other, deleting
+        this shader's old object. Programs already linked with the old
+        object keep working.
+        '''
+        self.delete()
+        self.sources = other.sources
+        self.id, other.id = other.id, None
+        self.compiled, other.compiled = other.compiled, False
+        self.error, other.error = other.error, None
+        if self.id is not None:
+            lifetime.deleted('shader', self.id)
+            lifetime.created('shader', self.id, self)
+
+
+    def acquire(self):
+        self.refs += 1
+
+
+    def release(self):
+        self.refs -= 1
+        if self.refs == 0:
+            self.delete()
+
+
+    def isShared(self):
+        '''
+        Returns whether other programs use, or may later use, this shader.
+        '''
+        return self.refs > 1 or self.registry is not None
+
+
+    def deleteObject(self):
+        '''
+        Delete the compiled shader object, keeping the sources, so that it
+        is compiled again if needed.
+        '''
+        if self.id is not None:
+            lifetime.deleted('shader', self.id)
+            gl.glDeleteShader(self.id)
+            self.id = None
+        self.compiled = False
+
+
+    def delete(self):
+        self.deleteObject()
+        if self.registry is not None:
+            self.registry.forget(self)
 
 
 
@@ -84,19 +316,172 @@ class FragmentShader(_Shader):
     type = gl.GL_FRAGMENT_SHADER
 
 
+class ComputeShader(_Shader):
+    type = GL_COMPUTE_SHADER
+
+
+
+class ShaderRegistry(object):
+    '''
+    Interns shaders by their type and sources, so that programs sharing an
+    identical stage share a single compiled shader object.
+    '''
+
+    def __init__(self):
+        self.shaders = {}
+
+
+    def _getKey(self, shader):
+        return shader.type, shader.getSourceHash()
+
+
+    def get(self, shaderClass, sources):
+        shader = shaderClass(sources)
+        key = self._getKey(shader)
+        if key in self.shaders:
+            return self.shaders[key]
+        shader.registry = self
+        self.shaders[key] = shader
+        return shader
+
+
+    def forget(self, shader):
+        key = self._getKey(shader)
+        if self.shaders.get(key) is shader:
+            del self.shaders[key]
+        shader.registry = None
+
+
+    def __len__(self):
+        return len(self.shaders)
+
+
+
+class Uniform(object):
+
+    def __init__(self, name, location, type, size):
+        self.name = name
+        self.location = location
+        self.type = type
+        self.size = size
+
+
+    def __repr__(self):
+        return '<Uniform %s location=%d type=0x%x size=%d>' % (
+            self.name, self.location, self.type, self.size)
+
+
+class UniformBlockInfo(object):
+
+    def __init__(self, name, index, size, offsets):
+        self.name = name
+        self.index = index
+        self.size = size
+        # byte offset of each member, keyed by member name
+        self.offsets = offsets
+
+
+    def __repr__(self):
+        return '<UniformBlockInfo %s index=%d size=%d>' % (
+            self.name, self.index, self.size)
+
+
+# glUniformMatrix function names, keyed by the number of matrix elements
+_uniformMatrixFuncs = {
+    4: 'glUniformMatrix2fv',
+    9: 'glUniformMatrix3fv',
+    16: 'glUniformMatrix4fv',
+}
+
+
+# uniform types which name a texture unit
+samplerTypes = frozenset([
+    gl.GL_SAMPLER_1D, gl.GL_SAMPLER_2D, gl.GL_SAMPLER_3D, gl.GL_SAMPLER_CUBE,
+    gl.GL_SAMPLER_1D_SHADOW, gl.GL_SAMPLER_2D_SHADOW, gl.GL_SAMPLER_2D_RECT,
+    gl.GL_SAMPLER_1D_ARRAY, gl.GL_SAMPLER_2D_ARRAY, gl.GL_SAMPLER_BUFFER,
+    gl.GL_SAMPLER_2D_ARRAY_SHADOW, gl.GL_SAMPLER_CUBE_SHADOW,
+    gl.GL_SAMPLER_2D_MULTISAMPLE,
+    gl.GL_INT_SAMPLER_2D, gl.GL_INT_SAMPLER_3D, gl.GL_INT_SAMPLER_CUBE,
+    gl.GL_INT_SAMPLER_2D_ARRAY,
+    gl.GL_UNSIGNED_INT_SAMPLER_2D, gl.GL_UNSIGNED_INT_SAMPLER_3D,
+    gl.GL_UNSIGNED_INT_SAMPLER_CUBE, gl.GL_UNSIGNED_INT_SAMPLER_2D_ARRAY,
+])
+
+
+def assignSamplerUnits(uniforms):
+    '''
+    Returns a dict giving each sampler in the given dict of Uniforms its
+    own texture unit, or for arrays of samplers, the first of consecutive
+    units.
+    '''
+    units = {}
+    unit = 0
+    for name, uniform in sorted(uniforms.iteritems()):
+        if uniform.type in samplerTypes:
+            units[name] = unit
+            unit += uniform.size
+    return units
+
+
+def _flatten(values):
+    flat = []
+    for value in values:
+        if hasattr(value, '__len__'):
+            flat.extend(value)
+        else:
+            flat.append(value)
+    return tuple(flat)
+
+
 
 class ShaderProgram(object):
 
+    # an optional programcache.ProgramCache, used by build()
+    cache = None
+    # identifies the program in stats, if set
+    name = None
+    # if true, linked as a separable program, for use in a program pipeline
+    separable = False
+    # an optional dict of attribute name to location, bound before linking,
+    # so that programs sharing it can share vertex array layouts
+    attributeLocations = None
+    # if true, shaders are detached once linked, and their objects deleted
+    # unless other programs share them
+    deleteShadersAfterLink = True
+
     def __init__(self, *shaders):
         self.shaders = list(shaders)
+        for shader in self.shaders:
+            shader.acquire()
         self.id = None
+        # state of a build started by startBuild but not yet finished
+        self._pending = False
+        self._pendingLink = False
+        self._pendingCache = None
+        self.attributes = {}
+        self.uniforms = {}
+        self.uniformBlocks = {}
+        # uniform block name: binding point, as set by UniformBlock.bindTo,
+        # so relink() can restore them
+        self.uniformBlockBindings = {}
+        # sampler uniform name: texture unit, assigned by reflection. Arrays
+        # of samplers take consecutive units, from the one given
+        self.samplerUnits = {}
+        self._uniformLocations = {}
+        self._uniformValues = {}
+        # the upload function last used for each uniform, by name
+        self._uniformSetters = {}
+        self.uniformHits = 0
+        self.uniformMisses = 0
+        self.uniformUploads = 0
+        self.uniformSkips = 0
 
     
     def _get(self, paramId):
         outvalue = c_int(0)
         gl.glGetProgramiv(self.id, paramId, byref(outvalue))
         value = outvalue.value
-        if value in shaderErrors.keys():
+        if checkQueries and value in shaderErrors:
             msg = '%s from glGetProgram(%s, %s, &value)'
             raise ValueError(msg % (shaderErrors[value], self.id, paramId))
         return value
@@ -116,6 +501,8 @@ class ShaderProgram(object):
             return ''
         buffer = create_string_buffer(length)
         gl.glGetProgramInfoLog(self.id, length, None, buffer)
+        if stats is not None:
+            stats.infoLogFetched(self)
         return buffer.value
         
 
@@ -131,19 +518,437 @@ class ShaderProgram(object):
         return '\n'.join(messages)
 
         
-    def use(self):
+    def getName(self):
+        if self.name is not None:
+            return self.name
+        return ' + '.join(shader.getName() for shader in self.shaders)
+
+
+    def _link(self):
+        if stats is None:
+            gl.glLinkProgram(self.id)
+            return
+        start = stats.clock()
+        gl.glLinkProgram(self.id)
+        stats.linkStarted(self, stats.clock() - start)
+
+
+    def _checkLinkStatus(self):
+        if stats is None:
+            return self.getLinkStatus()
+        start = stats.clock()
+        linked = self.getLinkStatus()
+        stats.addLinkTime(self, stats.clock() - start)
+        return linked
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *_):
+        self.delete()
+
+
+    def _createProgram(self):
         self.id = gl.glCreateProgram()
+        lifetime.created('program', self.id, self)
+        if self.separable:
+            gl.glProgramParameteri(
+                self.id, gl.GL_PROGRAM_SEPARABLE, gl.GL_TRUE)
+        if self.attributeLocations:
+            for name, location in self.attributeLocations.iteritems():
+                gl.glBindAttribLocation(self.id, location, name)
+
+
+    def build(self):
+        self.startBuild()
+        return self.finishBuild()
+
+
+    def startBuild(self):
+        '''
+        Issue the compiles and the link, without waiting for them to finish.
+        '''
+        self._pending = True
+        self._pendingLink = False
+        self._pendingCache = None
+        cache = self.cache
+        if cache is not None and not cache.isSupported():
+            cache = None
+        if cache is not None and cache.load(self):
+            return
+
+        self._pendingLink = True
+        self._createProgram()
         
         for shader in self.shaders:
-            shader.compile()
+            shader.startCompile()
             gl.glAttachShader(self.id, shader.id)
 
-        gl.glLinkProgram(self.id)
+        if cache is not None:
+            gl.glProgramParameteri(
+                self.id, gl.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, gl.GL_TRUE)
+            self._pendingCache = cache
+        self._link()
+
+
+    def isReady(self):
+        '''
+        Returns whether finishBuild() can be called without blocking.
+        '''
+        if not self._pending or _getParallelCompileExtension() is None:
+            return True
+        return bool(self._get(GL_COMPLETION_STATUS_KHR))
+
+
+    def finishBuild(self):
+        '''
+        Wait for the build started by startBuild() to finish, raising an
+        exception if it failed. Returns the compile and link messages.
+        '''
+        if not self._pending:
+            return ''
+        self._pending = False
+        cache, self._pendingCache = self._pendingCache, None
+        message = ''
+        if self._pendingLink:
+            self._pendingLink = False
+            message = self._finishLink(cache)
+        self._reflectAttributes()
+        errors = self._getAttributeLocationErrors()
+        if errors:
+            self._deleteProgram()
+            raise LinkError(errors)
+        self._reflectUniforms()
+        self._reflectUniformBlocks()
+        return message
+
+
+    def _finishLink(self, cache):
+        try:
+            for shader in self.shaders:
+                shader.finishCompile()
+        except CompileError:
+            self._deleteProgram()
+            raise
 
         message = self._getMessage()
-        if not self.getLinkStatus():
+        if not self._checkLinkStatus():
+            self._deleteProgram()
             raise LinkError(message)
 
-        gl.glUseProgram(self.id)
+        if cache is not None:
+            cache.store(self)
+        self._detachShaders(self.shaders)
         return message
 
+
+    def _detachShaders(self, stages):
+        '''
+        Detach the given shaders, once linked, deleting those which belong
+        to this program alone.
+        '''
+        if not self.deleteShadersAfterLink:
+            return
+        for stage in stages:
+            if stage.id is None:
+                continue
+            gl.glDetachShader(self.id, stage.id)
+            if stage in self.shaders and not stage.isShared() and \
+                not stage.keepAfterLink:
+                stage.deleteObject()
+
+
+    def relink(self, replacements=None):
+        '''
+        Link a new program object from this program's shaders, with each
+        shader that is a key of replacements swapped for its value, and use
+        it in place of the old one. Uniform values set through setUniform*
+        are uploaded again, uniform blocks are bound to the same points,
+        and if the old program was bound, the new one is. If the link
+        fails, LinkError is raised and this program is left as it was.
+        '''
+        if replacements is None:
+            replacements = {}
+        stages = [replacements.get(shader, shader) for shader in self.shaders]
+        for stage in stages:
+            stage.compile()
+
+        oldId = self.id
+        self._createProgram()
+        for stage in stages:
+            gl.glAttachShader(self.id, stage.id)
+        self._link()
+        attributes = self.attributes
+        if not self._checkLinkStatus():
+            message = self.getInfoLog()
+        else:
+            self._reflectAttributes()
+            message = self._getAttributeLocationErrors()
+        if message:
+            lifetime.deleted('program', self.id)
+            gl.glDeleteProgram(self.id)
+            self.id = oldId
+            self.attributes = attributes
+            raise LinkError(message)
+
+        values = []
+        for name, upload in self._uniformSetters.iteritems():
+            location = self._uniformLocations.get(name)
+            if location in self._uniformValues:
+                values.append((name, self._uniformValues[location], upload))
+        previous = getCurrentProgram()
+        if oldId is not None:
+            lifetime.deleted('program', oldId)
+            gl.glDeleteProgram(oldId)
+        # replacements are kept, since they are to replace the shaders
+        self._detachShaders(stages)
+        self._reflectUniforms()
+        self._reflectUniformBlocks()
+        for name, binding in self.uniformBlockBindings.iteritems():
+            info = self.uniformBlocks.get(name)
+            if info is not None:
+                gl.glUniformBlockBinding(self.id, info.index, binding)
+        for name, value, upload in values:
+            self._setUniform(name, value, upload)
+
+        if oldId is not None and previous == oldId:
+            self.bind()
+        elif previous is not None and getCurrentProgram() != previous:
+            gl.glUseProgram(previous)
+            _setCurrentProgram(previous)
+
+
+    def _reflectAttributes(self):
+        self.attributes = {}
+        count = self._get(gl.GL_ACTIVE_ATTRIBUTES)
+        if count == 0:
+            return
+        maxLength = self._get(gl.GL_ACTIVE_ATTRIBUTE_MAX_LENGTH)
+        buffer = create_string_buffer(maxLength)
+        size = c_int(0)
+        attributeType = c_uint(0)
+        for index in xrange(count):
+            gl.glGetActiveAttrib(self.id, index, maxLength, None,
+                byref(size), byref(attributeType), buffer)
+            name = buffer.value
+            if name.startswith('gl_'):
+                # built in attributes, such as gl_Vertex, have no location
+                continue
+            self.attributes[name] = gl.glGetAttribLocation(self.id, name)
+
+
+    def _getAttributeLocationErrors(self):
+        '''
+        Returns a message listing the attributes not at the locations given
+        by attributeLocations, eg. because of a layout qualifier in the
+        shader, or '' if there are none.
+        '''
+        if not self.attributeLocations:
+            return ''
+        errors = []
+        for name, location in sorted(self.attributes.iteritems()):
+            expected = self.attributeLocations.get(name)
+            if expected is not None and expected != location:
+                errors.append('attribute %s is at location %d, not %d' %
+                    (name, location, expected))
+        return '\n'.join(errors)
+
+
+    def _reflectUniforms(self):
+        self.uniforms = {}
+        self.samplerUnits = {}
+        self._uniformLocations = {}
+        self._uniformValues = {}
+        self._uniformSetters = {}
+        count = self._get(gl.GL_ACTIVE_UNIFORMS)
+        if count == 0:
+            return
+        maxLength = self._get(gl.GL_ACTIVE_UNIFORM_MAX_LENGTH)
+        buffer = create_string_buffer(maxLength)
+        size = c_int(0)
+        uniformType = c_uint(0)
+        for index in xrange(count):
+            gl.glGetActiveUniform(self.id, index, maxLength, None,
+                byref(size), byref(uniformType), buffer)
+            name = buffer.value
+            location = gl.glGetUniformLocation(self.id, name)
+            if name.endswith('[0]'):
+                name = name[:-3]
+            self.uniforms[name] = \
+                Uniform(name, location, uniformType.value, size.value)
+            self._uniformLocations[name] = location
+        self.samplerUnits = assignSamplerUnits(self.uniforms)
+
+
+    def _getUniformBlockParam(self, index, paramId):
+        value = c_int(0)
+        gl.glGetActiveUniformBlockiv(self.id, index, paramId, byref(value))
+        return value.value
+
+
+    def _reflectUniformBlocks(self):
+        self.uniformBlocks = {}
+        if not _haveUniformBlocks():
+            return
+        count = self._get(gl.GL_ACTIVE_UNIFORM_BLOCKS)
+        if count == 0:
+            return
+        maxLength = max(
+            self._get(gl.GL_ACTIVE_UNIFORM_BLOCK_MAX_NAME_LENGTH),
+            self._get(gl.GL_ACTIVE_UNIFORM_MAX_LENGTH))
+        buffer = create_string_buffer(maxLength)
+        for index in xrange(count):
+            gl.glGetActiveUniformBlockName(
+                self.id, index, maxLength, None, buffer)
+            name = buffer.value
+            size = self._getUniformBlockParam(
+                index, gl.GL_UNIFORM_BLOCK_DATA_SIZE)
+
+            numMembers = self._getUniformBlockParam(
+                index, gl.GL_UNIFORM_BLOCK_ACTIVE_UNIFORMS)
+            members = (c_int * numMembers)()
+            gl.glGetActiveUniformBlockiv(self.id, index,
+                gl.GL_UNIFORM_BLOCK_ACTIVE_UNIFORM_INDICES, members)
+            memberIndices = (c_uint * numMembers)(*members)
+            memberOffsets = (c_int * numMembers)()
+            gl.glGetActiveUniformsiv(self.id, numMembers, memberIndices,
+                gl.GL_UNIFORM_OFFSET, memberOffsets)
+
+            offsets = {}
+            for memberIndex, offset in zip(memberIndices, memberOffsets):
+                gl.glGetActiveUniformName(
+                    self.id, memberIndex, maxLength, None, buffer)
+                memberName = buffer.value
+                if memberName.endswith('[0]'):
+                    memberName = memberName[:-3]
+                offsets[memberName] = offset
+            self.uniformBlocks[name] = \
+                UniformBlockInfo(name, index, size, offsets)
+
+
+    def getUniformLocation(self, name):
+        location = self._uniformLocations.get(name)
+        if location is not None:
+            self.uniformHits += 1
+            return location
+        if self.id is None or self._pending:
+            # locations are only known once linked, so set uniforms before
+            # the program is first used by building it now
+            if self.id is None:
+                self.startBuild()
+            self.finishBuild()
+            return self.getUniformLocation(name)
+        # eg. an element of an array uniform, which isn't reflected
+        self.uniformMisses += 1
+        location = gl.glGetUniformLocation(self.id, name)
+        self._uniformLocations[name] = location
+        return location
+
+
+    def _setUniform(self, name, values, upload):
+        location = self.getUniformLocation(name)
+        if location == -1:
+            # not an active uniform, so GL would ignore it anyway
+            return
+        if self._uniformValues.get(location) == values:
+            self.uniformSkips += 1
+            return
+        self._upload(location, values, upload)
+        self._uniformValues[location] = values
+        self._uniformSetters[name] = upload
+        self.uniformUploads += 1
+
+
+    def _upload(self, location, values, upload):
+        self.bind()
+        upload(location, values)
+
+
+    def setUniformf(self, name, *values):
+        if not 1 <= len(values) <= 4:
+            raise ValueError('setUniformf takes 1 to 4 values, not %d' %
+                (len(values),))
+        self._setUniform(name, values, _uploadf)
+
+
+    def setUniformi(self, name, *values):
+        if not 1 <= len(values) <= 4:
+            raise ValueError('setUniformi takes 1 to 4 values, not %d' %
+                (len(values),))
+        self._setUniform(name, values, _uploadi)
+
+
+    def setUniformMatrix(self, name, values, transpose=False):
+        values = _flatten(values)
+        if len(values) not in _uniformMatrixFuncs:
+            raise ValueError('setUniformMatrix takes 4, 9 or 16 values, '
+                'not %d' % (len(values),))
+        self._setUniform(name, (bool(transpose),) + values, _uploadMatrix)
+
+
+    def bind(self):
+        if getCurrentProgram() != self.id:
+            gl.glUseProgram(self.id)
+            _setCurrentProgram(self.id)
+            if stats is not None:
+                stats.bound(self, False)
+        elif stats is not None:
+            stats.bound(self, True)
+
+
+    def _deleteProgram(self):
+        if self.id is not None:
+            lifetime.deleted('program', self.id)
+            gl.glDeleteProgram(self.id)
+            if getCurrentProgram() == self.id:
+                _setCurrentProgram(None)
+            self.id = None
+
+
+    def delete(self):
+        self._deleteProgram()
+        self._pending = False
+        for shader in self.shaders:
+            shader.release()
+        self.shaders = []
+
+
+    def use(self):
+        if self.id is None:
+            self.startBuild()
+        message = self.finishBuild()
+        self.bind()
+        return message
+
+
+
+# The upload functions set a uniform of the program in use, or with a
+# programId, of that program, with glProgramUniform*, without binding it
+
+def _uploadf(location, values, programId=None):
+    if programId is None:
+        getattr(gl, 'glUniform%df' % (len(values),))(location, *values)
+    else:
+        getattr(gl, 'glProgramUniform%df' % (len(values),))(
+            programId, location, *values)
+
+
+def _uploadi(location, values, programId=None):
+    if programId is None:
+        getattr(gl, 'glUniform%di' % (len(values),))(location, *values)
+    else:
+        getattr(gl, 'glProgramUniform%di' % (len(values),))(
+            programId, location, *values)
+
+
+def _uploadMatrix(location, values, programId=None):
+    transpose, values = values[0], values[1:]
+    name = _uniformMatrixFuncs[len(values)]
+    array = (c_float * len(values))(*values)
+    if programId is None:
+        getattr(gl, name)(location, 1, transpose, array)
+    else:
+        getattr(gl, name.replace('glUniform', 'glProgramUniform'))(
+            programId, location, 1, transpose, array)
@@ -0,0 +1,181 @@
+'''
+Optional instrumentation of shader compiles, program links and binds.
+
+Stats are off by default, and cost shader.py one test of a global per
+instrumented call. Once enabled, they record for each shader stage the
+number of compiles and the wall time spent compiling, and for each program
+the number of links, the wall time spent linking, the number of binds and
+of redundant binds (those skipped since the program was already bound).
+Info log fetches are counted for both.
+
+Compile and link times include both issuing the work and waiting for it to
+finish, but not time the driver spends compiling in the background while
+the application does other work.
+
+Shaders and programs are identified by their 'name' attribute, if set, or
+otherwise by their class and a hash of their sources, so that figures from
+different runs can be compared.
+'''
+
+try:
+    from time import perf_counter
+except ImportError:
+    from timeit import default_timer as perf_counter
+
+import shader
+
+
+class StageStats(object):
+
+    def __init__(self):
+        self.compiles = 0
+        self.compileTime = 0.0
+        self.infoLogFetches = 0
+
+
+    def asDict(self):
+        return {
+            'compiles': self.compiles,
+            'compileTime': self.compileTime,
+            'infoLogFetches': self.infoLogFetches,
+        }
+
+
+
+class ProgramStats(object):
+
+    def __init__(self):
+        self.links = 0
+        self.linkTime = 0.0
+        self.binds = 0
+        self.redundantBinds = 0
+        self.infoLogFetches = 0
+
+
+    def asDict(self):
+        return {
+            'links': self.links,
+            'linkTime': self.linkTime,
+            'binds': self.binds,
+            'redundantBinds': self.redundantBinds,
+            'infoLogFetches': self.infoLogFetches,
+        }
+
+
+
+class ShaderStats(object):
+
+    def __init__(self, hook=None, clock=perf_counter):
+        # called with each snapshot passed to push()
+        self.hook = hook
+        self.clock = clock
+        self.stages = {}
+        self.programs = {}
+
+
+    def _getStage(self, shader):
+        name = shader.getName()
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats()
+        return stage
+
+
+    def _getProgram(self, program):
+        name = program.getName()
+        entry = self.programs.get(name)
+        if entry is None:
+            entry = self.programs[name] = ProgramStats()
+        return entry
+
+
+    def compileStarted(self, shader, seconds):
+        stage = self._getStage(shader)
+        stage.compiles += 1
+        stage.compileTime += seconds
+
+
+    def addCompileTime(self, shader, seconds):
+        self._getStage(shader).compileTime += seconds
+
+
+    def linkStarted(self, program, seconds):
+        entry = self._getProgram(program)
+        entry.links += 1
+        entry.linkTime += seconds
+
+
+    def addLinkTime(self, program, seconds):
+        self._getProgram(program).linkTime += seconds
+
+
+    def bound(self, program, redundant):
+        entry = self._getProgram(program)
+        if redundant:
+            entry.redundantBinds += 1
+        else:
+            entry.binds += 1
+
+
+    def infoLogFetched(self, shaderOrProgram):
+        if isinstance(shaderOrProgram, shader.ShaderProgram):
+            self._getProgram(shaderOrProgram).infoLogFetches += 1
+        else:
+            self._getStage(shaderOrProgram).infoLogFetches += 1
+
+
+    def snapshot(self):
+        '''
+        Returns the stats so far, as a dict of plain values, suitable for
+        serializing as JSON.
+        '''
+        stages = dict(
+            (name, stage.asDict()) for name, stage in self.stages.iteritems())
+        programs = dict(
+            (name, entry.asDict()) for name, entry in self.programs.iteritems())
+        totals = {
+            'compiles': sum(s['compiles'] for s in stages.itervalues()),
+            'compileTime': sum(s['compileTime'] for s in stages.itervalues()),
+            'links': sum(p['links'] for p in programs.itervalues()),
+            'linkTime': sum(p['linkTime'] for p in programs.itervalues()),
+            'binds': sum(p['binds'] for p in programs.itervalues()),
+            'redundantBinds':
+                sum(p['redundantBinds'] for p in programs.itervalues()),
+            'infoLogFetches':
+                sum(s['infoLogFetches'] for s in stages.itervalues()) +
+                sum(p['infoLogFetches'] for p in programs.itervalues()),
+        }
+        return {'stages': stages, 'programs': programs, 'totals': totals}
+
+
+    def push(self, reset=False):
+        '''
+        Pass a snapshot to the hook, if there is one, eg. once per frame or
+        once after start up. If reset is true, the stats are then cleared,
+        so that each snapshot covers only the time since the last.
+        '''
+        snapshot = self.snapshot()
+        if self.hook is not None:
+            self.hook(snapshot)
+        if reset:
+            self.reset()
+        return snapshot
+
+
+    def reset(self):
+        self.stages = {}
+        self.programs = {}
+
+
+
+def enableStats(hook=None, clock=perf_counter):
+    '''
+    Start recording stats for all shaders and programs. Returns the
+    ShaderStats that records them.
+    '''
+    shader.stats = ShaderStats(hook, clock)
+    return shader.stats
+
+
+def disableStats():
+    shader.stats = None
@@ -0,0 +1,258 @@
+'''
+A ring buffer for data which changes every frame, such as dynamic vertices
+and per frame uniform blocks, which allocates one large buffer up front
+rather than calling glBufferData each frame.
+
+The buffer is split into a region for each of the frames which may be in
+flight at once. Each frame writes into the next region in turn:
+
+    stream = StreamBuffer(4 << 20)
+    particles.setAttribute('position', stream, 3)
+    while running:
+        stream.beginFrame()
+        first = stream.writeVertices(positions, 12)
+        stream.writeUniformBlock(camera)
+        particles.draw(gl.GL_POINTS, first, len(positions))
+        stream.endFrame()
+
+Where GL_ARB_buffer_storage is available, the buffer is persistently mapped,
+so writes go straight into GL's memory through a NumPy view of it. A fence
+placed at the end of each frame guards its region, and beginFrame() waits
+on it only if the GPU is still reading that region, a frame count ago.
+Elsewhere, writes go to a NumPy staging copy and are sent with
+glBufferSubData, and the buffer is orphaned each time the ring wraps, so GL
+can give it fresh storage rather than wait for draws using the old.
+
+Requires NumPy.
+'''
+
+from ctypes import byref, c_int, c_uint, c_void_p, c_ubyte, memmove
+
+import numpy
+
+from glbackend import getGl
+from glerrors import GLError
+import lifetime
+from shaderstats import perf_counter
+from vertexbuffer import getBufferAddress
+
+
+gl = getGl()
+
+
+# from GL_ARB_buffer_storage, which pyglet doesn't define
+GL_MAP_PERSISTENT_BIT = 0x0040
+GL_MAP_COHERENT_BIT = 0x0080
+
+# nanoseconds to wait on a fence before checking it again
+WAIT_TIMEOUT = 1000000000
+
+# offsets of regions, and of vertex and uniform writes, are rounded up to
+# multiples of this, more than any GL implementation requires
+REGION_ALIGNMENT = 256
+
+
+def _roundUp(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+
+class StreamBuffer(object):
+
+    def __init__(self, size, frames=3, target=gl.GL_ARRAY_BUFFER,
+        persistent=None, clock=perf_counter):
+        '''
+        Allocate size bytes, split between the given number of frames.
+        persistent chooses whether to map the buffer persistently, by
+        default if GL_ARB_buffer_storage is available.
+        '''
+        self.frames = frames
+        self.regionSize = size // frames // REGION_ALIGNMENT * REGION_ALIGNMENT
+        if self.regionSize == 0:
+            raise ValueError('stream buffer of %d bytes is too small for %d '
+                'frames' % (size, frames))
+        self.size = self.regionSize * frames
+        self.target = target
+        if persistent is None:
+            persistent = gl.gl_info.have_extension('GL_ARB_buffer_storage')
+        self.persistent = persistent
+        self.clock = clock
+        self.id = None
+        # index of the region being written, and bytes written to it
+        self.region = frames - 1
+        self.used = 0
+        # bytes of the current region sent to GL, without persistent mapping
+        self.flushed = 0
+        self.fences = [None] * frames
+        self.uniformAlignment = None
+        self.bytesWritten = 0
+        self.waits = 0
+        self.waitTime = 0.0
+        self.orphans = 0
+        self._create()
+
+
+    def _create(self):
+        bufferId = c_uint(0)
+        gl.glGenBuffers(1, byref(bufferId))
+        self.id = bufferId.value
+        lifetime.created('buffer', self.id, self)
+        self.bind()
+        if self.persistent:
+            flags = gl.GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | \
+                GL_MAP_COHERENT_BIT
+            bufferStorage = gl.lib.link_GL('glBufferStorage', None,
+                [c_uint, c_int, c_void_p, c_uint])
+            bufferStorage(self.target, self.size, None, flags)
+            address = gl.glMapBufferRange(self.target, 0, self.size, flags)
+            self.memory = numpy.ctypeslib.as_array(
+                (c_ubyte * self.size).from_address(address))
+        else:
+            gl.glBufferData(self.target, self.size, None, gl.GL_STREAM_DRAW)
+            self.memory = numpy.zeros(self.size, numpy.uint8)
+
+
+    def bind(self):
+        gl.glBindBuffer(self.target, self.id)
+
+
+    def getRegionStart(self):
+        return self.region * self.regionSize
+
+
+    def beginFrame(self):
+        '''
+        Move on to the next region, waiting until the GPU has finished with
+        it if need be.
+        '''
+        self.region = (self.region + 1) % self.frames
+        self.used = self.flushed = 0
+        fence = self.fences[self.region]
+        if fence is not None:
+            self._wait(fence)
+            gl.glDeleteSync(fence)
+            self.fences[self.region] = None
+        if not self.persistent and self.region == 0:
+            # orphan the buffer, rather than overwrite data still in use
+            self.bind()
+            gl.glBufferData(self.target, self.size, None, gl.GL_STREAM_DRAW)
+            self.orphans += 1
+
+
+    def _wait(self, fence):
+        result = gl.glClientWaitSync(fence, 0, 0)
+        if result in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED):
+            return
+        self.waits += 1
+        start = self.clock()
+        while result == gl.GL_TIMEOUT_EXPIRED:
+            result = gl.glClientWaitSync(
+                fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, WAIT_TIMEOUT)
+        self.waitTime += self.clock() - start
+        if result == gl.GL_WAIT_FAILED:
+            raise GLError('waiting for stream buffer region %d failed' %
+                (self.region,))
+
+
+    def allocate(self, size, alignment=1):
+        '''
+        Reserve size bytes of the current region, returning their offset in
+        the buffer and a NumPy uint8 view of them to write into, eg. after
+        view.view(numpy.float32). Without persistent mapping, call flush()
+        once they are written.
+        '''
+        regionStart = self.getRegionStart()
+        # align the offset in the buffer, since regions start at multiples
+        # of REGION_ALIGNMENT, not of every alignment, eg. a vertex stride
+        start = _roundUp(regionStart + self.used, alignment)
+        offset = start - regionStart
+        if offset + size > self.regionSize:
+            raise ValueError('%d bytes at offset %d overflows stream buffer '
+                'region of %d' % (size, offset, self.regionSize))
+        self.used = offset + size
+        self.bytesWritten += size
+        return start, self.memory[start:start + size]
+
+
+    def write(self, data, alignment=1):
+        '''
+        Copy any buffer protocol object, such as a NumPy array, into the
+        current region, returning its offset in the buffer.
+        '''
+        address, size = getBufferAddress(data)
+        offset, view = self.allocate(size, alignment)
+        memmove(view.ctypes.data, address, size)
+        self.flush()
+        return offset
+
+
+    def flush(self):
+        '''
+        Send the bytes written since the last flush to GL, if not mapped
+        persistently.
+        '''
+        if self.persistent or self.flushed == self.used:
+            return
+        start = self.getRegionStart() + self.flushed
+        self.bind()
+        gl.glBufferSubData(self.target, start, self.used - self.flushed,
+            self.memory.ctypes.data + start)
+        self.flushed = self.used
+
+
+    def writeVertices(self, data, stride):
+        '''
+        Write vertices of stride bytes each, returning the index of the
+        first, to draw them from an attribute sourced from this buffer.
+        '''
+        return self.write(data, stride) // stride
+
+
+    def writeUniformBlock(self, block):
+        '''
+        Write the values of a uniformblock.UniformBlock, and bind them to
+        its binding point, in place of the block's own buffer.
+        '''
+        if self.uniformAlignment is None:
+            alignment = c_int(0)
+            gl.glGetIntegerv(gl.GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT,
+                byref(alignment))
+            self.uniformAlignment = max(alignment.value, 1)
+        offset = self.write(block.data, self.uniformAlignment)
+        gl.glBindBufferRange(gl.GL_UNIFORM_BUFFER, block.binding, self.id,
+            offset, block.size)
+        return offset
+
+
+    def endFrame(self):
+        '''
+        Call after the last draw using the current region.
+        '''
+        self.flush()
+        if self.persistent:
+            self.fences[self.region] = gl.glFenceSync(
+                gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+
+    def getMetrics(self):
+        return {
+            'bytesWritten': self.bytesWritten,
+            'waits': self.waits,
+            'waitTime': self.waitTime,
+            'orphans': self.orphans,
+        }
+
+
+    def delete(self):
+        for index, fence in enumerate(self.fences):
+            if fence is not None:
+                gl.glDeleteSync(fence)
+                self.fences[index] = None
+        if self.id is not None:
+            if self.persistent:
+                self.bind()
+                gl.glUnmapBuffer(self.target)
+            self.memory = None
+            gl.glDeleteBuffers(1, byref(c_uint(self.id)))
+            lifetime.deleted('buffer', self.id)
+            self.id = None
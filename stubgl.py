@@ -0,0 +1,107 @@
+'''
+A stand in for pyglet.gl whose functions do nothing, as cheaply as possible,
+so that benchmarks measure only the Python and ctypes overhead of the code
+calling them, and so that scenes can be run, eg. under a glrecorder, on
+machines with no GPU. Unlike the Mock used by the tests, it records nothing.
+'''
+
+import glconstants
+
+
+def _doNothing(*_):
+    return None
+
+
+
+class _Context(object):
+    pass
+
+
+
+class _GlInfo(object):
+
+    def have_extension(self, name):
+        return False
+
+    def have_version(self, major, minor=0, release=0):
+        return (major, minor, release) <= (3, 3, 0)
+
+    def get_vendor(self):
+        return 'stub'
+
+    def get_renderer(self):
+        return 'stub'
+
+    def get_version(self):
+        return '3.3'
+
+
+
+class StubGl(object):
+
+    def __init__(self, infoLog=''):
+        for name in dir(glconstants):
+            if name.startswith('GL_'):
+                setattr(self, name, getattr(glconstants, name))
+        self.current_context = _Context()
+        self.gl_info = _GlInfo()
+        self.infoLog = infoLog
+        self.nextId = 1
+        self.params = {
+            glconstants.GL_COMPILE_STATUS: 1,
+            glconstants.GL_LINK_STATUS: 1,
+            glconstants.GL_INFO_LOG_LENGTH: len(infoLog) + 1 if infoLog else 0,
+        }
+
+
+    def __getattr__(self, name):
+        if not name.startswith('gl'):
+            raise AttributeError(name)
+        # cache it on the class, so __getattr__ is only called once per
+        # function, rather than once per function for each StubGl
+        setattr(StubGl, name, staticmethod(_doNothing))
+        return _doNothing
+
+
+    def _newId(self, *_):
+        self.nextId += 1
+        return self.nextId - 1
+
+
+    glCreateShader = _newId
+    glCreateProgram = _newId
+
+
+    def _genIds(self, count, p_ids):
+        p_ids._obj.value = self._newId()
+
+
+    glGenBuffers = _genIds
+    glGenVertexArrays = _genIds
+    glGenTextures = _genIds
+    glGenFramebuffers = _genIds
+    glGenRenderbuffers = _genIds
+
+
+    def glCheckFramebufferStatus(self, target):
+        return glconstants.GL_FRAMEBUFFER_COMPLETE
+
+
+    def _getParam(self, _, paramId, p_value):
+        p_value._obj.value = self.params.get(paramId, 0)
+
+
+    glGetShaderiv = _getParam
+    glGetProgramiv = _getParam
+
+
+    def _getInfoLog(self, _, length, __, buffer):
+        buffer.value = self.infoLog
+
+
+    glGetShaderInfoLog = _getInfoLog
+    glGetProgramInfoLog = _getInfoLog
+
+
+    def glGetUniformLocation(self, _, name):
+        return 0
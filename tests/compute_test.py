@@ -0,0 +1,162 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+import numpy
+
+from mock import Mock, patch
+
+import fixpath
+
+import compute
+from compute import (
+    ComputeProgram, DEFAULT_BARRIERS, GL_SHADER_STORAGE_BUFFER, StorageBuffer,
+)
+from shader import ComputeShader, GL_COMPUTE_SHADER
+
+
+def mockGenId(newId):
+    def _mockGenId(_, p_id):
+        p_id._obj.value = newId
+    return _mockGenId
+
+
+def createProgram(workGroupSize=(64, 1, 1)):
+    program = ComputeProgram(ComputeShader('void main() {}'))
+    program.id = 3
+    program.bind = Mock()
+    program.finishBuild = Mock()
+    program._workGroupSize = workGroupSize
+    return program
+
+
+class StorageBufferTest(TestCase):
+
+    @patch('vertexbuffer.gl')
+    @patch('compute.gl')
+    def testCreateBindsToBindingPoint(self, mockGl, mockVertexGl):
+        mockVertexGl.glGenBuffers.side_effect = mockGenId(4)
+        data = numpy.arange(8, dtype=numpy.float32)
+
+        buffer = StorageBuffer(data, binding=2)
+
+        self.assertEquals(buffer.size, 32)
+        self.assertEquals(mockVertexGl.glBufferData.call_args[0][:3],
+            (GL_SHADER_STORAGE_BUFFER, 32, data.ctypes.data))
+        self.assertEquals(mockGl.glBindBufferBase.call_args,
+            ((GL_SHADER_STORAGE_BUFFER, 2, 4), {}))
+
+
+    @patch('vertexbuffer.gl')
+    @patch('compute.gl')
+    def testReadCopiesIntoArrayWithoutIntermediateObject(self, mockGl, _):
+        data = numpy.zeros(4, dtype=numpy.float32)
+        buffer = StorageBuffer(data, binding=0)
+        def mockGetBufferSubData(target, offset, size, address):
+            results = numpy.arange(4, dtype=numpy.float32)
+            numpy.ctypeslib.as_array(
+                (numpy.ctypeslib.ctypes.c_float * 4).from_address(address)
+            )[:] = results
+        mockGl.glGetBufferSubData.side_effect = mockGetBufferSubData
+
+        result = buffer.read()
+
+        self.assertTrue(result is buffer.data)
+        self.assertEquals(list(result), [0, 1, 2, 3])
+        out = numpy.zeros(4, dtype=numpy.int32)
+        self.assertTrue(buffer.read(out) is out)
+        self.assertRaises(ValueError, buffer.read, numpy.zeros(3))
+
+
+    @patch('vertexbuffer.gl')
+    @patch('compute.gl')
+    def testMappedYieldsViewOfMappedMemory(self, mockGl, _):
+        dtype = numpy.dtype([('position', numpy.float32, 2),
+            ('mass', numpy.float32)])
+        buffer = StorageBuffer(numpy.zeros(3, dtype), binding=1)
+        memory = numpy.zeros(3, dtype)
+        memory['mass'] = (1, 2, 3)
+        mockGl.glMapBufferRange.return_value = memory.ctypes.data
+
+        with buffer.mapped() as view:
+            self.assertEquals(view['mass'].sum(), 6)
+            self.assertEquals(view.shape, (3,))
+            view['mass'][0] = 5
+            self.assertFalse(mockGl.glUnmapBuffer.called)
+
+        self.assertEquals(memory['mass'][0], 5)
+        self.assertEquals(mockGl.glMapBufferRange.call_args,
+            ((GL_SHADER_STORAGE_BUFFER, 0, 36, gl.GL_MAP_READ_BIT), {}))
+        self.assertEquals(mockGl.glUnmapBuffer.call_args,
+            ((GL_SHADER_STORAGE_BUFFER,), {}))
+
+
+
+class ComputeProgramTest(TestCase):
+
+    def setUp(self):
+        # forget the glDispatchCompute of the previous test's mock
+        compute._dispatchCompute = None
+
+
+    def testShaderType(self):
+        self.assertEquals(ComputeShader.type, GL_COMPUTE_SHADER)
+
+
+    @patch('compute.gl')
+    def testDispatchIssuesBarrier(self, mockGl):
+        program = createProgram()
+
+        program.dispatch(4, 2)
+
+        self.assertTrue(program.bind.called)
+        self.assertEquals(mockGl.glDispatchCompute.call_args, ((4, 2, 1), {}))
+        self.assertEquals(mockGl.glMemoryBarrier.call_args,
+            ((DEFAULT_BARRIERS,), {}))
+
+
+    def testDispatchLinksFunctionMissingFromPyglet(self):
+        mockGl = Mock(spec=['lib', 'glMemoryBarrier'])
+        dispatch = Mock()
+        mockGl.lib.link_GL.return_value = dispatch
+        program = createProgram()
+
+        with patch('compute.gl', mockGl):
+            program.dispatch(1, barriers=0)
+            program.dispatch(2, barriers=0)
+
+        self.assertEquals(mockGl.lib.link_GL.call_count, 1)
+        self.assertEquals(mockGl.lib.link_GL.call_args[0][0],
+            'glDispatchCompute')
+        self.assertEquals(dispatch.call_args, ((2, 1, 1), {}))
+        self.assertFalse(mockGl.glMemoryBarrier.called)
+
+
+    @patch('compute.gl')
+    def testDispatchItemsRoundsUpToWorkGroups(self, mockGl):
+        program = createProgram((64, 4, 1))
+
+        program.dispatchItems(1000, 9)
+
+        self.assertEquals(mockGl.glDispatchCompute.call_args, ((16, 3, 1), {}))
+
+
+    @patch('compute.gl')
+    def testWorkGroupSizeIsQueriedOnce(self, mockGl):
+        def mockGetProgramiv(_, paramId, size):
+            size[0], size[1], size[2] = 8, 8, 1
+        mockGl.glGetProgramiv.side_effect = mockGetProgramiv
+        program = createProgram(None)
+
+        self.assertEquals(program.getWorkGroupSize(), (8, 8, 1))
+        self.assertEquals(program.getWorkGroupSize(), (8, 8, 1))
+        self.assertEquals(mockGl.glGetProgramiv.call_count, 1)
+
+
+
+if __name__ == '__main__':
+    main()
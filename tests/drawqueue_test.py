@@ -0,0 +1,238 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from drawqueue import DrawQueue, setUniform
+from shader import Uniform
+from textures import getTextureUnits
+
+
+def createProgram(name, uniforms=()):
+    program = Mock()
+    program.name = name
+    program.uniforms = dict(
+        (uniform.name, uniform) for uniform in uniforms)
+    return program
+
+
+def createGeometry(name, log):
+    geometry = Mock()
+    geometry.name = name
+    geometry.drawBound.side_effect = \
+        lambda mode, first, count, instances: log.append(name)
+    return geometry
+
+
+class DrawQueueTest(TestCase):
+
+    def setUp(self):
+        self.drawn = []
+        self.programs = [createProgram('p0'), createProgram('p1')]
+        self.geometries = [
+            createGeometry('g0', self.drawn),
+            createGeometry('g1', self.drawn),
+        ]
+
+
+    @patch('drawqueue.gl')
+    def testSortsByProgram(self, mockGl):
+        queue = DrawQueue()
+        p0, p1 = self.programs
+        g0, g1 = self.geometries
+        for _ in xrange(3):
+            queue.submit(p0, g0)
+            queue.submit(p1, g1)
+
+        stats = queue.flush()
+
+        self.assertEquals(self.drawn, ['g0'] * 3 + ['g1'] * 3)
+        self.assertEquals(p0.use.call_count, 1)
+        self.assertEquals(p1.use.call_count, 1)
+        self.assertEquals(g0.bind.call_count, 1)
+        self.assertEquals(stats, {
+            'draws': 6,
+            'programSwitches': 2,
+            'textureSwitches': 0,
+            'geometrySwitches': 2,
+            'switchesSaved': 8,
+        })
+        self.assertEquals(queue.items, [])
+
+
+    @patch('textures.gl')
+    def testBindsTexturesOnlyWhenChanged(self, mockGl):
+        mockGl.GL_TEXTURE0 = gl.GL_TEXTURE0
+        queue = DrawQueue()
+        program = self.programs[0]
+        geometry = self.geometries[0]
+        queue.submit(program, geometry, textures=[(3553, 1), (3553, 2)])
+        queue.submit(program, geometry, textures=[(3553, 5)])
+        queue.submit(program, geometry, textures=[(3553, 1), (3553, 2)])
+
+        stats = queue.flush()
+
+        self.assertEquals(mockGl.glBindTexture.call_args_list, [
+            ((3553, 1), {}), ((3553, 2), {}), ((3553, 5), {}),
+        ])
+        self.assertEquals(mockGl.glActiveTexture.call_args_list, [
+            ((gl.GL_TEXTURE0,), {}),
+            ((gl.GL_TEXTURE0 + 1,), {}),
+            ((gl.GL_TEXTURE0,), {}),
+        ])
+        self.assertEquals(stats['textureSwitches'], 3)
+        self.assertEquals(stats['switchesSaved'], 1)
+
+
+    @patch('textures.gl')
+    def testBindsNamedTexturesToProgramSamplerUnits(self, mockGl):
+        mockGl.GL_TEXTURE0 = gl.GL_TEXTURE0
+        queue = DrawQueue()
+        program = self.programs[0]
+        program.samplerUnits = {'diffuse': 0, 'normals': 1}
+        geometry = self.geometries[0]
+        queue.submit(program, geometry,
+            textures={'normals': (3553, 7), 'diffuse': (3553, 8)})
+        queue.submit(program, geometry, textures={'normals': (3553, 7)})
+
+        stats = queue.flush()
+
+        self.assertEquals(sorted(program.setUniformi.call_args_list), [
+            (('diffuse', 0), {}), (('normals', 1), {}),
+            (('normals', 1), {}),
+        ])
+        self.assertEquals(mockGl.glActiveTexture.call_args_list, [
+            ((gl.GL_TEXTURE0,), {}), ((gl.GL_TEXTURE0 + 1,), {}),
+        ])
+        self.assertEquals(mockGl.glBindTexture.call_args_list, [
+            ((3553, 8), {}), ((3553, 7), {}),
+        ])
+        self.assertEquals(stats['textureSwitches'], 2)
+        # the texture units manager knows what the queue bound
+        units = getTextureUnits()
+        self.assertEquals(units.textures, {0: (3553, 8), 1: (3553, 7)})
+        units.bindTexture(1, 3553, 7)
+        self.assertEquals(mockGl.glBindTexture.call_count, 2)
+
+
+    @patch('drawqueue.gl')
+    def testTransparentDrawsAreOrderedByDepth(self, mockGl):
+        queue = DrawQueue()
+        p0, p1 = self.programs
+        log = self.drawn
+        far, near, middle, opaque, sky = [createGeometry(name, log)
+            for name in ['far', 'near', 'middle', 'opaque', 'sky']]
+        queue.submit(p0, near, transparent=True, depth=1.0)
+        queue.submit(p1, far, transparent=True, depth=9.0)
+        queue.submit(p0, middle, transparent=True, depth=5.0)
+        queue.submit(p1, opaque)
+        queue.submit(p0, sky, layer=-1)
+
+        stats = queue.flush()
+
+        self.assertEquals(self.drawn, ['sky', 'opaque', 'far', 'middle', 'near'])
+        self.assertEquals(stats['programSwitches'], 3)
+
+
+    @patch('drawqueue.gl')
+    def testSetsUniformsForEachDraw(self, mockGl):
+        queue = DrawQueue()
+        program = createProgram('p', [
+            Uniform('scale', -1, gl.GL_FLOAT, 1),
+            Uniform('count', -1, gl.GL_INT, 1),
+        ])
+        geometry = self.geometries[0]
+        queue.submit(program, geometry, uniforms={'scale': 1})
+        queue.submit(program, geometry, uniforms={'scale': 2, 'count': 3})
+
+        queue.flush()
+
+        self.assertEquals(program.setUniformf.call_args_list,
+            [(('scale', 1), {}), (('scale', 2), {})])
+        self.assertEquals(program.setUniformi.call_args_list,
+            [(('count', 3), {})])
+        self.assertEquals(self.drawn, ['g0', 'g0'])
+
+
+
+class SetUniformTest(TestCase):
+
+    def testSetsElementsOfArrays(self):
+        program = createProgram('p', [
+            Uniform('weights', -1, gl.GL_FLOAT, 3),
+            Uniform('lights', -1, gl.GL_FLOAT_VEC3, 2),
+            Uniform('bones', -1, gl.GL_FLOAT_MAT2, 2),
+        ])
+
+        setUniform(program, 'weights', [0.5, 0.25, 0.25])
+        setUniform(program, 'lights', [(1, 0, 0), (0, 1, 0)])
+        setUniform(program, 'bones', [[1, 0, 0, 1], [0, 1, 1, 0]])
+
+        self.assertEquals(program.setUniformf.call_args_list, [
+            (('weights[0]', 0.5), {}), (('weights[1]', 0.25), {}),
+            (('weights[2]', 0.25), {}),
+            (('lights[0]', 1, 0, 0), {}), (('lights[1]', 0, 1, 0), {}),
+        ])
+        self.assertEquals(program.setUniformMatrix.call_args_list, [
+            (('bones[0]', [1, 0, 0, 1]), {}), (('bones[1]', [0, 1, 1, 0]), {}),
+        ])
+        self.assertRaises(ValueError,
+            setUniform, program, 'weights', [1, 2, 3, 4])
+        self.assertRaises(ValueError, setUniform, program, 'weights', 1.0)
+
+
+    def testRejectsTypesWithoutSetter(self):
+        program = createProgram('p', [
+            Uniform('transform', -1, gl.GL_FLOAT_MAT3x4, 1),
+            Uniform('mask', -1, gl.GL_UNSIGNED_INT, 1),
+        ])
+
+        self.assertRaises(ValueError,
+            setUniform, program, 'transform', range(12))
+        self.assertRaises(ValueError, setUniform, program, 'mask', 3)
+        self.assertFalse(program.setUniformi.called)
+        self.assertFalse(program.setUniformMatrix.called)
+
+
+    def testUsesReflectedType(self):
+        program = createProgram('p', [
+            Uniform('transform', -1, gl.GL_FLOAT_MAT2, 1),
+            Uniform('color', -1, gl.GL_FLOAT_VEC3, 1),
+            Uniform('texture', -1, gl.GL_SAMPLER_2D, 1),
+        ])
+
+        setUniform(program, 'transform', [1, 0, 0, 1])
+        setUniform(program, 'color', (1, 0, 0))
+        setUniform(program, 'texture', 2)
+
+        self.assertEquals(program.setUniformMatrix.call_args,
+            (('transform', [1, 0, 0, 1]), {}))
+        self.assertEquals(program.setUniformf.call_args,
+            (('color', 1, 0, 0), {}))
+        self.assertEquals(program.setUniformi.call_args, (('texture', 2), {}))
+
+
+    def testGuessesTypeOfUnreflectedUniforms(self):
+        program = createProgram('p')
+
+        setUniform(program, 'lights[0]', (1.0, 0, 0))
+        setUniform(program, 'counts[1]', 3)
+        setUniform(program, 'bones[2]', [[1, 0], [0, 1]])
+
+        self.assertEquals(program.setUniformf.call_args,
+            (('lights[0]', 1.0, 0, 0), {}))
+        self.assertEquals(program.setUniformi.call_args, (('counts[1]', 3), {}))
+        self.assertEquals(program.setUniformMatrix.call_args,
+            (('bones[2]', [[1, 0], [0, 1]]), {}))
+
+
+
+if __name__ == '__main__':
+    main()
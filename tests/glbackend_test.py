@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from ctypes import CDLL, c_long
+import os
+from subprocess import PIPE, Popen
+import sys
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+import glbackend
+from glbackend import LeanGl, select
+from stubgl import StubGl
+
+
+def raiseError(result, func, arguments):
+    raise AssertionError('errcheck called')
+
+
+class GlBackendTest(TestCase):
+
+    @patch('glbackend._gl', None)
+    def testSelectByName(self):
+        gl = select('fake')
+
+        self.assertTrue(isinstance(gl, StubGl))
+        self.assertTrue(glbackend.getGl() is gl)
+
+
+    @patch('glbackend._gl', None)
+    def testSelectObject(self):
+        gl = Mock()
+
+        self.assertTrue(select(gl) is gl)
+        self.assertTrue(glbackend.getGl() is gl)
+
+
+    @patch('glbackend._gl', None)
+    def testSelectUnknown(self):
+        self.assertRaises(ValueError, select, 'opengl')
+
+
+    @patch('glbackend._gl', None)
+    def testSelectFromEnvironment(self):
+        with patch('glbackend.os.environ', {'SHADER_GL_BACKEND': 'fake'}):
+            self.assertTrue(isinstance(glbackend.getGl(), StubGl))
+
+
+    def testFakeBackendDoesNotImportPyglet(self):
+        script = (
+            'import glbackend\n'
+            'glbackend.select("fake")\n'
+            'import shader, programcache, uniformblock, vertexbuffer\n'
+            'import compute, instancing, lifetime, pipeline, rendertarget\n'
+            'import streambuffer, textures\n'
+            'import sys\n'
+            'print "pyglet" in sys.modules\n'
+        )
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.join(os.path.dirname(__file__), '..')
+        process = Popen([sys.executable, '-c', script], stdout=PIPE, env=env)
+        output, _ = process.communicate()
+
+        self.assertEquals(output.strip(), 'False')
+
+
+
+class LeanGlTest(TestCase):
+
+    def createFunction(self):
+        function = CDLL(None).labs
+        function.restype = c_long
+        function.argtypes = [c_long]
+        function.errcheck = raiseError
+        return function
+
+
+    def testCallsFunctionsWithoutErrcheck(self):
+        gl = Mock()
+        gl.glLabs = self.createFunction()
+        lean = LeanGl(gl)
+
+        self.assertEquals(lean.glLabs(-3), 3)
+        self.assertRaises(AssertionError, gl.glLabs, -3)
+
+
+    def testCachesFunctionsAndConstants(self):
+        gl = Mock()
+        gl.glLabs = self.createFunction()
+        gl.GL_TRIANGLES = 4
+        lean = LeanGl(gl)
+
+        function = lean.glLabs
+        self.assertEquals(lean.GL_TRIANGLES, 4)
+        gl.glLabs = None
+        gl.GL_TRIANGLES = None
+
+        self.assertTrue(lean.glLabs is function)
+        self.assertEquals(lean.GL_TRIANGLES, 4)
+
+
+    def testOtherAttributesAreNotCached(self):
+        gl = Mock()
+        gl.current_context = 1
+        lean = LeanGl(gl)
+
+        self.assertEquals(lean.current_context, 1)
+        gl.current_context = 2
+        self.assertEquals(lean.current_context, 2)
+
+
+    def testPassesOtherCallablesThrough(self):
+        gl = Mock()
+        lean = LeanGl(gl)
+
+        self.assertTrue(lean.glMissing is gl.glMissing)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+import shader
+from glerrors import (
+    CALL, CALLBACK, CheckingGl, ErrorPolicy, FRAME, GL_DEBUG_OUTPUT,
+    GL_DEBUG_TYPE_ERROR, GLError,
+)
+from shader import ShaderProgram
+
+
+def mockGetError(errors):
+    errors = list(errors)
+    def _mockGetError():
+        if errors:
+            return errors.pop(0)
+        return 0
+    return _mockGetError
+
+
+def createGl(errors=(), debug=False):
+    gl = Mock()
+    gl.glGetError.side_effect = mockGetError(errors)
+    gl.gl_info.have_extension.return_value = debug
+    return gl
+
+
+class CheckingGlTest(TestCase):
+
+    def testRaisesAfterFailingCall(self):
+        gl = createGl([0, 0x502])
+        checking = CheckingGl(gl)
+
+        checking.glUseProgram(1)
+        try:
+            checking.glUseProgram(2)
+        except GLError, e:
+            self.assertEquals(str(e),
+                'GL_INVALID_OPERATION from glUseProgram(2,)')
+        else:
+            self.fail('GLError not raised')
+        self.assertEquals(gl.glUseProgram.call_args_list,
+            [((1,), {}), ((2,), {})])
+
+
+    def testPassesOtherAttributesThrough(self):
+        gl = createGl()
+        gl.GL_TRIANGLES = 4
+        checking = CheckingGl(gl)
+
+        self.assertEquals(checking.GL_TRIANGLES, 4)
+        self.assertTrue(checking.glGetError is gl.glGetError)
+
+
+
+class ErrorPolicyTest(TestCase):
+
+    def tearDown(self):
+        shader.checkQueries = True
+
+
+    def testUnknownPolicy(self):
+        self.assertRaises(ValueError, ErrorPolicy, 'never', gl=createGl())
+
+
+    def testCallPolicyWrapsModules(self):
+        original = shader.gl
+        policy = ErrorPolicy(CALL, gl=createGl())
+
+        policy.install(shader)
+        try:
+            self.assertTrue(isinstance(shader.gl, CheckingGl))
+            self.assertTrue(shader.checkQueries)
+        finally:
+            policy.uninstall()
+        self.assertTrue(shader.gl is original)
+
+
+    @patch('shader.gl')
+    def testFramePolicyDrainsErrorsOncePerFrame(self, mockGl):
+        gl = createGl([0x501, 0x505, 0])
+        policy = ErrorPolicy(FRAME, gl=gl)
+        policy.install(shader)
+        self.assertTrue(shader.gl is mockGl)
+        self.assertFalse(shader.checkQueries)
+
+        try:
+            policy.endFrame()
+        except GLError, e:
+            self.assertEquals(str(e),
+                'frame 0: GL_INVALID_VALUE\nframe 0: GL_OUT_OF_MEMORY')
+        else:
+            self.fail('GLError not raised')
+        self.assertEquals(policy.endFrame(), [])
+        self.assertEquals(policy.frame, 2)
+        policy.uninstall()
+
+
+    def testReturnsErrorsInsteadOfRaising(self):
+        policy = ErrorPolicy(FRAME, raiseErrors=False, gl=createGl([0x500]))
+        policy.install(shader)
+
+        errors = policy.endFrame()
+
+        self.assertEquals([str(error) for error in errors],
+            ['frame 0: GL_INVALID_ENUM'])
+        policy.uninstall()
+
+
+    def testDrainingStopsWithoutContext(self):
+        gl = createGl()
+        gl.glGetError.side_effect = lambda: 0x502
+        policy = ErrorPolicy(FRAME, raiseErrors=False, gl=gl)
+
+        self.assertEquals(len(policy.endFrame()), 32)
+
+
+    def testCallbackFallsBackToFrameWithoutKhrDebug(self):
+        policy = ErrorPolicy(CALLBACK, gl=createGl(debug=False))
+
+        policy.install(shader)
+
+        self.assertEquals(policy.policy, FRAME)
+        policy.uninstall()
+
+
+    @patch('shader.gl')
+    def testCallbackAttributesErrorsToProgram(self, mockGl):
+        mockGl.current_context = Mock()
+        gl = createGl(debug=True)
+        setCallback = Mock()
+        gl.lib.link_GL.return_value = setCallback
+        policy = ErrorPolicy(CALLBACK, raiseErrors=False, gl=gl)
+        policy.install(shader)
+        callback = setCallback.call_args[0][0]
+        self.assertEquals(gl.glEnable.call_args_list[0], ((GL_DEBUG_OUTPUT,), {}))
+
+        program = ShaderProgram()
+        program.id = 7
+        program.bind()
+        callback(0, GL_DEBUG_TYPE_ERROR, 1, 0, 4, 'oops', None)
+        # messages other than errors are ignored
+        callback(0, 0, 1, 0, 4, 'note', None)
+
+        errors = policy.endFrame()
+        self.assertEquals([str(error) for error in errors],
+            ['frame 0, program 7: oops'])
+        self.assertFalse(gl.glGetError.called)
+        policy.uninstall()
+        self.assertEquals(gl.glDisable.call_args, ((GL_DEBUG_OUTPUT,), {}))
+
+
+
+if __name__ == '__main__':
+    main()
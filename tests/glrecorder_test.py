@@ -0,0 +1,178 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from ctypes import c_float
+
+from unittest import TestCase, main
+
+import fixpath
+
+import shader
+from glrecorder import BudgetError, Frame, RecordingGl
+from shader import FragmentShader, ShaderProgram, VertexShader
+
+
+class RecordingGlTest(TestCase):
+
+    def setUp(self):
+        self.recorder = RecordingGl()
+        self.recorder.install(shader)
+
+
+    def tearDown(self):
+        self.recorder.uninstall()
+
+
+    def createProgram(self):
+        program = ShaderProgram(VertexShader('v'), FragmentShader('f'))
+        program.build()
+        return program
+
+
+    def testRecordsCallsInFrames(self):
+        program = self.createProgram()
+
+        with self.recorder.frame() as frame:
+            program.use()
+            program.setUniformf('scale', 2.0)
+
+        self.assertEquals(frame.number, 0)
+        self.assertEquals(frame.calls, [
+            ('glUseProgram', (program.id,)),
+            ('glGetUniformLocation', (program.id, 'scale')),
+            ('glUniform1f', (0, 2.0)),
+        ])
+        self.assertEquals(self.recorder.frames, [frame])
+        # the build happened outside any frame
+        self.assertEquals(self.recorder.setup.getCount('glLinkProgram'), 1)
+
+
+    def testPassesCallsToTarget(self):
+        program = self.createProgram()
+
+        # ids come from the StubGl, which numbers objects as created
+        self.assertEquals(program.id, 1)
+        self.assertEquals(
+            [args for name, args in self.recorder.setup.calls
+                if name == 'glAttachShader'],
+            [(1, 2), (1, 3)])
+        self.assertEquals(self.recorder.GL_TRIANGLES,
+            self.recorder.target.GL_TRIANGLES)
+
+
+    def testUninstallRestoresGl(self):
+        original = RecordingGl()
+        recorder = RecordingGl()
+        shader.gl, saved = original, shader.gl
+        try:
+            recorder.install(shader)
+            self.assertTrue(shader.gl is recorder)
+            recorder.uninstall()
+            self.assertTrue(shader.gl is original)
+        finally:
+            shader.gl = saved
+
+
+    def testMaxFrames(self):
+        recorder = RecordingGl(maxFrames=2)
+        for _ in xrange(3):
+            with recorder.frame():
+                recorder.glFlush()
+
+        self.assertEquals([frame.number for frame in recorder.frames], [1, 2])
+
+
+
+class FrameTest(TestCase):
+
+    def testCounts(self):
+        frame = Frame(0)
+        frame.calls = [
+            ('glUseProgram', (1,)),
+            ('glDrawArrays', (4, 0, 3)),
+            ('glUseProgram', (2,)),
+            ('glDrawArrays', (4, 0, 3)),
+        ]
+
+        self.assertEquals(frame.getCount(), 4)
+        self.assertEquals(frame.getCount('glUseProgram'), 2)
+        self.assertEquals(frame.getCounts(),
+            {'glUseProgram': 2, 'glDrawArrays': 2})
+        self.assertEquals(frame.getStateChanges(), 2)
+
+
+    def testRedundantCalls(self):
+        recorder = RecordingGl()
+        matrix = (c_float * 4)(1, 0, 0, 1)
+        with recorder.frame() as frame:
+            recorder.glUseProgram(1)
+            recorder.glUniform1f(0, 1.0)
+            recorder.glUniformMatrix2fv(1, 1, False, matrix)
+            recorder.glUseProgram(1)
+            recorder.glUniform1f(0, 1.0)
+            recorder.glUniformMatrix2fv(1, 1, False, (c_float * 4)(1, 0, 0, 1))
+            # the same location in another program isn't redundant
+            recorder.glUseProgram(2)
+            recorder.glUniform1f(0, 1.0)
+            recorder.glActiveTexture(0)
+            recorder.glBindTexture(3, 7)
+            recorder.glActiveTexture(1)
+            recorder.glBindTexture(3, 7)
+            recorder.glActiveTexture(1)
+            recorder.glEnable(5)
+            recorder.glEnable(5)
+            recorder.glDisable(5)
+
+        self.assertEquals(frame.getRedundant(), {
+            'glUseProgram': 1,
+            'glUniform1f': 1,
+            'glUniformMatrix2fv': 1,
+            'glActiveTexture': 1,
+            'glEnable': 1,
+        })
+        self.assertTrue('glUseProgram' in frame.summary())
+
+
+    def testAssertBudget(self):
+        frame = Frame(3)
+        frame.calls = [('glUseProgram', (1,)), ('glUseProgram', (1,))]
+
+        frame.assertBudget(total=2, glUseProgram=2)
+        self.assertRaises(BudgetError, frame.assertBudget, glUseProgram=1)
+        self.assertRaises(BudgetError, frame.assertBudget, stateChanges=1)
+        self.assertRaises(BudgetError, frame.assertBudget, redundant=0)
+        try:
+            frame.assertBudget(total=1)
+        except BudgetError, e:
+            self.assertTrue('total calls: 2, budget 1' in str(e))
+            self.assertTrue('frame 3' in str(e))
+        else:
+            self.fail('BudgetError not raised')
+
+
+    def testSceneStaysWithinBudget(self):
+        recorder = RecordingGl()
+        recorder.install(shader)
+        try:
+            programs = [
+                ShaderProgram(VertexShader('v%d' % (i,)), FragmentShader('f'))
+                for i in xrange(2)
+            ]
+            for program in programs:
+                program.build()
+            for _ in xrange(2):
+                with recorder.frame() as frame:
+                    for program in programs * 2:
+                        program.use()
+                        program.setUniformf('scale', 1.0)
+        finally:
+            recorder.uninstall()
+
+        # shader.py skips binding the bound program, and unchanged uniforms
+        frame.assertBudget(glUseProgram=4, glUniform1f=0, redundant=0)
+
+
+
+if __name__ == '__main__':
+    main()
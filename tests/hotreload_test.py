@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from ctypes import string_at
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from hotreload import HotReloader
+from shader import FragmentShader, getCurrentProgram, ShaderProgram, \
+    VertexShader
+
+
+class FakeGl(object):
+    '''
+    Sets up a mock gl in which each new object gets the next id, and the
+    shaders whose sources contain 'error' fail to compile.
+    '''
+
+    def __init__(self, mockGl):
+        self.mockGl = mockGl
+        self.nextId = 1
+        self.sources = {}
+        mockGl.current_context = Mock()
+        mockGl.glCreateShader.side_effect = self.create
+        mockGl.glCreateProgram.side_effect = self.create
+        mockGl.glShaderSource.side_effect = self.shaderSource
+        mockGl.glGetShaderiv.side_effect = self.getShaderiv
+        mockGl.glGetShaderInfoLog.side_effect = self.getShaderInfoLog
+        mockGl.glGetProgramiv.side_effect = self.getProgramiv
+        mockGl.glGetUniformLocation.return_value = 5
+
+
+    def create(self, *_):
+        self.nextId += 1
+        return self.nextId - 1
+
+
+    def shaderSource(self, shaderId, count, sources, _):
+        self.sources[shaderId] = ''.join(
+            string_at(sources[index]) for index in xrange(count))
+
+
+    def _fails(self, shaderId):
+        return 'error' in self.sources.get(shaderId, '')
+
+
+    def getShaderiv(self, shaderId, paramId, p_value):
+        value = 0
+        if paramId == self.mockGl.GL_COMPILE_STATUS:
+            value = int(not self._fails(shaderId))
+        elif paramId == self.mockGl.GL_INFO_LOG_LENGTH:
+            value = 64 if self._fails(shaderId) else 0
+        p_value._obj.value = value
+
+
+    def getShaderInfoLog(self, shaderId, length, _, p_buffer):
+        # b.frag is the second file read, so is source string 1
+        p_buffer.value = '1(2) : error: oops'
+
+
+    def getProgramiv(self, programId, paramId, p_value):
+        value = 0
+        if paramId == self.mockGl.GL_LINK_STATUS:
+            value = 1
+        p_value._obj.value = value
+
+
+
+class HotReloaderTest(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.mtime = 1000
+
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        open(path, 'w').write(text)
+        # ensure each write is seen as a change, however quick the test
+        self.mtime += 1
+        os.utime(path, (self.mtime, self.mtime))
+        return path
+
+
+    def createPrograms(self, reloader):
+        vert = reloader.createShader(VertexShader,
+            self.write('a.vert', 'vertex\n'))
+        frag1 = reloader.createShader(FragmentShader,
+            self.write('b.frag', 'fragment b\n'))
+        frag2 = reloader.createShader(FragmentShader,
+            self.write('c.frag', 'fragment c\n'))
+        programs = [ShaderProgram(vert, frag1), ShaderProgram(vert, frag2)]
+        for program in programs:
+            program.build()
+            reloader.watch(program)
+        return programs
+
+
+    @patch('shader.gl')
+    def testNothingChanged(self, mockGl):
+        FakeGl(mockGl)
+        reloader = HotReloader()
+        self.createPrograms(reloader)
+        mockGl.reset_mock()
+
+        self.assertEquals(reloader.poll(), [])
+        self.assertFalse(mockGl.glCreateShader.called)
+        self.assertFalse(mockGl.glCreateProgram.called)
+
+
+    @patch('shader.gl')
+    def testOnlyChangedStageAndItsProgramsAreRebuilt(self, mockGl):
+        FakeGl(mockGl)
+        reloader = HotReloader()
+        programs = self.createPrograms(reloader)
+        frag1 = programs[0].shaders[1]
+        oldShaderId = frag1.id
+        oldProgramIds = [program.id for program in programs]
+        self.write('b.frag', 'new fragment b\n')
+        mockGl.reset_mock()
+
+        relinked = reloader.poll()
+
+        self.assertEquals(relinked, [programs[0]])
+        self.assertEquals(reloader.compiles, 1)
+        self.assertEquals(reloader.links, 1)
+        self.assertEquals(mockGl.glCreateShader.call_count, 1)
+        self.assertEquals(mockGl.glCreateProgram.call_count, 1)
+        self.assertTrue('new fragment b' in frag1.sources[0])
+        self.assertNotEquals(frag1.id, oldShaderId)
+        self.assertNotEquals(programs[0].id, oldProgramIds[0])
+        self.assertEquals(programs[1].id, oldProgramIds[1])
+        self.assertEquals(mockGl.glDeleteProgram.call_args_list,
+            [((oldProgramIds[0],), {})])
+        self.assertEquals(mockGl.glDeleteShader.call_args_list,
+            [((oldShaderId,), {})])
+        self.assertEquals(reloader.errors, [])
+
+
+    @patch('shader.gl')
+    def testCompileErrorKeepsPreviousProgram(self, mockGl):
+        FakeGl(mockGl)
+        reloader = HotReloader()
+        programs = self.createPrograms(reloader)
+        programs[0].use()
+        oldProgramId = programs[0].id
+        frag1 = programs[0].shaders[1]
+        oldSources = frag1.sources
+        path = self.write('b.frag', 'error\n')
+        mockGl.reset_mock()
+
+        self.assertEquals(reloader.poll(), [])
+
+        self.assertEquals(programs[0].id, oldProgramId)
+        self.assertEquals(getCurrentProgram(), oldProgramId)
+        self.assertEquals(frag1.sources, oldSources)
+        self.assertFalse(mockGl.glCreateProgram.called)
+        self.assertFalse(mockGl.glDeleteProgram.called)
+        self.assertEquals(reloader.errors, ['%s(2) : error: oops' % (path,)])
+
+        # fixing the error reloads as usual
+        self.write('b.frag', 'fixed\n')
+        self.assertEquals(reloader.poll(), [programs[0]])
+        self.assertEquals(reloader.errors, [])
+
+
+    @patch('shader.gl')
+    def testIncludedFileChangesReloadBothStages(self, mockGl):
+        FakeGl(mockGl)
+        reloader = HotReloader()
+        self.write('common.glsl', 'common\n')
+        vert = reloader.createShader(VertexShader,
+            self.write('a.vert', '#include "common.glsl"\n'))
+        frag = reloader.createShader(FragmentShader,
+            self.write('a.frag', '#include "common.glsl"\n'))
+        program = ShaderProgram(vert, frag)
+        program.build()
+        reloader.watch(program)
+        self.write('common.glsl', 'changed\n')
+        mockGl.reset_mock()
+
+        self.assertEquals(reloader.poll(), [program])
+
+        # both stages are replaced in a single link
+        self.assertEquals(reloader.compiles, 2)
+        self.assertEquals(reloader.links, 1)
+
+
+    @patch('shader.gl')
+    def testUniformsAndBindingArePreserved(self, mockGl):
+        FakeGl(mockGl)
+        reloader = HotReloader()
+        programs = self.createPrograms(reloader)
+        programs[0].setUniformf('scale', 2.0)
+        programs[0].use()
+        self.write('a.vert', 'new vertex\n')
+        mockGl.reset_mock()
+
+        self.assertEquals(reloader.poll(), programs)
+
+        self.assertEquals(mockGl.glUniform1f.call_args_list, [((5, 2.0), {})])
+        self.assertEquals(getCurrentProgram(), programs[0].id)
+
+
+    @patch('shader.gl')
+    def testUnwatchedProgramsAreNotRelinked(self, mockGl):
+        FakeGl(mockGl)
+        reloader = HotReloader()
+        programs = self.createPrograms(reloader)
+        reloader.unwatch(programs[1])
+        self.write('a.vert', 'new vertex\n')
+
+        self.assertEquals(reloader.poll(), [programs[0]])
+
+
+
+if __name__ == '__main__':
+    main()
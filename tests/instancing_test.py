@@ -0,0 +1,123 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+import numpy
+
+from mock import Mock, patch
+
+import fixpath
+
+from instancing import InstanceBuffer
+from vertexbuffer import VertexArray
+
+
+instanceType = numpy.dtype([
+    ('offset', numpy.float32, 2),
+    ('color', numpy.uint8, 4),
+    ('transform', numpy.float32, (4, 4)),
+])
+
+
+def createProgram(attributes):
+    program = Mock()
+    program.id = 123
+    program.attributes = attributes
+    return program
+
+
+def uploadedRanges(mockGl):
+    return [(args[1], args[2])
+        for args, _ in mockGl.glBufferSubData.call_args_list]
+
+
+class InstanceBufferTest(TestCase):
+
+    def testRejectsUnstructuredData(self):
+        self.assertRaises(ValueError,
+            InstanceBuffer, numpy.zeros(4, numpy.float32))
+
+
+    @patch('vertexbuffer.gl')
+    def testUploadsOnlyChangedRange(self, mockGl):
+        instances = InstanceBuffer(numpy.zeros(100, instanceType))
+        size = instanceType.itemsize
+
+        instances.upload()
+        self.assertFalse(mockGl.glBufferSubData.called)
+
+        instances[10:20] = numpy.ones(10, instanceType)
+        instances[5] = numpy.ones(1, instanceType)
+        instances.upload()
+        instances[[30, 2, 40]] = numpy.ones(3, instanceType)
+        instances.upload()
+        instances[-1] = numpy.ones(1, instanceType)
+        instances.upload()
+
+        self.assertEquals(uploadedRanges(mockGl), [
+            (5 * size, 15 * size),
+            (2 * size, 39 * size),
+            (99 * size, size),
+        ])
+        address = mockGl.glBufferSubData.call_args[0][3]
+        self.assertEquals(address, instances.data.ctypes.data + 99 * size)
+        self.assertEquals(instances.uploads, 3)
+        self.assertEquals(instances.bytesUploaded, 55 * size)
+
+
+    @patch('vertexbuffer.gl')
+    def testSettingFieldUploadsEverything(self, mockGl):
+        instances = InstanceBuffer(numpy.zeros(8, instanceType))
+
+        instances['offset'] = (1, 2)
+        instances.upload()
+
+        self.assertEquals(uploadedRanges(mockGl), [(0, instances.size)])
+        self.assertEquals(list(instances['offset'][7]), [1, 2])
+
+
+    @patch('vertexbuffer.gl')
+    def testAttachSetsAttributesFromFields(self, mockGl):
+        instances = InstanceBuffer(numpy.zeros(8, instanceType))
+        vao = VertexArray(createProgram({}))
+
+        instances.attach(vao, normalized=['color'])
+
+        self.assertEquals(
+            [(a.name, a.size, a.type, a.normalized, a.stride, a.offset,
+                a.divisor, a.columns) for a in vao.attributes], [
+            ('offset', 2, gl.GL_FLOAT, False, 76, 0, 1, 1),
+            ('color', 4, gl.GL_UNSIGNED_BYTE, True, 76, 8, 1, 1),
+            ('transform', 16, gl.GL_FLOAT, False, 76, 12, 1, 4),
+        ])
+        # instance attributes don't limit the vertex count
+        self.assertTrue(vao.count is None)
+
+
+    @patch('vertexbuffer.gl')
+    def testFrameCostDoesNotDependOnInstanceCount(self, mockGl):
+        calls = []
+        for count in [10, 100000]:
+            instances = InstanceBuffer(numpy.zeros(count, instanceType))
+            vao = VertexArray(createProgram({'offset': 1}))
+            instances.attach(vao)
+            vao.drawInstanced(gl.GL_TRIANGLES, count, count=3)
+
+            mockGl.reset_mock()
+            instances[3:5] = numpy.ones(2, instanceType)
+            instances.upload()
+            vao.drawInstanced(gl.GL_TRIANGLES, len(instances), count=3)
+            calls.append(len(mockGl.method_calls))
+
+        self.assertEquals(calls, [4, 4])
+        self.assertEquals(mockGl.glDrawArraysInstanced.call_args,
+            ((gl.GL_TRIANGLES, 0, 3, 100000), {}))
+
+
+
+if __name__ == '__main__':
+    main()
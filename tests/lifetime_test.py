@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from unittest import TestCase, main
+from weakref import ref
+
+from mock import Mock, patch
+
+import fixpath
+
+import lifetime
+from lifetime import (
+    created, deleted, getCounts, getLiveObjects, releaseContext, report,
+)
+
+
+class Context(object):
+    pass
+
+
+
+class Owner(object):
+
+    def __init__(self, kind, id, owned=()):
+        self.kind = kind
+        self.id = id
+        self.owned = owned
+        self.deletes = 0
+        created(kind, id, self)
+
+
+    def delete(self):
+        if self.id is None:
+            return
+        self.deletes += 1
+        deleted(self.kind, self.id)
+        self.id = None
+        for other in self.owned:
+            other.delete()
+
+
+
+class LifetimeTest(TestCase):
+
+    def setUp(self):
+        self.context = Context()
+        self.mockGl = Mock()
+        self.mockGl.current_context = self.context
+        lifetime._liveWithoutContext.clear()
+
+
+    def tearDown(self):
+        lifetime.trackLeaks = False
+
+
+    def testCountsLiveObjects(self):
+        with patch('lifetime.gl', self.mockGl):
+            Owner('shader', 1)
+            Owner('shader', 2)
+            Owner('program', 3).delete()
+
+            self.assertEquals(getCounts(), {'shader': 2})
+
+
+    def testKeepsEachContextApart(self):
+        other = Context()
+        with patch('lifetime.gl', self.mockGl):
+            Owner('buffer', 1)
+            self.mockGl.current_context = other
+            Owner('buffer', 1)
+            Owner('buffer', 2)
+
+            self.assertEquals(getCounts(self.context), {'buffer': 1})
+            self.assertEquals(getCounts(other), {'buffer': 2})
+
+
+    def testDeletedFromAnotherContext(self):
+        with patch('lifetime.gl', self.mockGl):
+            owner = Owner('buffer', 1)
+            self.mockGl.current_context = Context()
+            owner.delete()
+
+            self.assertEquals(getCounts(self.context), {})
+
+
+    def testWithoutContext(self):
+        self.mockGl.current_context = None
+        with patch('lifetime.gl', self.mockGl):
+            Owner('sampler', 1)
+
+            self.assertEquals(getCounts(), {'sampler': 1})
+
+
+    def testReportWithoutTracking(self):
+        with patch('lifetime.gl', self.mockGl):
+            Owner('shader', 1)
+            Owner('shader', 2)
+            Owner('program', 3)
+
+            self.assertEquals(report(), '\n'.join([
+                '1 program',
+                '    1 from unknown',
+                '2 shaders',
+                '    2 from unknown',
+            ]))
+
+
+    def testReportsWhereCreated(self):
+        lifetime.trackLeaks = True
+        with patch('lifetime.gl', self.mockGl):
+            Owner('shader', 1)
+
+            where, = [obj.getWhere() for obj in getLiveObjects()]
+            self.assertTrue(where.endswith('in __init__'), where)
+            self.assertTrue('lifetime_test.py:' in where, where)
+            self.assertTrue(where in report())
+
+
+    def testReleaseContextDeletesEachObjectOnce(self):
+        with patch('lifetime.gl', self.mockGl):
+            shaders = [Owner('shader', 1), Owner('shader', 2)]
+            program = Owner('program', 3, owned=shaders)
+
+            self.assertEquals(releaseContext(), 3)
+
+            self.assertEquals([program.deletes] +
+                [shader.deletes for shader in shaders], [1, 1, 1])
+            self.assertEquals(getCounts(), {})
+
+
+    def testReleaseContextDeletesObjectsOfCollectedOwners(self):
+        with patch('lifetime.gl', self.mockGl):
+            owner = Owner('shader', 1)
+            Owner('buffer', 2)
+            reference = ref(owner)
+            del owner
+
+            self.assertTrue(reference() is None)
+            self.assertEquals(getCounts(), {'buffer': 1, 'shader': 1})
+            self.assertEquals(releaseContext(), 2)
+
+            self.assertEquals(self.mockGl.glDeleteShader.call_args,
+                ((1,), {}))
+            self.assertTrue(self.mockGl.glDeleteBuffers.called)
+            self.assertEquals(getCounts(), {})
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from pipeline import (
+    getCurrentPipeline, PipelineCache, ProgramPipeline, StageProgram,
+)
+from shader import FragmentShader, getCurrentProgram, Uniform, VertexShader
+
+
+def mockGetParams(values):
+    def _mockGetParams(_, paramId, p_value):
+        p_value._obj.value = values.get(paramId, 0)
+    return _mockGetParams
+
+
+def mockGenId(newId):
+    def _mockGenId(_, p_id):
+        p_id._obj.value = newId
+    return _mockGenId
+
+
+def mockCreateProgram(ids):
+    ids = list(ids)
+    return lambda: ids.pop(0)
+
+
+def setUpGl(mockGl, programIds=(10, 11, 12, 13)):
+    mockGl.glGetShaderiv.side_effect = mockGetParams(
+        {mockGl.GL_COMPILE_STATUS: 1})
+    mockGl.glGetProgramiv.side_effect = mockGetParams(
+        {mockGl.GL_LINK_STATUS: 1})
+    mockGl.glCreateProgram.side_effect = mockCreateProgram(programIds)
+
+
+class StageProgramTest(TestCase):
+
+    @patch('shader.gl')
+    def testLinkedAsSeparable(self, mockGl):
+        setUpGl(mockGl)
+        program = StageProgram(VertexShader('vs'))
+
+        program.build()
+
+        self.assertEquals(program.stageBit, gl.GL_VERTEX_SHADER_BIT)
+        self.assertEquals(mockGl.glProgramParameteri.call_args,
+            ((10, mockGl.GL_PROGRAM_SEPARABLE, mockGl.GL_TRUE), {}))
+
+
+    @patch('shader.gl')
+    def testUniformsAreSetWithoutBinding(self, mockGl):
+        setUpGl(mockGl)
+        program = StageProgram(FragmentShader('fs'))
+        program.build()
+        program._uniformLocations['tint'] = 2
+        program._uniformLocations['transform'] = 3
+
+        program.setUniformf('tint', 1.0, 0.5)
+        program.setUniformMatrix('transform', [1, 0, 0, 1])
+
+        self.assertEquals(mockGl.glProgramUniform2f.call_args,
+            ((10, 2, 1.0, 0.5), {}))
+        self.assertEquals(mockGl.glProgramUniformMatrix2fv.call_args[0][:4],
+            (10, 3, 1, False))
+        self.assertFalse(mockGl.glUseProgram.called)
+        self.assertFalse(mockGl.glUniform2f.called)
+
+
+
+class ProgramPipelineTest(TestCase):
+
+    def createPipeline(self, mockGl, pipelineGl):
+        setUpGl(mockGl)
+        pipelineGl.glGenProgramPipelines.side_effect = mockGenId(7)
+        pipelineGl.GL_VERTEX_SHADER_BIT = gl.GL_VERTEX_SHADER_BIT
+        self.vertex = StageProgram(VertexShader('vs'))
+        self.fragment = StageProgram(FragmentShader('fs'))
+        return ProgramPipeline([self.vertex, self.fragment])
+
+
+    @patch('pipeline.gl')
+    @patch('shader.gl')
+    def testUseBuildsStagesAndBindsPipeline(self, mockGl, pipelineGl):
+        pipeline = self.createPipeline(mockGl, pipelineGl)
+        mockGl.current_context = pipelineGl.current_context = Mock()
+
+        pipeline.use()
+        pipeline.use()
+
+        self.assertEquals(mockGl.glLinkProgram.call_count, 2)
+        self.assertEquals(sorted(pipelineGl.glUseProgramStages.call_args_list), [
+            ((7, gl.GL_VERTEX_SHADER_BIT, 10), {}),
+            ((7, gl.GL_FRAGMENT_SHADER_BIT, 11), {}),
+        ])
+        self.assertEquals(pipelineGl.glBindProgramPipeline.call_args_list,
+            [((7,), {})])
+        self.assertEquals(mockGl.glUseProgram.call_args_list, [((0,), {})])
+        self.assertEquals(getCurrentPipeline(), 7)
+        self.assertEquals(getCurrentProgram(), 0)
+
+
+    @patch('pipeline.gl')
+    @patch('shader.gl')
+    def testSetStageRebindsOneStageWithoutLinking(self, mockGl, pipelineGl):
+        pipeline = self.createPipeline(mockGl, pipelineGl)
+        pipeline.use()
+        other = StageProgram(FragmentShader('other'))
+        other.build()
+        links = mockGl.glLinkProgram.call_count
+
+        pipeline.setStage(other)
+
+        self.assertEquals(mockGl.glLinkProgram.call_count, links)
+        self.assertEquals(pipelineGl.glUseProgramStages.call_args,
+            ((7, gl.GL_FRAGMENT_SHADER_BIT, 12), {}))
+        self.assertTrue(pipeline.stages[gl.GL_FRAGMENT_SHADER_BIT] is other)
+
+
+    @patch('pipeline.gl')
+    @patch('shader.gl')
+    def testUniformsGoToStagesWhichHaveThem(self, mockGl, pipelineGl):
+        pipeline = self.createPipeline(mockGl, pipelineGl)
+        pipeline.build()
+        self.vertex.uniforms = {'transform': Uniform('transform', 1,
+            gl.GL_FLOAT_MAT2, 1)}
+        self.vertex._uniformLocations['transform'] = 1
+        self.fragment.uniforms = {'lights': Uniform('lights', 4,
+            gl.GL_FLOAT, 3)}
+        self.fragment._uniformLocations['lights[1]'] = 5
+        pipeline._reflect()
+
+        pipeline.setUniformMatrix('transform', [1, 0, 0, 1])
+        pipeline.setUniformf('lights[1]', 0.5)
+        pipeline.setUniformi('missing', 1)
+
+        self.assertEquals(mockGl.glProgramUniformMatrix2fv.call_args[0][:2],
+            (10, 1))
+        self.assertEquals(mockGl.glProgramUniform1f.call_args,
+            ((11, 5, 0.5), {}))
+        self.assertFalse(mockGl.glProgramUniform1i.called)
+        self.assertEquals(sorted(pipeline.uniforms), ['lights', 'transform'])
+
+
+    @patch('pipeline.gl')
+    @patch('shader.gl')
+    def testDeleteLeavesStagePrograms(self, mockGl, pipelineGl):
+        pipeline = self.createPipeline(mockGl, pipelineGl)
+        pipeline.build()
+
+        pipeline.delete()
+
+        self.assertTrue(pipelineGl.glDeleteProgramPipelines.called)
+        self.assertTrue(pipeline.id is None)
+        self.assertFalse(mockGl.glDeleteProgram.called)
+
+
+
+class PipelineCacheTest(TestCase):
+
+    def testSharesStagesBetweenPipelines(self):
+        cache = PipelineCache()
+        vertices = [VertexShader('vs%d' % i) for i in xrange(3)]
+        fragments = [FragmentShader('fs%d' % i) for i in xrange(4)]
+
+        pipelines = [cache.get(vertex, fragment)
+            for vertex in vertices for fragment in fragments]
+        again = cache.get(FragmentShader('fs1'), VertexShader('vs0'))
+
+        self.assertTrue(again is pipelines[1])
+        self.assertEquals(cache.getStats(), {
+            'stagePrograms': 7,
+            'pipelines': 12,
+            'hits': 1,
+            'misses': 12,
+        })
+        self.assertTrue(pipelines[0].stages[gl.GL_VERTEX_SHADER_BIT] is
+            pipelines[1].stages[gl.GL_VERTEX_SHADER_BIT])
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from preprocess import PreprocessError, Preprocessor
+from shader import FragmentShader, VertexShader
+
+
+def mockGetParams(values):
+    def _mockGetParams(_, paramId, p_value):
+        p_value._obj.value = values.get(paramId, 0)
+    return _mockGetParams
+
+
+class PreprocessorTest(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.mtime = 1000
+
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').write(text)
+        # ensure each write is seen as a change, however quick the test
+        self.mtime += 1
+        os.utime(path, (self.mtime, self.mtime))
+        return path
+
+
+    def testExpandWithoutIncludes(self):
+        path = self.write('a.frag', 'void main() {}\n')
+
+        self.assertEquals(Preprocessor().expand(path),
+            '#line 1 0\nvoid main() {}\n')
+
+
+    def testExpandIncludes(self):
+        self.write('common.glsl', 'float f;\n')
+        path = self.write('a.frag',
+            'float a;\n#include "common.glsl"\nvoid main() {}')
+
+        self.assertEquals(Preprocessor().expand(path),
+            '#line 1 0\n'
+            'float a;\n'
+            '#line 1 1\n'
+            'float f;\n'
+            '#line 3 0\n'
+            'void main() {}')
+
+
+    def testExpandKeepsVersionFirst(self):
+        path = self.write('a.frag', '#version 330\nvoid main() {}\n')
+
+        self.assertEquals(Preprocessor().expand(path),
+            '#version 330\n#line 2 0\nvoid main() {}\n')
+
+
+    def testExpandKeepsVersionAfterComments(self):
+        path = self.write('a.frag',
+            '// Copyright header\n/* more\n   header */\n'
+            '#version 330\nvoid main() {}\n')
+
+        self.assertEquals(Preprocessor().expand(path),
+            '// Copyright header\n/* more\n   header */\n'
+            '#version 330\n#line 5 0\nvoid main() {}\n')
+
+
+    def testExpandKeepsVersionAfterBlankLines(self):
+        path = self.write('a.frag', '\n  \n#version 330\nvoid main() {}\n')
+
+        self.assertEquals(Preprocessor().expand(path),
+            '\n  \n#version 330\n#line 4 0\nvoid main() {}\n')
+
+
+    def testIncludeUsesSearchPath(self):
+        self.write('lib/light.glsl', 'float light;\n')
+        path = self.write('shaders/a.frag', '#include <light.glsl>\n')
+        preprocessor = Preprocessor([os.path.join(self.directory, 'lib')])
+
+        self.assertTrue('float light;' in preprocessor.expand(path))
+
+
+    def testMissingInclude(self):
+        path = self.write('a.frag', '#include "missing.glsl"\n')
+
+        self.assertRaises(PreprocessError, Preprocessor().expand, path)
+
+
+    def testCircularInclude(self):
+        self.write('a.glsl', '#include "b.glsl"\n')
+        self.write('b.glsl', '#include "a.glsl"\n')
+        path = self.write('c.frag', '#include "a.glsl"\n')
+
+        self.assertRaises(PreprocessError, Preprocessor().expand, path)
+
+
+    def testExpansionsAreMemoized(self):
+        self.write('common.glsl', 'float f;\n')
+        path1 = self.write('a.frag', '#include "common.glsl"\n')
+        path2 = self.write('b.frag', '#include "common.glsl"\n')
+        preprocessor = Preprocessor()
+
+        preprocessor.expand(path1)
+        preprocessor.expand(path2)
+        preprocessor.expand(path1)
+
+        self.assertEquals(preprocessor.expansions, 3)
+        self.assertEquals(preprocessor.dependents,
+            {os.path.join(self.directory, 'common.glsl'): set([path1, path2])})
+
+
+    @patch('shader.gl')
+    def testUpdateRecompilesOnlyAffectedShaders(self, mockGl):
+        mockGl.glGetShaderiv.side_effect = mockGetParams(
+            {mockGl.GL_COMPILE_STATUS: 1})
+        self.write('light.glsl', 'float light;\n')
+        self.write('fog.glsl', 'float fog;\n')
+        preprocessor = Preprocessor()
+        lit = preprocessor.createShader(FragmentShader,
+            self.write('lit.frag', '#include "light.glsl"\n'))
+        foggy = preprocessor.createShader(FragmentShader,
+            self.write('foggy.frag', '#include "fog.glsl"\n'))
+        vertex = preprocessor.createShader(VertexShader,
+            self.write('a.vert', 'void main() {}\n'))
+        for shader in [lit, foggy, vertex]:
+            shader.compile()
+        mockGl.reset_mock()
+
+        self.write('light.glsl', 'float light2;\n')
+        changed = preprocessor.update()
+
+        self.assertEquals(changed, [lit])
+        self.assertTrue('float light2;' in lit.sources[0])
+        self.assertEquals(mockGl.glCompileShader.call_count, 1)
+        self.assertEquals(preprocessor.update(), [])
+
+
+    @patch('shader.gl', Mock())
+    def testUpdateIgnoresTouchedButUnchangedFiles(self):
+        self.write('light.glsl', 'float light;\n')
+        preprocessor = Preprocessor()
+        preprocessor.createShader(FragmentShader,
+            self.write('lit.frag', '#include "light.glsl"\n'))
+        expansions = preprocessor.expansions
+
+        self.write('light.glsl', 'float light;\n')
+
+        self.assertEquals(preprocessor.update(), [])
+        self.assertEquals(preprocessor.expansions, expansions)
+
+
+    def testTranslateLog(self):
+        self.write('common.glsl', 'float f;\n')
+        path = self.write('a.frag', '#include "common.glsl"\n')
+        preprocessor = Preprocessor()
+        preprocessor.expand(path)
+        common = os.path.join(self.directory, 'common.glsl')
+
+        self.assertEquals(preprocessor.translateLog(
+            '0:3(4): error: bad\n1(7) : error C0000: worse\n9:1: other'),
+            '%s:3(4): error: bad\n%s(7) : error C0000: worse\n9:1: other' %
+            (path, common))
+        self.assertEquals(preprocessor.translateLog('ERROR: 1:2: x'),
+            'ERROR: %s:2: x' % (common,))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+import os
+from shutil import rmtree
+from struct import pack
+from tempfile import mkdtemp
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from programcache import ProgramCache
+from shader import FragmentShader, ShaderProgram, VertexShader
+
+
+def mockGetIntegerv(returnVal):
+    def _mockGetIntegerv(_, p_value):
+        p_value._obj.value = returnVal
+    return _mockGetIntegerv
+
+
+def mockGetProgramBinary(binaryFormat, binary):
+    def _mockGetProgramBinary(_, __, ___, p_format, p_buffer):
+        p_format._obj.value = binaryFormat
+        p_buffer.raw = binary
+    return _mockGetProgramBinary
+
+
+def mockGlInfo():
+    glInfo = Mock()
+    glInfo.get_vendor.return_value = 'vendor'
+    glInfo.get_renderer.return_value = 'renderer'
+    glInfo.get_version.return_value = '4.5'
+    return glInfo
+
+
+def createProgram(*sources):
+    return ShaderProgram(VertexShader(sources[0]), FragmentShader(sources[1]))
+
+
+class ProgramCacheTest(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+
+    def testInitCreatesDirectory(self):
+        directory = os.path.join(self.directory, 'a', 'b')
+
+        ProgramCache(directory)
+
+        self.assertTrue(os.path.isdir(directory))
+
+
+    @patch('programcache.gl')
+    def testIsSupported(self, mockGl):
+        cache = ProgramCache(self.directory)
+
+        mockGl.glGetIntegerv.side_effect = mockGetIntegerv(0)
+        self.assertFalse(cache.isSupported())
+
+        mockGl.glGetIntegerv.side_effect = mockGetIntegerv(2)
+        self.assertTrue(cache.isSupported())
+
+
+    @patch('programcache.gl_info', mockGlInfo())
+    def testGetKeyDependsOnStagesAndSources(self):
+        cache = ProgramCache(self.directory)
+        key = cache.getKey(createProgram('vs', 'fs'))
+
+        self.assertEquals(cache.getKey(createProgram('vs', 'fs')), key)
+        self.assertNotEquals(cache.getKey(createProgram('vs', 'fs2')), key)
+        self.assertNotEquals(
+            cache.getKey(ShaderProgram(FragmentShader('vs'), FragmentShader('fs'))),
+            key)
+        self.assertNotEquals(
+            cache.getKey(createProgram(['v', 's'], 'fs')),
+            cache.getKey(createProgram(['vs'], 'fs')))
+
+
+    def testGetKeyDependsOnAttributeLocations(self):
+        cache = ProgramCache(self.directory)
+        program = createProgram('vs', 'fs')
+        key = cache.getKey(program)
+
+        program.attributeLocations = {'position': 0, 'uv': 1}
+        bound = cache.getKey(program)
+        program.attributeLocations = {'position': 1, 'uv': 0}
+
+        self.assertNotEquals(bound, key)
+        self.assertNotEquals(cache.getKey(program), bound)
+
+
+    def testGetKeyDependsOnDriver(self):
+        cache = ProgramCache(self.directory)
+        glInfo = mockGlInfo()
+        with patch('programcache.gl_info', glInfo):
+            key = cache.getKey(createProgram('vs', 'fs'))
+            glInfo.get_version.return_value = '4.6'
+
+            self.assertNotEquals(cache.getKey(createProgram('vs', 'fs')), key)
+
+
+    @patch('programcache.gl_info', mockGlInfo())
+    @patch('programcache.gl')
+    def testStoreThenLoad(self, mockGl):
+        mockGl.glGetProgramBinary.side_effect = \
+            mockGetProgramBinary(77, 'binary')
+        mockGl.glCreateProgram.return_value = 123
+        cache = ProgramCache(self.directory)
+        program = createProgram('vs', 'fs')
+        program._get = lambda _: len('binary')
+
+        cache.store(program)
+
+        self.assertEquals(os.listdir(self.directory),
+            [cache.getKey(program) + '.bin'])
+
+        loaded = createProgram('vs', 'fs')
+        loaded.getLinkStatus = lambda: True
+
+        self.assertTrue(cache.load(loaded))
+
+        self.assertEquals(loaded.id, 123)
+        self.assertEquals(mockGl.glProgramBinary.call_args,
+            ((123, 77, 'binary', len('binary')), {}))
+        self.assertEquals(cache.hits, 1)
+
+
+    @patch('programcache.gl_info', mockGlInfo())
+    @patch('programcache.gl')
+    def testLoadMiss(self, mockGl):
+        cache = ProgramCache(self.directory)
+
+        self.assertFalse(cache.load(createProgram('vs', 'fs')))
+
+        self.assertFalse(mockGl.glCreateProgram.called)
+        self.assertEquals(cache.misses, 1)
+
+
+    @patch('programcache.gl_info', mockGlInfo())
+    @patch('programcache.gl')
+    def testLoadRejectedBinaryIsDiscarded(self, mockGl):
+        mockGl.glCreateProgram.return_value = 123
+        cache = ProgramCache(self.directory)
+        program = createProgram('vs', 'fs')
+        path = cache.getPath(cache.getKey(program))
+        open(path, 'wb').write(pack('<I', 77) + 'stale')
+        program.getLinkStatus = lambda: False
+
+        self.assertFalse(cache.load(program))
+
+        self.assertTrue(program.id is None)
+        self.assertEquals(mockGl.glDeleteProgram.call_args, ((123,), {}))
+        self.assertFalse(os.path.exists(path))
+        self.assertEquals(cache.rejected, 1)
+
+
+    def testEvictRemovesLeastRecentlyUsed(self):
+        cache = ProgramCache(self.directory, maxBytes=25)
+        for name, mtime in [('new', 3000), ('old', 1000), ('mid', 2000)]:
+            path = os.path.join(self.directory, name + '.bin')
+            open(path, 'wb').write('x' * 10)
+            os.utime(path, (mtime, mtime))
+        open(os.path.join(self.directory, 'other'), 'wb').write('x' * 100)
+
+        cache.evict()
+
+        self.assertEquals(sorted(os.listdir(self.directory)),
+            ['mid.bin', 'new.bin', 'other'])
+
+
+    @patch('programcache.gl_info', mockGlInfo())
+    @patch('programcache.gl')
+    def testStoreOnlyScansDirectoryWhenItMayBeFull(self, mockGl):
+        mockGl.glGetProgramBinary.side_effect = \
+            mockGetProgramBinary(77, 'x' * 10)
+        cache = ProgramCache(self.directory, maxBytes=60)
+        cache.evict = Mock(side_effect=ProgramCache.evict.__get__(cache))
+
+        # entries of 14 bytes, with the header
+        for index in xrange(5):
+            program = createProgram('vs%d' % index, 'fs')
+            program._get = lambda _: 10
+            cache.store(program)
+
+        # scanned once to find the size, then once it passed maxBytes
+        self.assertEquals(cache.evict.call_count, 2)
+        self.assertEquals(len(os.listdir(self.directory)), 4)
+        self.assertEquals(cache.size, 56)
+
+
+    @patch('programcache.gl_info', mockGlInfo())
+    @patch('programcache.gl')
+    @patch('programcache.os.write')
+    def testFailedWriteRemovesTempFile(self, mockWrite, mockGl):
+        def fail(*_):
+            raise OSError(28, 'No space left on device')
+        mockWrite.side_effect = fail
+        mockGl.glGetProgramBinary.side_effect = \
+            mockGetProgramBinary(77, 'binary')
+        cache = ProgramCache(self.directory)
+        program = createProgram('vs', 'fs')
+        program._get = lambda _: len('binary')
+
+        self.assertRaises(OSError, cache.store, program)
+
+        self.assertEquals(os.listdir(self.directory), [])
+
+
+    @patch('shader.gl')
+    def testBuildUsesCache(self, mockGl):
+        program = createProgram('vs', 'fs')
+        program.cache = Mock()
+        program.cache.load.return_value = True
+
+        program.build()
+
+        self.assertEquals(program.cache.load.call_args, ((program,), {}))
+        self.assertFalse(mockGl.glCreateProgram.called)
+        self.assertFalse(mockGl.glLinkProgram.called)
+
+
+    @patch('shader.gl')
+    def testBuildStoresOnCacheMiss(self, mockGl):
+        shader = Mock()
+        shader.getInfoLog = lambda: ''
+        program = ShaderProgram(shader)
+        program.getLinkStatus = lambda: True
+        program.cache = Mock()
+        program.cache.load.return_value = False
+
+        program.build()
+
+        self.assertTrue(mockGl.glLinkProgram.called)
+        self.assertEquals(mockGl.glProgramParameteri.call_args[0][1:],
+            (mockGl.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, mockGl.GL_TRUE))
+        self.assertEquals(program.cache.store.call_args, ((program,), {}))
+
+
+    @patch('shader.gl')
+    def testBuildIgnoresUnsupportedCache(self, mockGl):
+        program = ShaderProgram()
+        program.getLinkStatus = lambda: True
+        program.cache = Mock()
+        program.cache.isSupported.return_value = False
+
+        program.build()
+
+        self.assertFalse(program.cache.load.called)
+        self.assertFalse(program.cache.store.called)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+import numpy
+
+from mock import Mock, patch
+
+import fixpath
+
+from glerrors import GLError
+from rendertarget import PixelReader, RenderTarget
+from textures import getTextureUnits
+
+
+def mockGenIds(ids):
+    ids = iter(ids)
+    def _mockGenIds(_, p_id):
+        p_id._obj.value = ids.next()
+    return _mockGenIds
+
+
+def mockWaitResults(results):
+    results = list(results)
+    def _mockClientWaitSync(fence, flags, timeout):
+        return results.pop(0)
+    return _mockClientWaitSync
+
+
+def setUpGl(mockGl):
+    for name in ['GL_FRAMEBUFFER', 'GL_FRAMEBUFFER_COMPLETE',
+        'GL_FRAMEBUFFER_BINDING', 'GL_VIEWPORT', 'GL_RGBA',
+        'GL_UNSIGNED_BYTE', 'GL_ALREADY_SIGNALED', 'GL_CONDITION_SATISFIED',
+        'GL_TIMEOUT_EXPIRED', 'GL_WAIT_FAILED']:
+        setattr(mockGl, name, getattr(gl, name))
+    mockGl.glGenTextures.side_effect = mockGenIds([7])
+    mockGl.glGenFramebuffers.side_effect = mockGenIds([8])
+    mockGl.glGenRenderbuffers.side_effect = mockGenIds([9])
+    mockGl.glGenBuffers.side_effect = mockGenIds([11, 12, 13])
+    mockGl.glCheckFramebufferStatus.return_value = gl.GL_FRAMEBUFFER_COMPLETE
+    mockGl.glClientWaitSync.side_effect = \
+        lambda *_: gl.GL_ALREADY_SIGNALED
+
+
+
+class RenderTargetTest(TestCase):
+
+    @patch('rendertarget.gl')
+    def testAttachesTextureAndDepth(self, mockGl):
+        setUpGl(mockGl)
+
+        target = RenderTarget(64, 32)
+
+        self.assertEquals((target.id, target.texture, target.depth), (8, 7, 9))
+        self.assertEquals(mockGl.glFramebufferTexture2D.call_args[0][3], 7)
+        self.assertEquals(mockGl.glRenderbufferStorage.call_args[0][2:],
+            (64, 32))
+        self.assertEquals(mockGl.glFramebufferRenderbuffer.call_args[0][3], 9)
+        self.assertEquals(mockGl.glBindFramebuffer.call_args,
+            ((gl.GL_FRAMEBUFFER, 0), {}))
+
+
+    @patch('rendertarget.gl')
+    def testWithoutDepth(self, mockGl):
+        setUpGl(mockGl)
+
+        target = RenderTarget(64, 32, depth=False)
+
+        self.assertTrue(target.depth is None)
+        self.assertFalse(mockGl.glGenRenderbuffers.called)
+
+
+    @patch('textures.gl')
+    @patch('rendertarget.gl')
+    def testTextureUnitsForgetWhatWasBound(self, mockGl, mockTexturesGl):
+        setUpGl(mockGl)
+        mockTexturesGl.current_context = Mock()
+        mockTexturesGl.GL_TEXTURE0 = gl.GL_TEXTURE0
+        units = getTextureUnits()
+        units.bindTexture(0, gl.GL_TEXTURE_2D, 5)
+
+        RenderTarget(64, 32)
+        units.bindTexture(0, gl.GL_TEXTURE_2D, 5)
+
+        # binding the new texture, then 0, replaced texture 5
+        self.assertEquals(units.getStats(),
+            {'bindsIssued': 2, 'bindsElided': 0})
+
+
+    @patch('rendertarget.gl')
+    def testIncompleteFramebufferRaises(self, mockGl):
+        setUpGl(mockGl)
+        mockGl.glCheckFramebufferStatus.return_value = 0x8CDD
+
+        try:
+            RenderTarget(64, 32)
+            self.fail('expected GLError')
+        except GLError, e:
+            self.assertTrue('GL_FRAMEBUFFER_UNSUPPORTED' in str(e), str(e))
+        self.assertTrue(mockGl.glDeleteFramebuffers.called)
+        self.assertTrue(mockGl.glDeleteTextures.called)
+        self.assertTrue(mockGl.glDeleteRenderbuffers.called)
+
+
+    @patch('rendertarget.gl')
+    def testWithRestoresFramebufferAndViewport(self, mockGl):
+        setUpGl(mockGl)
+        def mockGetIntegerv(name, p_value):
+            if name == gl.GL_FRAMEBUFFER_BINDING:
+                p_value._obj.value = 3
+            else:
+                p_value[:] = [0, 0, 640, 480]
+        mockGl.glGetIntegerv.side_effect = mockGetIntegerv
+        target = RenderTarget(64, 32)
+
+        with target:
+            self.assertEquals(mockGl.glBindFramebuffer.call_args,
+                ((gl.GL_FRAMEBUFFER, 8), {}))
+            self.assertEquals(mockGl.glViewport.call_args,
+                ((0, 0, 64, 32), {}))
+
+        self.assertEquals(mockGl.glBindFramebuffer.call_args,
+            ((gl.GL_FRAMEBUFFER, 3), {}))
+        self.assertEquals(mockGl.glViewport.call_args,
+            ((0, 0, 640, 480), {}))
+
+
+    @patch('rendertarget.gl')
+    def testReadPixels(self, mockGl):
+        setUpGl(mockGl)
+        target = RenderTarget(3, 2)
+        out = numpy.zeros((2, 3, 4), numpy.uint8)
+
+        self.assertTrue(target.readPixels(out) is out)
+        self.assertEquals(mockGl.glReadPixels.call_args,
+            ((0, 0, 3, 2, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, out.ctypes.data),
+                {}))
+        self.assertEquals(target.readPixels().shape, (2, 3, 4))
+
+
+    @patch('rendertarget.gl')
+    def testReadPixelsRejectsUnsuitableArrays(self, mockGl):
+        setUpGl(mockGl)
+        target = RenderTarget(3, 2)
+
+        self.assertRaises(ValueError, target.readPixels,
+            numpy.zeros((2, 2, 4), numpy.uint8))
+        self.assertRaises(ValueError, target.readPixels,
+            numpy.zeros((2, 3, 4), numpy.float32))
+        self.assertRaises(TypeError, target.readPixels,
+            numpy.zeros((2, 6, 4), numpy.uint8)[:, ::2])
+        self.assertFalse(mockGl.glReadPixels.called)
+
+
+
+class PixelReaderTest(TestCase):
+
+    def createReader(self, mockGl, buffers=3):
+        setUpGl(mockGl)
+        fences = iter(['fence0', 'fence1', 'fence2', 'fence3'])
+        mockGl.glFenceSync.side_effect = lambda *_: fences.next()
+        # the memory each pixel buffer maps to
+        self.memory = dict((bufferId, numpy.zeros((2, 3, 4), numpy.uint8))
+            for bufferId in [11, 12, 13])
+        self.memory[11][:] = 1
+        self.memory[12][:] = 2
+        self.bound = None
+        def mockBindBuffer(target, bufferId):
+            self.bound = bufferId
+        mockGl.glBindBuffer.side_effect = mockBindBuffer
+        mockGl.glMapBufferRange.side_effect = \
+            lambda *_: self.memory[self.bound].ctypes.data
+        return PixelReader(RenderTarget(3, 2), buffers=buffers)
+
+
+    @patch('rendertarget.gl')
+    def testStartQueuesReadWithoutWaiting(self, mockGl):
+        reader = self.createReader(mockGl)
+
+        reader.start()
+
+        self.assertEquals(mockGl.glReadPixels.call_args,
+            ((0, 0, 3, 2, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None), {}))
+        self.assertEquals(reader.pending, [(0, 'fence0')])
+        self.assertFalse(mockGl.glClientWaitSync.called)
+        self.assertFalse(mockGl.glMapBufferRange.called)
+
+
+    @patch('rendertarget.gl')
+    def testCollectReturnsViewOfOldestRead(self, mockGl):
+        reader = self.createReader(mockGl)
+        reader.start()
+        reader.start()
+
+        pixels = reader.collect()
+
+        self.assertEquals(pixels.shape, (2, 3, 4))
+        self.assertEquals(pixels.dtype, numpy.uint8)
+        self.assertTrue((pixels == 1).all())
+        self.assertEquals(reader.pending, [(1, 'fence1')])
+        self.assertEquals(mockGl.glDeleteSync.call_args, (('fence0',), {}))
+
+        pixels = reader.collect()
+
+        self.assertTrue((pixels == 2).all())
+        # the first buffer was unmapped before mapping the second
+        self.assertEquals(mockGl.glUnmapBuffer.call_count, 1)
+        self.assertEquals(reader.getMetrics(), {
+            'frames': 2, 'bytesRead': 48, 'waits': 0, 'waitTime': 0.0,
+        })
+
+
+    @patch('rendertarget.gl')
+    def testCollectWithoutWaitingReturnsNoneUntilDone(self, mockGl):
+        reader = self.createReader(mockGl)
+        reader.start()
+        mockGl.glClientWaitSync.side_effect = mockWaitResults(
+            [gl.GL_TIMEOUT_EXPIRED, gl.GL_CONDITION_SATISFIED])
+
+        self.assertTrue(reader.collect(wait=False) is None)
+        self.assertEquals(len(reader.pending), 1)
+        self.assertTrue(reader.collect(wait=False) is not None)
+        self.assertEquals(reader.pending, [])
+
+
+    @patch('rendertarget.gl')
+    def testCollectWaits(self, mockGl):
+        reader = self.createReader(mockGl)
+        reader.clock = iter([1.0, 3.0]).next
+        reader.start()
+        mockGl.glClientWaitSync.side_effect = mockWaitResults(
+            [gl.GL_TIMEOUT_EXPIRED, gl.GL_TIMEOUT_EXPIRED,
+                gl.GL_CONDITION_SATISFIED])
+
+        reader.collect()
+
+        self.assertEquals(mockGl.glClientWaitSync.call_count, 3)
+        self.assertEquals(reader.getMetrics()['waits'], 1)
+        self.assertEquals(reader.getMetrics()['waitTime'], 2.0)
+
+
+    @patch('rendertarget.gl')
+    def testStartRaisesWhenEveryBufferIsPending(self, mockGl):
+        reader = self.createReader(mockGl, buffers=2)
+        reader.start()
+        reader.start()
+
+        self.assertRaises(ValueError, reader.start)
+
+
+    @patch('rendertarget.gl')
+    def testStartUnmapsBufferItReuses(self, mockGl):
+        reader = self.createReader(mockGl, buffers=1)
+        reader.start()
+        reader.collect()
+
+        reader.start()
+
+        self.assertEquals(mockGl.glUnmapBuffer.call_count, 1)
+        self.assertTrue(reader.mapped is None)
+
+
+    @patch('rendertarget.gl')
+    def testCollectRaisesWithNothingStarted(self, mockGl):
+        reader = self.createReader(mockGl)
+
+        self.assertRaises(ValueError, reader.collect)
+
+
+    @patch('rendertarget.gl')
+    def testDelete(self, mockGl):
+        reader = self.createReader(mockGl)
+        reader.start()
+
+        reader.delete()
+
+        self.assertEquals(mockGl.glDeleteSync.call_args, (('fence0',), {}))
+        self.assertEquals(mockGl.glDeleteBuffers.call_count, 3)
+        self.assertEquals(reader.ids, [])
+
+
+
+if __name__ == '__main__':
+    main()
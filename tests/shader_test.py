@@ -12,7 +12,11 @@ from mock import Mock, patch
 
 import fixpath
 
-from shader import CompileError, FragmentShader, LinkError, ShaderProgram, VertexShader
+from shader import (
+    buildAll, CompileError, FragmentShader, getCurrentProgram,
+    GL_COMPLETION_STATUS_KHR, LinkError, ShaderProgram, ShaderRegistry,
+    UniformBlockInfo, useFixedFunction, VertexShader,
+)
 
 
 DoNothing = lambda *_: None
@@ -24,6 +28,12 @@ def mockGet(returnVal):
     return _mockGet
 
 
+def mockGetParams(values):
+    def _mockGetParams(_, paramId, p_value):
+        p_value._obj.value = values.get(paramId, 0)
+    return _mockGetParams
+
+
 def mockGetInfoLog(returnVal):
     def _mockGetInfoLog(_, __, ___, p_buffer):
         p_buffer.value = returnVal
@@ -36,24 +46,24 @@ class ShaderTest(TestCase):
         shader = VertexShader('src')
         self.assertEqual(shader.type, gl.GL_VERTEX_SHADER)
         self.assertTrue(shader.id is None)
-        self.assertEquals(shader.sources, ['src'])
+        self.assertEquals(shader.sources, ('src',))
 
         shader = VertexShader(['src'])
         self.assertEqual(shader.type, gl.GL_VERTEX_SHADER)
         self.assertTrue(shader.id is None)
-        self.assertEquals(shader.sources, ['src'])
+        self.assertEquals(shader.sources, ('src',))
 
         shader = VertexShader(['s1', 's2'])
         self.assertEqual(shader.type, gl.GL_VERTEX_SHADER)
         self.assertTrue(shader.id is None)
-        self.assertEquals(shader.sources, ['s1', 's2'])
+        self.assertEquals(shader.sources, ('s1', 's2'))
 
 
     def testInitFragmentShader(self):
         shader = FragmentShader('src')
         self.assertEqual(shader.type, gl.GL_FRAGMENT_SHADER)
         self.assertTrue(shader.id is None)
-        self.assertEquals(shader.sources, ['src'])
+        self.assertEquals(shader.sources, ('src',))
 
 
     @patch('shader.gl')
@@ -187,6 +197,158 @@ class ShaderTest(TestCase):
             self.fail('should raise a CompileError')
 
 
+    @patch('shader.gl')
+    def testCompileFailureDeletesShader(self, mockGl):
+        mockGl.glCreateShader.return_value = 123
+        shader = VertexShader(['badsrc'])
+        shader.getCompileStatus = lambda: False
+        shader.getInfoLog = lambda: 'errormessage'
+
+        self.assertRaises(CompileError, shader.compile)
+
+        self.assertEquals(mockGl.glDeleteShader.call_args, ((123,), {}))
+        self.assertTrue(shader.id is None)
+
+
+    @patch('shader.gl')
+    def testCompileOnlyOnce(self, mockGl):
+        shader = VertexShader(['src'])
+        shader.getCompileStatus = lambda: True
+
+        shader.compile()
+        shader.compile()
+
+        self.assertEquals(mockGl.glCreateShader.call_count, 1)
+        self.assertEquals(mockGl.glCompileShader.call_count, 1)
+
+
+    @patch('shader.gl')
+    def testSetSources(self, mockGl):
+        shader = VertexShader(['src'])
+        shader.id = 123
+        shader.compiled = True
+
+        self.assertFalse(shader.setSources('src'))
+        self.assertEquals(shader.id, 123)
+
+        self.assertTrue(shader.setSources(['new']))
+        self.assertEquals(shader.sources, ('new',))
+        self.assertEquals(mockGl.glDeleteShader.call_args, ((123,), {}))
+        self.assertTrue(shader.id is None)
+        self.assertFalse(shader.compiled)
+
+
+    def testGetSourceHash(self):
+        hash = VertexShader(['a', 'b']).getSourceHash()
+
+        self.assertEquals(FragmentShader(['a', 'b']).getSourceHash(), hash)
+        self.assertNotEquals(VertexShader(['ab']).getSourceHash(), hash)
+        self.assertNotEquals(VertexShader(['a', 'c']).getSourceHash(), hash)
+
+
+    def testSourceHashIsOnlyRedoneForNewSources(self):
+        shader = VertexShader(['a', 'b'])
+        hash = shader.getSourceHash()
+
+        with patch('shader.sha1') as mockSha1:
+            self.assertEquals(shader.getSourceHash(), hash)
+            self.assertFalse(mockSha1.called)
+
+        shader.setSources(['a', 'c'])
+        self.assertEquals(shader.getSourceHash(),
+            VertexShader(['a', 'c']).getSourceHash())
+
+
+    def testChangingTheGivenListDoesNotChangeSources(self):
+        sources = ['a', 'b']
+        shader = VertexShader(sources)
+        hash = shader.getSourceHash()
+
+        sources[1] = 'c'
+
+        self.assertEquals(shader.sources, ('a', 'b'))
+        self.assertEquals(shader.getSourceHash(), hash)
+
+
+    @patch('shader.gl')
+    def testReleaseDeletesUnreferencedShader(self, mockGl):
+        shader = VertexShader(['src'])
+        shader.id = 123
+        shader.acquire()
+        shader.acquire()
+
+        shader.release()
+        self.assertFalse(mockGl.glDeleteShader.called)
+
+        shader.release()
+        self.assertEquals(mockGl.glDeleteShader.call_args, ((123,), {}))
+        self.assertTrue(shader.id is None)
+
+
+
+class ShaderRegistryTest(TestCase):
+
+    def testGetInternsIdenticalShaders(self):
+        registry = ShaderRegistry()
+
+        shader = registry.get(VertexShader, ['s1', 's2'])
+
+        self.assertTrue(isinstance(shader, VertexShader))
+        self.assertEquals(shader.sources, ('s1', 's2'))
+        self.assertTrue(registry.get(VertexShader, ['s1', 's2']) is shader)
+        self.assertEquals(len(registry), 1)
+
+
+    def testGetDistinguishesTypeAndSources(self):
+        registry = ShaderRegistry()
+        shader = registry.get(VertexShader, 'src')
+
+        self.assertFalse(registry.get(FragmentShader, 'src') is shader)
+        self.assertFalse(registry.get(VertexShader, 'src2') is shader)
+        self.assertEquals(len(registry), 3)
+
+
+    @patch('shader.gl')
+    def testSharedShaderIsCompiledOnce(self, mockGl):
+        registry = ShaderRegistry()
+        vs = registry.get(VertexShader, 'vs')
+        vs.getCompileStatus = lambda: True
+        vs.getInfoLog = lambda: ''
+        programs = [
+            ShaderProgram(vs, registry.get(FragmentShader, 'fs1')),
+            ShaderProgram(vs, registry.get(FragmentShader, 'fs2')),
+        ]
+        for program in programs:
+            for shader in program.shaders:
+                shader.getCompileStatus = lambda: True
+                shader.getInfoLog = lambda: ''
+            program.getLinkStatus = lambda: True
+            program.getInfoLog = lambda: ''
+
+            program.build()
+
+        self.assertEquals(mockGl.glCreateShader.call_count, 3)
+        self.assertEquals(vs.refs, 2)
+
+
+    @patch('shader.gl')
+    def testLastReleaseDeletesAndForgetsShader(self, mockGl):
+        registry = ShaderRegistry()
+        vs = registry.get(VertexShader, 'vs')
+        vs.id = 123
+        program1 = ShaderProgram(vs)
+        program2 = ShaderProgram(vs)
+
+        program1.delete()
+        self.assertFalse(mockGl.glDeleteShader.called)
+        self.assertTrue(registry.get(VertexShader, 'vs') is vs)
+
+        program2.delete()
+        self.assertEquals(mockGl.glDeleteShader.call_args, ((123,), {}))
+        self.assertEquals(len(registry), 0)
+        self.assertFalse(registry.get(VertexShader, 'vs') is vs)
+
+
 
 class ShaderProgramTest(TestCase):
 
@@ -299,17 +461,18 @@ class ShaderProgramTest(TestCase):
 
     @patch('shader.gl')
     def testUseCompilesAndAttachesShaders(self, mockGl):
+        mockGl.glCreateProgram.return_value = 123
         shader1 = Mock()
         shader2 = Mock()
         program = ShaderProgram(shader1, shader2)
-        program.id = 123
         program._getMessage = DoNothing
         program.getLinkStatus = lambda: True
         
         program.use()
 
-        self.assertEquals(shader1.compile.call_args, (tuple(), {}))
-        self.assertEquals(shader2.compile.call_args, (tuple(), {}))
+        for shader in [shader1, shader2]:
+            self.assertEquals(shader.startCompile.call_args, (tuple(), {}))
+            self.assertEquals(shader.finishCompile.call_args, (tuple(), {}))
         self.assertEquals(mockGl.glAttachShader.call_args_list, [
             ((program.id, shader1.id), {}),
             ((program.id, shader2.id), {}),
@@ -365,8 +528,709 @@ class ShaderProgramTest(TestCase):
         self.assertEquals(mockGl.glUseProgram.call_args, ((program.id,), {}))
 
 
-    def testDispose(self):
-        self.fail()
+    @patch('shader.gl')
+    def testUseOnlyBuildsOnce(self, mockGl):
+        shader = Mock()
+        shader.getInfoLog = lambda: ''
+        program = ShaderProgram(shader)
+        program.getLinkStatus = lambda: True
+
+        program.use()
+        program.use()
+        program.use()
+
+        self.assertEquals(mockGl.glCreateProgram.call_count, 1)
+        self.assertEquals(shader.startCompile.call_count, 1)
+        self.assertEquals(shader.finishCompile.call_count, 1)
+        self.assertEquals(mockGl.glAttachShader.call_count, 1)
+        self.assertEquals(mockGl.glLinkProgram.call_count, 1)
+
+
+    @patch('shader.gl')
+    def testUseSkipsBindWhenAlreadyCurrent(self, mockGl):
+        program = ShaderProgram()
+        program.getLinkStatus = lambda: True
+
+        program.use()
+        program.use()
+
+        self.assertEquals(mockGl.glUseProgram.call_count, 1)
+        self.assertEquals(getCurrentProgram(), program.id)
+
+
+    @patch('shader.gl')
+    def testUseRebindsAfterAnotherProgram(self, mockGl):
+        mockGl.glCreateProgram.return_value = 123
+        program1 = ShaderProgram()
+        program1.getLinkStatus = lambda: True
+        program1.use()
+        mockGl.glCreateProgram.return_value = 456
+        program2 = ShaderProgram()
+        program2.getLinkStatus = lambda: True
+        program2.use()
+
+        program1.use()
+
+        self.assertEquals(mockGl.glUseProgram.call_args_list, [
+            ((123,), {}), ((456,), {}), ((123,), {}),
+        ])
+
+
+    @patch('shader.gl')
+    def testCurrentProgramIsTrackedPerContext(self, mockGl):
+        program = ShaderProgram()
+        program.getLinkStatus = lambda: True
+        program.use()
+
+        mockGl.current_context = Mock()
+        self.assertTrue(getCurrentProgram() is None)
+        program.use()
+
+        self.assertEquals(mockGl.glUseProgram.call_count, 2)
+        self.assertEquals(mockGl.glLinkProgram.call_count, 1)
+
+
+    @patch('shader.gl')
+    def testUseAlwaysBindsWithoutContext(self, mockGl):
+        mockGl.current_context = None
+        program = ShaderProgram()
+        program.getLinkStatus = lambda: True
+
+        program.use()
+        program.use()
+
+        self.assertEquals(mockGl.glUseProgram.call_count, 2)
+
+
+    @patch('shader.gl', Mock())
+    def testUseRetriesBuildAfterLinkFailure(self):
+        program = ShaderProgram()
+        program.getLinkStatus = lambda: False
+        program.getInfoLog = lambda: 'linkerror'
+        self.assertRaises(LinkError, program.use)
+        self.assertTrue(program.id is None)
+
+        program.getLinkStatus = lambda: True
+        program.use()
+
+        self.assertTrue(program.id is not None)
+
+
+    @patch('shader.gl')
+    def testUseFixedFunction(self, mockGl):
+        program = ShaderProgram()
+        program.getLinkStatus = lambda: True
+        program.use()
+
+        useFixedFunction()
+        program.use()
+
+        self.assertEquals(mockGl.glUseProgram.call_args_list, [
+            ((program.id,), {}), ((0,), {}), ((program.id,), {}),
+        ])
+
+
+    @patch('shader.gl')
+    def testDispose(self, mockGl):
+        shader = Mock()
+        program = ShaderProgram(shader)
+        program.getLinkStatus = lambda: True
+        program._getMessage = DoNothing
+        program.use()
+        programId = program.id
+
+        program.delete()
+
+        self.assertEquals(mockGl.glDeleteProgram.call_args, ((programId,), {}))
+        self.assertTrue(program.id is None)
+        self.assertTrue(getCurrentProgram() is None)
+        self.assertEquals(shader.acquire.call_count, 1)
+        self.assertEquals(shader.release.call_count, 1)
+        self.assertEquals(program.shaders, [])
+
+    @patch('shader.gl')
+    def testRelinkFailureLeavesProgramUnchanged(self, mockGl):
+        ids = [1, 2]
+        mockGl.glCreateProgram.side_effect = lambda: ids.pop(0)
+        old, new = Mock(), Mock()
+        program = ShaderProgram(old)
+        program.getLinkStatus = lambda: True
+        program._getMessage = DoNothing
+        program.use()
+        program.getLinkStatus = lambda: False
+        program.getInfoLog = lambda: 'linkerror'
+
+        self.assertRaises(LinkError, program.relink, {old: new})
+
+        self.assertEquals(program.id, 1)
+        self.assertEquals(program.shaders, [old])
+        self.assertEquals(mockGl.glAttachShader.call_args, ((2, new.id), {}))
+        self.assertEquals(mockGl.glDeleteProgram.call_args_list, [((2,), {})])
+
+
+    @patch('shader.gl')
+    def testRelinkRestoresUniformBlockBindings(self, mockGl):
+        ids = [1, 2]
+        mockGl.glCreateProgram.side_effect = lambda: ids.pop(0)
+        program = ShaderProgram(Mock())
+        program.getLinkStatus = lambda: True
+        program._getMessage = DoNothing
+        # the new program numbers its blocks differently
+        indices = [0, 1]
+        def reflectUniformBlocks():
+            program.uniformBlocks = {
+                'Camera': UniformBlockInfo('Camera', indices.pop(0), 64, {}),
+            }
+        program._reflectUniformBlocks = reflectUniformBlocks
+        program.use()
+        program.uniformBlockBindings['Camera'] = 3
+
+        program.relink()
+
+        self.assertEquals(mockGl.glUniformBlockBinding.call_args_list,
+            [((2, 1, 3), {})])
+
+
+
+class AttributeLocationTest(TestCase):
+
+    def createProgram(self, reflected):
+        program = ShaderProgram(Mock())
+        program.attributeLocations = {'position': 0, 'normal': 1, 'uv': 2}
+        program.getLinkStatus = lambda: True
+        program._getMessage = DoNothing
+        def reflectAttributes():
+            program.attributes = dict(reflected)
+        program._reflectAttributes = reflectAttributes
+        return program
+
+
+    @patch('shader.gl')
+    def testLocationsAreBoundBeforeLinking(self, mockGl):
+        mockGl.glCreateProgram.return_value = 5
+        program = self.createProgram({'position': 0, 'uv': 2})
+        calls = []
+        mockGl.glBindAttribLocation.side_effect = \
+            lambda *args: calls.append(args)
+        mockGl.glLinkProgram.side_effect = \
+            lambda *args: calls.append('link')
+
+        program.build()
+
+        self.assertEquals(sorted(calls[:3]),
+            [(5, 0, 'position'), (5, 1, 'normal'), (5, 2, 'uv')])
+        self.assertEquals(calls[3:], ['link'])
+
+
+    @patch('shader.gl')
+    def testMismatchedLocationRaises(self, mockGl):
+        program = self.createProgram({'position': 3, 'uv': 2, 'color': 1})
+
+        try:
+            program.build()
+        except LinkError, e:
+            self.assertEquals(str(e), 'attribute position is at location 3, '
+                'not 0')
+        else:
+            self.fail('LinkError not raised')
+        self.assertTrue(mockGl.glDeleteProgram.called)
+        self.assertTrue(program.id is None)
+
+
+    @patch('shader.gl')
+    def testRelinkWithMismatchedLocationLeavesProgramUnchanged(self, mockGl):
+        ids = [1, 2]
+        mockGl.glCreateProgram.side_effect = lambda: ids.pop(0)
+        reflected = {'position': 0}
+        program = self.createProgram(reflected)
+        program.build()
+        reflected['position'] = 4
+
+        self.assertRaises(LinkError, program.relink)
+
+        self.assertEquals(program.id, 1)
+        self.assertEquals(program.attributes, {'position': 0})
+        self.assertEquals(mockGl.glDeleteProgram.call_args_list, [((2,), {})])
+
+
+    @patch('shader.gl')
+    def testNoBindingWithoutLocations(self, mockGl):
+        program = ShaderProgram(Mock())
+        program.getLinkStatus = lambda: True
+        program._getMessage = DoNothing
+
+        program.build()
+
+        self.assertFalse(mockGl.glBindAttribLocation.called)
+
+
+
+class BuildAllTest(TestCase):
+
+    def createPrograms(self, mockGl, count, compileStatus=1):
+        mockGl.glGetShaderiv.side_effect = mockGetParams(
+            {mockGl.GL_COMPILE_STATUS: compileStatus})
+        mockGl.glGetProgramiv.side_effect = mockGetParams(
+            {mockGl.GL_LINK_STATUS: 1})
+        return [
+            ShaderProgram(VertexShader('vs%d' % i), FragmentShader('fs'))
+            for i in xrange(count)
+        ]
+
+
+    @patch('shader.gl')
+    def testIssuesAllWorkBeforeQueryingStatus(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        programs = self.createPrograms(mockGl, 3)
+
+        messages = buildAll(programs)
+
+        calls = [name for name, _, _ in mockGl.method_calls]
+        firstQuery = min(calls.index('glGetShaderiv'),
+            calls.index('glGetProgramiv'))
+        self.assertEquals(calls[:firstQuery].count('glCompileShader'), 6)
+        self.assertEquals(calls[:firstQuery].count('glLinkProgram'), 3)
+        self.assertEquals(calls[firstQuery:].count('glCompileShader'), 0)
+        self.assertEquals(messages, ['', '', ''])
+        self.assertFalse(mockGl.lib.link_GL.called)
+
+
+    @patch('shader.gl')
+    def testUsesParallelShaderCompile(self, mockGl):
+        mockGl.gl_info.have_extension.side_effect = \
+            lambda name: name == 'GL_KHR_parallel_shader_compile'
+        programs = self.createPrograms(mockGl, 2)
+
+        buildAll(programs)
+
+        self.assertEquals(mockGl.lib.link_GL.call_args[0][0],
+            'glMaxShaderCompilerThreadsKHR')
+        setThreads = mockGl.lib.link_GL.return_value
+        self.assertEquals(setThreads.call_args, ((0xffffffff,), {}))
+
+
+    @patch('shader.gl')
+    def testRaisesCompileErrors(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        programs = self.createPrograms(mockGl, 1, compileStatus=0)
+
+        self.assertRaises(CompileError, buildAll, programs)
+
+        self.assertTrue(programs[0].id is None)
+        self.assertTrue(mockGl.glDeleteProgram.called)
+
+
+    @patch('shader.gl')
+    def testFinishesEveryProgramAfterAFailure(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        programs = self.createPrograms(mockGl, 3)
+        def fail(program):
+            def finishBuild():
+                program._pending = False
+                raise LinkError('link failed for %s' % (program.getName(),))
+            return finishBuild
+        programs[0].finishBuild = fail(programs[0])
+        programs[2].finishBuild = fail(programs[2])
+
+        try:
+            buildAll(programs)
+        except LinkError, e:
+            self.assertEquals(str(e), 'link failed for %s' %
+                (programs[0].getName(),))
+            self.assertEquals([program for program, _ in e.errors],
+                [programs[0], programs[2]])
+        else:
+            self.fail('LinkError not raised')
+        # the program between the failures was still finished
+        self.assertFalse(programs[1]._pending)
+
+
+    @patch('shader.gl')
+    def testProgramsSharingAFailedShader(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        mockGl.glCreateShader.return_value = 5
+        def mockGetShaderiv(shaderId, paramId, p_value):
+            if shaderId is None:
+                # as ctypes does for a GLuint argument
+                raise TypeError('wrong type')
+            p_value._obj.value = {mockGl.GL_INFO_LOG_LENGTH: 7}.get(
+                paramId, 0)
+        mockGl.glGetShaderiv.side_effect = mockGetShaderiv
+        mockGl.glGetShaderInfoLog.side_effect = mockGetInfoLog('broken')
+        registry = ShaderRegistry()
+        programs = [
+            ShaderProgram(registry.get(VertexShader, 'vs'),
+                registry.get(FragmentShader, 'fs%d' % (i,)))
+            for i in xrange(2)
+        ]
+
+        try:
+            buildAll(programs)
+        except CompileError, e:
+            self.assertEquals([(program, str(error))
+                for program, error in e.errors],
+                [(programs[0], 'broken'), (programs[1], 'broken')])
+        else:
+            self.fail('CompileError not raised')
+        self.assertEquals(mockGl.glGetShaderInfoLog.call_count, 1)
+
+
+    @patch('shader.gl')
+    def testIsReadyPollsCompletionStatus(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = True
+        program, = self.createPrograms(mockGl, 1)
+        program.startBuild()
+
+        self.assertFalse(program.isReady())
+        mockGl.glGetProgramiv.side_effect = mockGetParams(
+            {GL_COMPLETION_STATUS_KHR: 1})
+        self.assertTrue(program.isReady())
+
+
+    @patch('shader.gl')
+    def testIsReadyWithoutExtension(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        program, = self.createPrograms(mockGl, 1)
+        program.startBuild()
+
+        self.assertTrue(program.isReady())
+        self.assertTrue(program.shaders[0].isReady())
+
+
+    @patch('shader.gl')
+    def testUseFinishesStartedBuild(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        program, = self.createPrograms(mockGl, 1)
+        program.startBuild()
+
+        program.use()
+        program.use()
+
+        self.assertEquals(mockGl.glLinkProgram.call_count, 1)
+        self.assertEquals(mockGl.glUseProgram.call_args, ((program.id,), {}))
+        # shaders are detached once the link has finished
+        self.assertEquals(mockGl.glDetachShader.call_count, 2)
+
+
+    @patch('shader.gl')
+    def testSettingUniformBuildsProgram(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        mockGl.glGetUniformLocation.return_value = 3
+        program, = self.createPrograms(mockGl, 1)
+
+        program.setUniformf('dt', 0.5)
+
+        self.assertEquals(mockGl.glLinkProgram.call_count, 1)
+        self.assertEquals(mockGl.glGetUniformLocation.call_args,
+            ((program.id, 'dt'), {}))
+        self.assertEquals(mockGl.glUniform1f.call_args, ((3, 0.5), {}))
+
+
+    @patch('shader.gl')
+    def testSettingUniformFinishesStartedBuild(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        mockGl.glGetUniformLocation.return_value = 3
+        program, = self.createPrograms(mockGl, 1)
+        program.startBuild()
+
+        program.setUniformf('dt', 0.5)
+        program.use()
+
+        self.assertEquals(mockGl.glLinkProgram.call_count, 1)
+        self.assertEquals(mockGl.glUniform1f.call_args, ((3, 0.5), {}))
+
+
+
+class ShaderLifetimeTest(TestCase):
+
+    def setUpGl(self, mockGl):
+        mockGl.gl_info.have_extension.return_value = False
+        mockGl.glGetShaderiv.side_effect = mockGetParams(
+            {mockGl.GL_COMPILE_STATUS: 1})
+        mockGl.glGetProgramiv.side_effect = mockGetParams(
+            {mockGl.GL_LINK_STATUS: 1})
+        ids = iter(xrange(10, 100))
+        mockGl.glCreateShader.side_effect = lambda _: ids.next()
+        mockGl.glCreateProgram.return_value = 1
+
+
+    @patch('shader.gl')
+    def testDetachesAndDeletesShadersAfterLink(self, mockGl):
+        self.setUpGl(mockGl)
+        program = ShaderProgram(VertexShader('vs'), FragmentShader('fs'))
+
+        program.build()
+
+        self.assertEquals(
+            [args for args, _ in mockGl.glDetachShader.call_args_list],
+            [(1, 10), (1, 11)])
+        self.assertEquals(
+            [args for args, _ in mockGl.glDeleteShader.call_args_list],
+            [(10,), (11,)])
+        self.assertEquals([s.id for s in program.shaders], [None, None])
+        self.assertEquals(program.shaders[0].sources, ('vs',))
+
+
+    @patch('shader.gl')
+    def testKeepsSharedShaders(self, mockGl):
+        self.setUpGl(mockGl)
+        vertex = VertexShader('vs')
+        program1 = ShaderProgram(vertex, FragmentShader('fs1'))
+        ShaderProgram(vertex, FragmentShader('fs2'))
+
+        program1.build()
+
+        self.assertEquals(mockGl.glDetachShader.call_count, 2)
+        self.assertEquals(
+            [args for args, _ in mockGl.glDeleteShader.call_args_list],
+            [(11,)])
+        self.assertEquals(vertex.id, 10)
+
+
+    @patch('shader.gl')
+    def testKeepsShadersMarkedToKeep(self, mockGl):
+        self.setUpGl(mockGl)
+        vertex = VertexShader('vs')
+        vertex.keepAfterLink = True
+        program = ShaderProgram(vertex, FragmentShader('fs'))
+
+        program.build()
+
+        self.assertEquals(vertex.id, 10)
+        self.assertEquals(mockGl.glDeleteShader.call_count, 1)
+
+
+    @patch('shader.gl')
+    def testKeepsShadersIfDisabled(self, mockGl):
+        self.setUpGl(mockGl)
+        program = ShaderProgram(VertexShader('vs'), FragmentShader('fs'))
+        program.deleteShadersAfterLink = False
+
+        program.build()
+
+        self.assertFalse(mockGl.glDetachShader.called)
+        self.assertFalse(mockGl.glDeleteShader.called)
+
+
+    @patch('shader.gl')
+    def testWithDeletesProgram(self, mockGl):
+        self.setUpGl(mockGl)
+        with ShaderProgram(VertexShader('vs'), FragmentShader('fs')) as program:
+            program.build()
+
+        self.assertEquals(mockGl.glDeleteProgram.call_args, ((1,), {}))
+        self.assertTrue(program.id is None)
+
+
+
+def mockGetActiveUniform(uniforms):
+    def _mockGetActiveUniform(_, index, __, ___, p_size, p_type, p_name):
+        name, uniformType, size = uniforms[index]
+        p_size._obj.value = size
+        p_type._obj.value = uniformType
+        p_name.value = name
+    return _mockGetActiveUniform
+
+
+def createBuiltProgram(mockGl, uniforms):
+    locations = dict((name, index) for index, (name, _, _) in enumerate(uniforms))
+    mockGl.glGetActiveUniform.side_effect = mockGetActiveUniform(uniforms)
+    mockGl.glGetUniformLocation.side_effect = \
+        lambda _, name: locations.get(name, -1)
+    program = ShaderProgram()
+    program.id = 123
+    program._get = {
+        mockGl.GL_ACTIVE_UNIFORMS: len(uniforms),
+        mockGl.GL_ACTIVE_UNIFORM_MAX_LENGTH: 64,
+    }.get
+    program._reflectUniforms()
+    return program
+
+
+
+class UniformTest(TestCase):
+
+    @patch('shader.gl')
+    def testReflectUniforms(self, mockGl):
+        program = createBuiltProgram(mockGl, [
+            ('color', gl.GL_FLOAT_VEC4, 1),
+            ('lights[0]', gl.GL_FLOAT_VEC3, 8),
+            ('shadows[0]', gl.GL_SAMPLER_2D_SHADOW, 2),
+            ('albedo', gl.GL_SAMPLER_2D, 1),
+        ])
+
+        self.assertEquals(sorted(program.uniforms.keys()),
+            ['albedo', 'color', 'lights', 'shadows'])
+        self.assertEquals(program.samplerUnits, {'albedo': 0, 'shadows': 1})
+        uniform = program.uniforms['lights']
+        self.assertEquals(uniform.location, 1)
+        self.assertEquals(uniform.type, gl.GL_FLOAT_VEC3)
+        self.assertEquals(uniform.size, 8)
+
+
+    @patch('shader.gl')
+    def testReflectAttributes(self, mockGl):
+        attributes = ['gl_Vertex', 'position', 'uv']
+        mockGl.glGetActiveAttrib.side_effect = mockGetActiveUniform(
+            [(name, gl.GL_FLOAT_VEC4, 1) for name in attributes])
+        mockGl.glGetAttribLocation.side_effect = \
+            lambda _, name: attributes.index(name)
+        program = ShaderProgram()
+        program._get = {
+            mockGl.GL_ACTIVE_ATTRIBUTES: len(attributes),
+            mockGl.GL_ACTIVE_ATTRIBUTE_MAX_LENGTH: 64,
+        }.get
+
+        program._reflectAttributes()
+
+        self.assertEquals(program.attributes, {'position': 1, 'uv': 2})
+
+
+    @patch('shader.gl')
+    def testGetUniformLocationIsCached(self, mockGl):
+        program = createBuiltProgram(mockGl, [('color', gl.GL_FLOAT_VEC4, 1)])
+        lookups = mockGl.glGetUniformLocation.call_count
+
+        self.assertEquals(program.getUniformLocation('color'), 0)
+        self.assertEquals(program.getUniformLocation('color'), 0)
+        self.assertEquals(program.getUniformLocation('missing'), -1)
+        self.assertEquals(program.getUniformLocation('missing'), -1)
+
+        self.assertEquals(mockGl.glGetUniformLocation.call_count, lookups + 1)
+        self.assertEquals(program.uniformHits, 3)
+        self.assertEquals(program.uniformMisses, 1)
+
+
+    @patch('shader.gl')
+    def testSetUniformf(self, mockGl):
+        program = createBuiltProgram(mockGl, [
+            ('scale', gl.GL_FLOAT, 1),
+            ('color', gl.GL_FLOAT_VEC4, 1),
+        ])
+
+        program.setUniformf('scale', 2.0)
+        program.setUniformf('color', 1, 0, 0, 1)
+
+        self.assertEquals(mockGl.glUniform1f.call_args, ((0, 2.0), {}))
+        self.assertEquals(mockGl.glUniform4f.call_args, ((1, 1, 0, 0, 1), {}))
+        self.assertEquals(mockGl.glUseProgram.call_args, ((123,), {}))
+
+
+    @patch('shader.gl')
+    def testSetUniformi(self, mockGl):
+        program = createBuiltProgram(mockGl, [('index', gl.GL_INT_VEC2, 1)])
+
+        program.setUniformi('index', 3, 4)
+
+        self.assertEquals(mockGl.glUniform2i.call_args, ((0, 3, 4), {}))
+
+
+    @patch('shader.gl', Mock())
+    def testSetUniformChecksValueCount(self):
+        program = ShaderProgram()
+        self.assertRaises(ValueError, program.setUniformf, 'a')
+        self.assertRaises(ValueError, program.setUniformi, 'a', 1, 2, 3, 4, 5)
+        self.assertRaises(ValueError, program.setUniformMatrix, 'a', [1] * 8)
+
+
+    @patch('shader.gl')
+    def testSetUniformMatrix(self, mockGl):
+        program = createBuiltProgram(mockGl, [('mvp', gl.GL_FLOAT_MAT2, 1)])
+
+        program.setUniformMatrix('mvp', [[1, 2], [3, 4]], transpose=True)
+
+        location, count, transpose, array = \
+            mockGl.glUniformMatrix2fv.call_args[0]
+        self.assertEquals((location, count, transpose), (0, 1, True))
+        self.assertEquals(list(array), [1, 2, 3, 4])
+
+
+    @patch('shader.gl')
+    def testUnchangedUniformIsNotUploaded(self, mockGl):
+        program = createBuiltProgram(mockGl, [
+            ('color', gl.GL_FLOAT_VEC3, 1),
+            ('mvp', gl.GL_FLOAT_MAT2, 1),
+        ])
+
+        program.setUniformf('color', 1, 2, 3)
+        program.setUniformf('color', 1, 2, 3)
+        program.setUniformf('color', 1, 2, 4)
+        program.setUniformMatrix('mvp', [1, 2, 3, 4])
+        program.setUniformMatrix('mvp', [1, 2, 3, 4])
+        program.setUniformMatrix('mvp', [1, 2, 3, 4], transpose=True)
+
+        self.assertEquals(mockGl.glUniform3f.call_count, 2)
+        self.assertEquals(mockGl.glUniformMatrix2fv.call_count, 2)
+        self.assertEquals(program.uniformUploads, 4)
+        self.assertEquals(program.uniformSkips, 2)
+
+
+    @patch('shader.gl')
+    def testInactiveUniformIsNotUploaded(self, mockGl):
+        program = createBuiltProgram(mockGl, [])
+
+        program.setUniformf('unused', 1)
+
+        self.assertFalse(mockGl.glUniform1f.called)
+        self.assertEquals(program.uniformUploads, 0)
+
+
+    @patch('shader.gl')
+    def testReflectUniformBlocks(self, mockGl):
+        members = {3: ('Camera.view', 0), 5: ('Camera.time', 64)}
+        def mockGetActiveUniformBlockiv(_, index, paramId, p_value):
+            if paramId is mockGl.GL_UNIFORM_BLOCK_ACTIVE_UNIFORM_INDICES:
+                p_value[:] = sorted(members.keys())
+            else:
+                p_value._obj.value = {
+                    mockGl.GL_UNIFORM_BLOCK_DATA_SIZE: 80,
+                    mockGl.GL_UNIFORM_BLOCK_ACTIVE_UNIFORMS: len(members),
+                }[paramId]
+        def mockGetActiveUniformsiv(_, count, indices, paramId, p_offsets):
+            p_offsets[:] = [members[index][1] for index in indices]
+        def mockGetActiveUniformName(_, index, __, ___, p_name):
+            p_name.value = members[index][0]
+        mockGl.glGetActiveUniformBlockName.side_effect = \
+            lambda _, __, ___, ____, p_name: setattr(p_name, 'value', 'Camera')
+        mockGl.glGetActiveUniformBlockiv.side_effect = \
+            mockGetActiveUniformBlockiv
+        mockGl.glGetActiveUniformsiv.side_effect = mockGetActiveUniformsiv
+        mockGl.glGetActiveUniformName.side_effect = mockGetActiveUniformName
+        program = ShaderProgram()
+        program._get = lambda paramId: 1 if \
+            paramId is mockGl.GL_ACTIVE_UNIFORM_BLOCKS else 32
+
+        program._reflectUniformBlocks()
+
+        block = program.uniformBlocks['Camera']
+        self.assertEquals((block.index, block.size), (0, 80))
+        self.assertEquals(block.offsets, {'Camera.view': 0, 'Camera.time': 64})
+
+
+    @patch('shader.gl')
+    def testNoUniformBlocksBeforeGl31(self, mockGl):
+        mockGl.gl_info.have_version.return_value = False
+        mockGl.gl_info.have_extension.return_value = False
+        program = ShaderProgram()
+        program._get = Mock(return_value=1)
+
+        program._reflectUniformBlocks()
+
+        self.assertEquals(program.uniformBlocks, {})
+        self.assertFalse(program._get.called)
+        self.assertEquals(mockGl.gl_info.have_version.call_args, ((3, 1), {}))
+
+
+    @patch('shader.gl')
+    def testRebuildForgetsUploadedValues(self, mockGl):
+        program = createBuiltProgram(mockGl, [('scale', gl.GL_FLOAT, 1)])
+        program.setUniformf('scale', 1)
+
+        program._reflectUniforms()
+        program.setUniformf('scale', 1)
+
+        self.assertEquals(mockGl.glUniform1f.call_count, 2)
+
 
 
 if __name__ == '__main__':
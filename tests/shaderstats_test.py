@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+import json
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+import shader
+from shader import FragmentShader, ShaderProgram, VertexShader
+from shaderstats import disableStats, enableStats
+
+
+class FakeClock(object):
+    '''
+    Each call returns a time one second after the previous one.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+
+def mockGetParams(values):
+    def _mockGetParams(_, paramId, p_value):
+        p_value._obj.value = values.get(paramId, 0)
+    return _mockGetParams
+
+
+def setUpMockGl(mockGl):
+    mockGl.current_context = Mock()
+    status = mockGetParams({
+        mockGl.GL_COMPILE_STATUS: 1,
+        mockGl.GL_LINK_STATUS: 1,
+    })
+    mockGl.glGetShaderiv.side_effect = status
+    mockGl.glGetProgramiv.side_effect = status
+
+
+class ShaderStatsTest(TestCase):
+
+    def tearDown(self):
+        disableStats()
+
+
+    @patch('shader.gl')
+    def testDisabledByDefault(self, mockGl):
+        setUpMockGl(mockGl)
+        self.assertTrue(shader.stats is None)
+
+        program = ShaderProgram(VertexShader('v'))
+        program.use()
+
+
+    @patch('shader.gl')
+    def testRecordsCompilesLinksAndBinds(self, mockGl):
+        setUpMockGl(mockGl)
+        stats = enableStats(clock=FakeClock())
+        vert = VertexShader('v')
+        vert.name = 'a.vert'
+        program = ShaderProgram(vert, FragmentShader('f'))
+        program.name = 'terrain'
+
+        program.use()
+        program.use()
+        program.use()
+
+        snapshot = stats.snapshot()
+        self.assertEquals(snapshot['stages']['a.vert'],
+            {'compiles': 1, 'compileTime': 2.0, 'infoLogFetches': 0})
+        self.assertEquals(snapshot['programs']['terrain'], {
+            'links': 1,
+            'linkTime': 2.0,
+            'binds': 1,
+            'redundantBinds': 2,
+            'infoLogFetches': 0,
+        })
+        self.assertEquals(snapshot['totals']['compiles'], 2)
+        self.assertEquals(sorted(snapshot['stages'].keys()),
+            ['FragmentShader %s' % (program.shaders[1].getSourceHash()[:8],),
+                'a.vert'])
+        # the snapshot is plain data, ready to export
+        self.assertEquals(json.loads(json.dumps(snapshot)), snapshot)
+
+
+    @patch('shader.gl')
+    def testCountsInfoLogFetches(self, mockGl):
+        setUpMockGl(mockGl)
+        mockGl.glGetShaderiv.side_effect = mockGetParams({
+            mockGl.GL_COMPILE_STATUS: 1,
+            mockGl.GL_INFO_LOG_LENGTH: 10,
+        })
+        mockGl.glGetProgramiv.side_effect = mockGetParams({
+            mockGl.GL_LINK_STATUS: 1,
+            mockGl.GL_INFO_LOG_LENGTH: 10,
+        })
+        stats = enableStats()
+        program = ShaderProgram(VertexShader('v'))
+
+        program.build()
+
+        totals = stats.snapshot()['totals']
+        self.assertEquals(totals['infoLogFetches'], 2)
+
+
+    @patch('shader.gl')
+    def testUnnamedProgramsAreNamedByTheirShaders(self, mockGl):
+        vert = VertexShader('v')
+        vert.name = 'a.vert'
+        frag = FragmentShader('f')
+        frag.name = 'a.frag'
+
+        self.assertEquals(ShaderProgram(vert, frag).getName(),
+            'a.vert + a.frag')
+
+
+    @patch('shader.gl')
+    def testPushPassesSnapshotToHook(self, mockGl):
+        setUpMockGl(mockGl)
+        pushed = []
+        stats = enableStats(hook=pushed.append)
+        program = ShaderProgram(VertexShader('v'))
+        program.name = 'p'
+        program.use()
+
+        stats.push(reset=True)
+        stats.push()
+
+        self.assertEquals(len(pushed), 2)
+        self.assertEquals(pushed[0]['programs']['p']['links'], 1)
+        self.assertEquals(pushed[1]['programs'], {})
+
+
+
+if __name__ == '__main__':
+    main()
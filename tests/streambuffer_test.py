@@ -0,0 +1,249 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+import numpy
+
+from mock import Mock, patch
+
+import fixpath
+
+from glerrors import GLError
+from streambuffer import GL_MAP_PERSISTENT_BIT, StreamBuffer
+
+
+def mockGenId(newId):
+    def _mockGenId(_, p_id):
+        p_id._obj.value = newId
+    return _mockGenId
+
+
+def mockWaitResults(results):
+    results = list(results)
+    def _mockClientWaitSync(fence, flags, timeout):
+        return results.pop(0)
+    return _mockClientWaitSync
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        self.time += 1.0
+        return self.time
+
+
+
+def setUpGl(mockGl):
+    for name in ['GL_ARRAY_BUFFER', 'GL_UNIFORM_BUFFER', 'GL_STREAM_DRAW',
+        'GL_MAP_WRITE_BIT', 'GL_ALREADY_SIGNALED', 'GL_CONDITION_SATISFIED',
+        'GL_TIMEOUT_EXPIRED', 'GL_WAIT_FAILED']:
+        setattr(mockGl, name, getattr(gl, name))
+    mockGl.glGenBuffers.side_effect = mockGenId(5)
+    mockGl.glClientWaitSync.side_effect = \
+        lambda *_: gl.GL_ALREADY_SIGNALED
+
+
+
+class OrphaningStreamBufferTest(TestCase):
+
+    @patch('streambuffer.gl')
+    def testRegionsAreAligned(self, mockGl):
+        setUpGl(mockGl)
+
+        stream = StreamBuffer(3000, frames=3, persistent=False)
+
+        self.assertEquals(stream.regionSize, 768)
+        self.assertEquals(stream.size, 2304)
+        self.assertEquals(mockGl.glBufferData.call_args,
+            ((gl.GL_ARRAY_BUFFER, 2304, None, gl.GL_STREAM_DRAW), {}))
+        self.assertRaises(ValueError, StreamBuffer, 100, persistent=False)
+
+
+    @patch('streambuffer.gl')
+    def testWritesAreUploadedIntoEachRegionInTurn(self, mockGl):
+        setUpGl(mockGl)
+        stream = StreamBuffer(3 * 256, frames=3, persistent=False)
+        data = numpy.arange(4, dtype=numpy.float32)
+
+        offsets = []
+        for frame in xrange(4):
+            stream.beginFrame()
+            offsets.append(stream.write(data))
+            offsets.append(stream.write(data, alignment=64))
+            stream.endFrame()
+
+        self.assertEquals(offsets, [0, 64, 256, 320, 512, 576, 0, 64])
+        uploads = [args[1:3]
+            for args, _ in mockGl.glBufferSubData.call_args_list]
+        self.assertEquals(uploads[:4], [(0, 16), (16, 64), (256, 16),
+            (272, 64)])
+        self.assertEquals(list(stream.memory[576:592].view(numpy.float32)),
+            [0, 1, 2, 3])
+        # orphaned on creation, and when the ring wraps
+        self.assertEquals(mockGl.glBufferData.call_count, 3)
+        self.assertFalse(mockGl.glFenceSync.called)
+        self.assertEquals(stream.getMetrics(), {
+            'bytesWritten': 128,
+            'waits': 0,
+            'waitTime': 0.0,
+            'orphans': 2,
+        })
+
+
+    @patch('streambuffer.gl')
+    def testAllocatedViewsAreSentOnFlush(self, mockGl):
+        setUpGl(mockGl)
+        stream = StreamBuffer(3 * 256, frames=3, persistent=False)
+        stream.beginFrame()
+
+        offset, view = stream.allocate(8)
+        view.view(numpy.float32)[:] = (1, 2)
+        self.assertFalse(mockGl.glBufferSubData.called)
+        stream.flush()
+        stream.flush()
+
+        self.assertEquals(mockGl.glBufferSubData.call_count, 1)
+        self.assertRaises(ValueError, stream.allocate, 256)
+
+
+    @patch('streambuffer.gl')
+    def testWriteVerticesAndUniformBlocks(self, mockGl):
+        setUpGl(mockGl)
+        def mockGetIntegerv(_, p_value):
+            p_value._obj.value = 256
+        mockGl.glGetIntegerv.side_effect = mockGetIntegerv
+        stream = StreamBuffer(3 * 1024, frames=3, persistent=False)
+        block = Mock()
+        block.data = numpy.zeros(4, numpy.float32)
+        block.size = 16
+        block.binding = 2
+        stream.beginFrame()
+
+        first = stream.writeVertices(numpy.zeros(9, numpy.float32), 12)
+        offset = stream.writeUniformBlock(block)
+        second = stream.writeVertices(numpy.zeros(3, numpy.float32), 12)
+
+        self.assertEquals((first, offset, second), (0, 256, 23))
+        self.assertEquals(mockGl.glBindBufferRange.call_args,
+            ((gl.GL_UNIFORM_BUFFER, 2, 5, 256, 16), {}))
+
+
+    @patch('streambuffer.gl')
+    def testVertexIndicesInLaterRegions(self, mockGl):
+        setUpGl(mockGl)
+        # regions of 1024 bytes, which isn't a multiple of the stride
+        stream = StreamBuffer(3 * 1024, frames=3, persistent=False)
+        data = numpy.arange(6, dtype=numpy.float32)
+
+        for frame in xrange(3):
+            stream.beginFrame()
+            first = stream.writeVertices(data, 12)
+            stream.endFrame()
+
+            vertices = stream.memory.view(numpy.float32).reshape(-1, 3)
+            self.assertEquals(list(vertices[first]), [0, 1, 2])
+            self.assertEquals(list(vertices[first + 1]), [3, 4, 5])
+            self.assertTrue(first * 12 >= stream.getRegionStart())
+
+
+
+class PersistentStreamBufferTest(TestCase):
+
+    def setUp(self):
+        self.storage = numpy.zeros(3 * 256, numpy.uint8)
+
+
+    def createStream(self, mockGl, **kwargs):
+        setUpGl(mockGl)
+        mockGl.gl_info.have_extension.return_value = True
+        mockGl.glMapBufferRange.return_value = self.storage.ctypes.data
+        self.bufferStorage = Mock()
+        mockGl.lib.link_GL.return_value = self.bufferStorage
+        return StreamBuffer(3 * 256, frames=3, **kwargs)
+
+
+    @patch('streambuffer.gl')
+    def testWritesGoStraightToMappedMemory(self, mockGl):
+        stream = self.createStream(mockGl)
+        self.assertTrue(stream.persistent)
+        flags = self.bufferStorage.call_args[0][3]
+        self.assertTrue(flags & GL_MAP_PERSISTENT_BIT)
+        self.assertEquals(mockGl.glMapBufferRange.call_args[0][:3],
+            (gl.GL_ARRAY_BUFFER, 0, 768))
+
+        stream.beginFrame()
+        stream.beginFrame()
+        offset = stream.write(numpy.array([7, 8], numpy.uint8))
+
+        self.assertEquals(offset, 256)
+        self.assertEquals(list(self.storage[256:258]), [7, 8])
+        self.assertFalse(mockGl.glBufferSubData.called)
+        self.assertFalse(mockGl.glBufferData.called)
+
+
+    @patch('streambuffer.gl')
+    def testWaitsOnFenceOnlyWhenReusingBusyRegion(self, mockGl):
+        clock = FakeClock()
+        stream = self.createStream(mockGl, clock=clock)
+        fences = ['fence0', 'fence1', 'fence2', 'fence3']
+        mockGl.glFenceSync.side_effect = lambda *_: fences.pop(0)
+        mockGl.glClientWaitSync.side_effect = mockWaitResults([
+            gl.GL_TIMEOUT_EXPIRED, gl.GL_TIMEOUT_EXPIRED,
+            gl.GL_CONDITION_SATISFIED, gl.GL_ALREADY_SIGNALED,
+        ])
+
+        for frame in xrange(3):
+            stream.beginFrame()
+            stream.endFrame()
+        self.assertFalse(mockGl.glClientWaitSync.called)
+        stream.beginFrame()
+        stream.endFrame()
+        stream.beginFrame()
+
+        self.assertEquals(
+            [args[0] for args, _ in mockGl.glClientWaitSync.call_args_list],
+            ['fence0'] * 3 + ['fence1'])
+        self.assertEquals(mockGl.glDeleteSync.call_args_list,
+            [(('fence0',), {}), (('fence1',), {})])
+        self.assertEquals(stream.waits, 1)
+        self.assertEquals(stream.waitTime, 1.0)
+
+
+    @patch('streambuffer.gl')
+    def testFailedWaitRaises(self, mockGl):
+        stream = self.createStream(mockGl)
+        mockGl.glFenceSync.return_value = 'fence'
+        mockGl.glClientWaitSync.side_effect = mockWaitResults([
+            gl.GL_TIMEOUT_EXPIRED, gl.GL_WAIT_FAILED])
+        for frame in xrange(3):
+            stream.beginFrame()
+            stream.endFrame()
+
+        self.assertRaises(GLError, stream.beginFrame)
+
+
+    @patch('streambuffer.gl')
+    def testDeleteUnmapsAndDeletesFences(self, mockGl):
+        stream = self.createStream(mockGl)
+        mockGl.glFenceSync.return_value = 'fence'
+        stream.beginFrame()
+        stream.endFrame()
+
+        stream.delete()
+
+        self.assertEquals(mockGl.glDeleteSync.call_args, (('fence',), {}))
+        self.assertTrue(mockGl.glUnmapBuffer.called)
+        self.assertTrue(mockGl.glDeleteBuffers.called)
+        self.assertTrue(stream.id is None)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from shader import assignSamplerUnits, Uniform
+from textures import getTextureUnits, Sampler, TextureUnits
+
+
+def createProgram(uniforms):
+    program = Mock()
+    program.uniforms = dict((uniform.name, uniform) for uniform in uniforms)
+    program.samplerUnits = assignSamplerUnits(program.uniforms)
+    return program
+
+
+class AssignSamplerUnitsTest(TestCase):
+
+    def testEachSamplerGetsItsOwnUnits(self):
+        units = assignSamplerUnits(dict((uniform.name, uniform) for uniform in [
+            Uniform('diffuse', 0, gl.GL_SAMPLER_2D, 1),
+            Uniform('scale', 1, gl.GL_FLOAT, 1),
+            Uniform('cascades', 2, gl.GL_SAMPLER_2D_SHADOW, 3),
+            Uniform('sky', 3, gl.GL_SAMPLER_CUBE, 1),
+        ]))
+
+        self.assertEquals(units, {'cascades': 0, 'diffuse': 3, 'sky': 4})
+
+
+
+class TextureUnitsTest(TestCase):
+
+    def setUp(self):
+        self.program = createProgram([
+            Uniform('diffuse', 0, gl.GL_SAMPLER_2D, 1),
+            Uniform('shadows', 1, gl.GL_SAMPLER_2D_SHADOW, 2),
+            Uniform('tint', 3, gl.GL_FLOAT_VEC4, 1),
+        ])
+
+
+    @patch('textures.gl')
+    def testSkipsBindsAlreadyInPlace(self, mockGl):
+        mockGl.GL_TEXTURE0 = gl.GL_TEXTURE0
+        units = TextureUnits()
+
+        units.bindTexture(0, gl.GL_TEXTURE_2D, 5)
+        units.bindTexture(1, gl.GL_TEXTURE_2D, 6)
+        units.bindTexture(0, gl.GL_TEXTURE_2D, 5)
+        units.bindTexture(1, gl.GL_TEXTURE_2D, 7)
+
+        self.assertEquals(mockGl.glActiveTexture.call_args_list,
+            [((gl.GL_TEXTURE0,), {}), ((gl.GL_TEXTURE0 + 1,), {})])
+        self.assertEquals(mockGl.glBindTexture.call_args_list, [
+            ((gl.GL_TEXTURE_2D, 5), {}),
+            ((gl.GL_TEXTURE_2D, 6), {}),
+            ((gl.GL_TEXTURE_2D, 7), {}),
+        ])
+        self.assertEquals(units.getStats(),
+            {'bindsIssued': 3, 'bindsElided': 1})
+
+
+    @patch('textures.gl')
+    def testBindsTexturesBySamplerName(self, mockGl):
+        mockGl.GL_TEXTURE0 = gl.GL_TEXTURE0
+        units = TextureUnits()
+        textures = {
+            'diffuse': (gl.GL_TEXTURE_2D, 5),
+            'shadows[1]': (gl.GL_TEXTURE_2D, 8),
+            'tint': (gl.GL_TEXTURE_2D, 9),
+            'unused': (gl.GL_TEXTURE_2D, 9),
+        }
+
+        units.bindProgramTextures(self.program, textures,
+            samplers={'shadows[1]': 4})
+        units.bindProgramTextures(self.program, textures,
+            samplers={'shadows[1]': 4})
+
+        self.assertEquals(sorted(units.textures.items()), [
+            (0, (gl.GL_TEXTURE_2D, 5)),
+            (2, (gl.GL_TEXTURE_2D, 8)),
+        ])
+        self.assertEquals(mockGl.glBindSampler.call_args_list,
+            [((2, 4), {})])
+        self.assertEquals(sorted(self.program.setUniformi.call_args_list)[:2],
+            [(('diffuse', 0), {}), (('diffuse', 0), {})])
+        self.assertEquals(units.getStats(),
+            {'bindsIssued': 3, 'bindsElided': 3})
+
+
+    @patch('textures.gl')
+    def testInvalidateForgetsBindings(self, mockGl):
+        mockGl.GL_TEXTURE0 = gl.GL_TEXTURE0
+        units = TextureUnits()
+        units.bindTexture(0, gl.GL_TEXTURE_2D, 5)
+        units.bindSampler(0, 3)
+
+        units.invalidate()
+        units.bindTexture(0, gl.GL_TEXTURE_2D, 5)
+        units.bindSampler(0, 3)
+
+        self.assertEquals(mockGl.glActiveTexture.call_count, 2)
+        self.assertEquals(mockGl.glBindTexture.call_count, 2)
+        self.assertEquals(mockGl.glBindSampler.call_count, 2)
+
+
+    @patch('textures.gl')
+    def testOneTextureUnitsPerContext(self, mockGl):
+        context = mockGl.current_context = Mock()
+        units = getTextureUnits()
+
+        self.assertTrue(getTextureUnits() is units)
+        mockGl.current_context = Mock()
+        self.assertFalse(getTextureUnits() is units)
+        mockGl.current_context = None
+        self.assertFalse(getTextureUnits() is getTextureUnits())
+
+
+
+class SamplerTest(TestCase):
+
+    @patch('textures.gl')
+    def testCreateSetsParameters(self, mockGl):
+        def mockGenSamplers(_, p_id):
+            p_id._obj.value = 3
+        mockGl.glGenSamplers.side_effect = mockGenSamplers
+
+        sampler = Sampler({gl.GL_TEXTURE_MIN_FILTER: gl.GL_NEAREST})
+        sampler.delete()
+
+        self.assertEquals(mockGl.glSamplerParameteri.call_args,
+            ((3, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST), {}))
+        self.assertTrue(mockGl.glDeleteSamplers.called)
+        self.assertTrue(sampler.id is None)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from ctypes import c_float
+
+from unittest import TestCase, main
+
+import numpy
+
+from mock import Mock, patch
+
+import fixpath
+
+from shader import UniformBlockInfo
+from uniformblock import std140Layout, UniformBlock
+
+
+def mockGenBuffers(bufferId):
+    def _mockGenBuffers(_, p_id):
+        p_id._obj.value = bufferId
+    return _mockGenBuffers
+
+
+def readFloats(address, count):
+    return list((c_float * count).from_address(address))
+
+
+def createProgram(offsets, index=2):
+    program = Mock()
+    program.id = 123
+    program.uniformBlockBindings = {}
+    program.uniformBlocks = {
+        'Camera': UniformBlockInfo('Camera', index, 96, offsets),
+    }
+    return program
+
+
+class Std140LayoutTest(TestCase):
+
+    def testScalarsAndVectors(self):
+        fields, size = std140Layout([
+            ('a', 'float'),
+            ('b', 'vec2'),
+            ('c', 'vec3'),
+            ('d', 'float'),
+            ('e', 'vec4'),
+            ('f', 'int'),
+        ])
+
+        self.assertEquals([field.offset for field in fields],
+            [0, 8, 16, 28, 32, 48])
+        self.assertEquals(size, 64)
+
+
+    def testArraysAndMatrices(self):
+        fields, size = std140Layout([
+            ('a', 'float', 3),
+            ('b', 'mat3'),
+            ('c', 'float'),
+            ('d', 'mat4', 2),
+            ('e', 'vec2'),
+        ])
+
+        self.assertEquals([field.offset for field in fields],
+            [0, 48, 96, 112, 240])
+        self.assertEquals([field.size for field in fields],
+            [48, 48, 4, 128, 8])
+        self.assertEquals(size, 256)
+
+
+
+class UniformBlockTest(TestCase):
+
+    def testDtypeMatchesLayout(self):
+        block = UniformBlock('Camera', [
+            ('view', 'mat4'), ('light', 'vec3'), ('time', 'float'),
+        ], binding=1)
+
+        self.assertEquals(block.dtype.itemsize, 80)
+        self.assertEquals(block.dtype.fields['time'][1], 76)
+        self.assertEquals(block.data.nbytes, 80)
+
+
+    def testSetItemIgnoresPadding(self):
+        block = UniformBlock('B', [('m', 'mat3'), ('a', 'float', 2)], 0)
+
+        block['m'] = numpy.arange(9).reshape(3, 3)
+        block['a'] = [7, 8]
+
+        self.assertEquals(block['m'].tolist(),
+            [[0, 1, 2, 0], [3, 4, 5, 0], [6, 7, 8, 0]])
+        self.assertEquals(block['a'].tolist(), [[7, 0, 0, 0], [8, 0, 0, 0]])
+
+
+    @patch('uniformblock.gl')
+    def testFirstUploadCreatesBuffer(self, mockGl):
+        mockGl.glGenBuffers.side_effect = mockGenBuffers(5)
+        block = UniformBlock('Camera', [('time', 'float')], binding=3)
+        block['time'] = 1.5
+
+        block.upload()
+
+        self.assertEquals(block.id, 5)
+        args = mockGl.glBufferData.call_args[0]
+        self.assertEquals(args[:2], (mockGl.GL_UNIFORM_BUFFER, 16))
+        self.assertEquals(readFloats(args[2], 1), [1.5])
+        self.assertEquals(mockGl.glBindBufferBase.call_args,
+            ((mockGl.GL_UNIFORM_BUFFER, 3, 5), {}))
+
+
+    @patch('uniformblock.gl')
+    def testUploadSendsOnlyDirtyRange(self, mockGl):
+        block = UniformBlock('Camera', [
+            ('view', 'mat4'), ('light', 'vec3'), ('time', 'float'),
+        ], binding=1)
+        block.upload()
+
+        block.upload()
+        self.assertFalse(mockGl.glBufferSubData.called)
+
+        block['light'] = (1, 2, 3)
+        block['time'] = 4
+        block.upload()
+
+        self.assertEquals(mockGl.glBufferSubData.call_count, 1)
+        target, offset, size, address = mockGl.glBufferSubData.call_args[0]
+        self.assertEquals((offset, size), (64, 16))
+        self.assertEquals(readFloats(address, 4), [1, 2, 3, 4])
+        self.assertEquals(block.uploads, 2)
+        self.assertEquals(block.bytesUploaded, 80 + 16)
+
+
+    @patch('uniformblock.gl')
+    def testMarkDirtyAfterDirectWrites(self, mockGl):
+        block = UniformBlock('B', [('a', 'vec4'), ('b', 'vec4')], 0)
+        block.upload()
+
+        block.data['b'][0] = (1, 2, 3, 4)
+        block.markDirty(16, 32)
+        block.upload()
+
+        self.assertEquals(mockGl.glBufferSubData.call_args[0][1:3], (16, 16))
+
+
+    @patch('uniformblock.gl')
+    def testBindToProgram(self, mockGl):
+        block = UniformBlock('Camera', [('view', 'mat4'), ('time', 'float')], 4)
+
+        program = createProgram({'Camera.view': 0, 'time': 64})
+        block.bindTo(program)
+
+        self.assertEquals(mockGl.glUniformBlockBinding.call_args,
+            ((123, 2, 4), {}))
+        self.assertEquals(program.uniformBlockBindings, {'Camera': 4})
+
+
+    @patch('uniformblock.gl')
+    def testBindToRejectsMismatchedLayout(self, mockGl):
+        block = UniformBlock('Camera', [('view', 'mat4'), ('time', 'float')], 4)
+
+        self.assertRaises(ValueError,
+            block.bindTo, createProgram({'view': 0, 'time': 68}))
+        self.assertRaises(ValueError,
+            block.bindTo, createProgram({'view': 0, 'other': 64}))
+        self.assertRaises(ValueError, UniformBlock('Other', [], 0).bindTo,
+            createProgram({}))
+        self.assertFalse(mockGl.glUniformBlockBinding.called)
+
+
+
+if __name__ == '__main__':
+    main()
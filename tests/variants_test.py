@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from shader import (
+    CompileError, FragmentShader, ShaderRegistry, VertexShader,
+)
+from variants import insertDefines, ProgramVariants
+
+
+def mockGetParams(values):
+    def _mockGetParams(_, paramId, p_value):
+        p_value._obj.value = values.get(paramId, 0)
+    return _mockGetParams
+
+
+def mockGl(compileStatus=1):
+    gl = Mock()
+    gl.gl_info.have_extension.return_value = False
+    gl.glGetShaderiv.side_effect = mockGetParams(
+        {gl.GL_COMPILE_STATUS: compileStatus})
+    gl.glGetProgramiv.side_effect = mockGetParams({gl.GL_LINK_STATUS: 1})
+    return gl
+
+
+def createVariants(**kwargs):
+    return ProgramVariants([
+        (VertexShader, ['vs']),
+        (FragmentShader, 'fs'),
+    ], **kwargs)
+
+
+class InsertDefinesTest(TestCase):
+
+    def testPrepends(self):
+        self.assertEquals(insertDefines(['a', 'b'], '#define X 1\n'),
+            ['#define X 1\n', 'a', 'b'])
+
+
+    def testKeepsVersionFirst(self):
+        self.assertEquals(
+            insertDefines(['#version 330\nvoid main(){}', 'b'], 'D\n'),
+            ['#version 330\n', 'D\n', 'void main(){}', 'b'])
+        self.assertEquals(insertDefines(['#version 330'], 'D\n'),
+            ['#version 330\n', 'D\n', ''])
+
+
+    def testKeepsVersionFirstAfterBlankLinesAndComments(self):
+        self.assertEquals(
+            insertDefines(['\n#version 330\nvoid main(){}'], 'D\n'),
+            ['\n#version 330\n', 'D\n', 'void main(){}'])
+        self.assertEquals(
+            insertDefines(['// a.glsl\n/* x\n y */\n#version 330\nz'],
+                'D\n'),
+            ['// a.glsl\n/* x\n y */\n#version 330\n', 'D\n', 'z'])
+
+
+
+class ProgramVariantsTest(TestCase):
+
+    @patch('shader.gl', mockGl())
+    def testGetCompilesEachCombinationOnce(self):
+        variants = createVariants()
+
+        program = variants.get(['SHADOWS', 'FOG'])
+
+        self.assertEquals(program.shaders[0].sources,
+            ('#define FOG 1\n#define SHADOWS 1\n', 'vs'))
+        self.assertEquals(program.shaders[1].sources,
+            ('#define FOG 1\n#define SHADOWS 1\n', 'fs'))
+        self.assertTrue(variants.get(['FOG', 'SHADOWS']) is program)
+        self.assertTrue(variants.get({'FOG': 1, 'SHADOWS': 1}) is program)
+        self.assertFalse(variants.get(['FOG']) is program)
+        self.assertEquals(variants.compiles, 2)
+        self.assertEquals(variants.getHitRate(), 0.5)
+
+
+    @patch('shader.gl', mockGl())
+    def testDefineValues(self):
+        variants = createVariants()
+
+        program = variants.get({'LIGHTS': 4})
+
+        self.assertEquals(program.shaders[0].sources[0], '#define LIGHTS 4\n')
+
+
+    @patch('shader.gl')
+    def testEvictsLeastRecentlyUsed(self, gl):
+        gl.gl_info.have_extension.return_value = False
+        gl.glGetShaderiv.side_effect = mockGetParams({gl.GL_COMPILE_STATUS: 1})
+        gl.glGetProgramiv.side_effect = mockGetParams({gl.GL_LINK_STATUS: 1})
+        variants = createVariants(maxPrograms=2)
+        a = variants.get(['A'])
+        b = variants.get(['B'])
+        variants.get(['A'])
+
+        variants.get(['C'])
+
+        self.assertEquals(sorted(variants.programs.keys()),
+            [(('A', 1),), (('C', 1),)])
+        self.assertTrue(b.id is None)
+        self.assertTrue(a.id is not None)
+        self.assertEquals(gl.glDeleteProgram.call_count, 1)
+        # each variant's shaders are deleted as soon as it is linked
+        self.assertEquals(gl.glDeleteShader.call_count, 6)
+        self.assertEquals(variants.getStats(), {
+            'programs': 2, 'hits': 1, 'misses': 3, 'hitRate': 0.25,
+            'compiles': 3, 'evictions': 1,
+        })
+
+
+    @patch('shader.gl', mockGl(compileStatus=0))
+    def testFailedVariantIsNotCached(self):
+        variants = createVariants()
+
+        self.assertRaises(CompileError, variants.get, ['BROKEN'])
+
+        self.assertEquals(len(variants.programs), 0)
+        self.assertEquals(variants.compiles, 0)
+
+
+    @patch('shader.gl', mockGl())
+    def testUsesRegistry(self):
+        registry = ShaderRegistry()
+        variants = createVariants(registry=registry)
+
+        variants.get(['A'])
+        variants.get(['B'])
+
+        self.assertEquals(len(registry), 4)
+        variants.delete()
+        self.assertEquals(len(registry), 0)
+
+
+
+if __name__ == '__main__':
+    main()
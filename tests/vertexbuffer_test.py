@@ -0,0 +1,260 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+from array import array
+from ctypes import c_float
+
+from pyglet import gl
+
+from unittest import TestCase, main
+
+import numpy
+
+from mock import Mock, patch
+
+import fixpath
+
+from vertexbuffer import getBufferAddress, VertexArray, VertexBuffer
+
+
+def mockGenId(newId):
+    def _mockGenId(_, p_id):
+        p_id._obj.value = newId
+    return _mockGenId
+
+
+def createProgram(attributes):
+    program = Mock()
+    program.id = 123
+    program.attributes = attributes
+    return program
+
+
+def glCallCount(mockGl):
+    return len(mockGl.method_calls)
+
+
+class GetBufferAddressTest(TestCase):
+
+    def testArray(self):
+        data = array('f', [1, 2, 3])
+
+        address, size = getBufferAddress(data)
+
+        self.assertEquals(address, data.buffer_info()[0])
+        self.assertEquals(size, 12)
+
+
+    def testNumpyIsNotCopied(self):
+        data = numpy.arange(4, dtype=numpy.float32)
+
+        address, size = getBufferAddress(data)
+
+        self.assertEquals(address, data.ctypes.data)
+        self.assertEquals(size, 16)
+        data[2] = 7
+        self.assertEquals((c_float * 4).from_address(address)[2], 7)
+
+
+    def testRejectsNonContiguous(self):
+        self.assertRaises(TypeError,
+            getBufferAddress, numpy.arange(8, dtype=numpy.float32)[::2])
+        self.assertRaises(TypeError, getBufferAddress, [1.0, 2.0])
+
+
+
+class VertexBufferTest(TestCase):
+
+    @patch('vertexbuffer.gl')
+    def testInitUploadsDataWithoutCopy(self, mockGl):
+        mockGl.glGenBuffers.side_effect = mockGenId(7)
+        data = numpy.zeros(6, dtype=numpy.float32)
+
+        buffer = VertexBuffer(data)
+
+        self.assertEquals(buffer.id, 7)
+        self.assertEquals(buffer.size, 24)
+        self.assertEquals(mockGl.glBindBuffer.call_args,
+            ((gl.GL_ARRAY_BUFFER, 7), {}))
+        self.assertEquals(mockGl.glBufferData.call_args,
+            ((gl.GL_ARRAY_BUFFER, 24, data.ctypes.data, gl.GL_STATIC_DRAW), {}))
+
+
+    @patch('vertexbuffer.gl')
+    def testSetSubData(self, mockGl):
+        buffer = VertexBuffer(array('f', [0] * 4))
+        data = array('f', [1, 2])
+
+        buffer.setSubData(8, data)
+
+        self.assertEquals(mockGl.glBufferSubData.call_args,
+            ((gl.GL_ARRAY_BUFFER, 8, 8, data.buffer_info()[0]), {}))
+        self.assertRaises(ValueError, buffer.setSubData, 12, data)
+
+
+    @patch('vertexbuffer.gl')
+    def testDelete(self, mockGl):
+        mockGl.glGenBuffers.side_effect = mockGenId(7)
+        buffer = VertexBuffer('data')
+
+        buffer.delete()
+
+        self.assertTrue(mockGl.glDeleteBuffers.called)
+        self.assertTrue(buffer.id is None)
+
+
+
+class VertexArrayTest(TestCase):
+
+    @patch('vertexbuffer.gl')
+    def testCountIsTakenFromAttributes(self, mockGl):
+        vao = VertexArray(createProgram({}))
+
+        vao.setAttribute('position', VertexBuffer(array('f', [0] * 12)), 3)
+        self.assertEquals(vao.count, 4)
+
+        vao.setAttribute('uv', VertexBuffer(array('f', [0] * 12)), 2,
+            stride=16, offset=8)
+        self.assertEquals(vao.count, 3)
+
+
+    @patch('vertexbuffer.gl')
+    def testFirstDrawSetsUpAttributesByName(self, mockGl):
+        mockGl.glGenVertexArrays.side_effect = mockGenId(9)
+        program = createProgram({'position': 3, 'uv': 1})
+        position = VertexBuffer(array('f', [0] * 12))
+        vao = VertexArray(program)
+        vao.setAttribute('position', position, 3)
+        vao.setAttribute('uv', VertexBuffer(array('f', [0] * 16)), 2,
+            stride=16, offset=8)
+        vao.setAttribute('unused', VertexBuffer(array('f', [0] * 8)), 2)
+
+        vao.draw(gl.GL_TRIANGLES)
+
+        self.assertTrue(program.use.called)
+        self.assertEquals(mockGl.glBindVertexArray.call_args, ((9,), {}))
+        self.assertEquals(mockGl.glEnableVertexAttribArray.call_args_list,
+            [((3,), {}), ((1,), {})])
+        self.assertEquals(mockGl.glVertexAttribPointer.call_args_list, [
+            ((3, 3, gl.GL_FLOAT, False, 0, 0), {}),
+            ((1, 2, gl.GL_FLOAT, False, 16, 8), {}),
+        ])
+        self.assertEquals(mockGl.glDrawArrays.call_args,
+            ((gl.GL_TRIANGLES, 0, 4), {}))
+
+
+    @patch('vertexbuffer.gl')
+    def testDrawCallsDoNotDependOnVertexCount(self, mockGl):
+        calls = []
+        for numVertices in [3, 30000]:
+            vao = VertexArray(createProgram({'position': 0}))
+            vao.setAttribute('position',
+                VertexBuffer(numpy.zeros((numVertices, 2), numpy.float32)), 2)
+            vao.draw(gl.GL_TRIANGLES)
+
+            mockGl.reset_mock()
+            vao.draw(gl.GL_TRIANGLES)
+            calls.append(glCallCount(mockGl))
+
+        self.assertEquals(calls, [2, 2])
+        self.assertEquals(mockGl.glDrawArrays.call_args,
+            ((gl.GL_TRIANGLES, 0, 30000), {}))
+
+
+    @patch('vertexbuffer.gl')
+    def testDrawElements(self, mockGl):
+        indices = VertexBuffer(array('H', [0, 1, 2, 2, 3, 0]),
+            target=gl.GL_ELEMENT_ARRAY_BUFFER)
+        vao = VertexArray(createProgram({'position': 0}), indices,
+            gl.GL_UNSIGNED_SHORT)
+        vao.setAttribute('position', VertexBuffer(array('f', [0] * 8)), 2)
+
+        vao.draw(gl.GL_TRIANGLES)
+        vao.draw(gl.GL_TRIANGLES, first=3, count=3)
+
+        self.assertEquals(mockGl.glDrawElements.call_args_list, [
+            ((gl.GL_TRIANGLES, 6, gl.GL_UNSIGNED_SHORT, 0), {}),
+            ((gl.GL_TRIANGLES, 3, gl.GL_UNSIGNED_SHORT, 6), {}),
+        ])
+
+
+    @patch('vertexbuffer.gl')
+    def testSetAttributeRebuildsVertexArray(self, mockGl):
+        vao = VertexArray(createProgram({'position': 0, 'uv': 1}))
+        vao.setAttribute('position', VertexBuffer(array('f', [0] * 8)), 2)
+        vao.draw(gl.GL_TRIANGLES)
+
+        vao.setAttribute('uv', VertexBuffer(array('f', [0] * 8)), 2)
+        vao.draw(gl.GL_TRIANGLES)
+
+        self.assertEquals(mockGl.glGenVertexArrays.call_count, 2)
+        self.assertEquals(mockGl.glDeleteVertexArrays.call_count, 1)
+
+
+    @patch('vertexbuffer.gl')
+    def testInstancedAttributes(self, mockGl):
+        program = createProgram({'position': 0, 'transform': 2})
+        vao = VertexArray(program)
+        vao.setAttribute('position', VertexBuffer(array('f', [0] * 8)), 2)
+        vao.setAttribute('transform', VertexBuffer(array('f', [0] * 160)), 16,
+            divisor=1, columns=4)
+        self.assertEquals(vao.count, 4)
+
+        vao.drawInstanced(gl.GL_TRIANGLE_FAN, 10)
+
+        self.assertEquals(mockGl.glEnableVertexAttribArray.call_args_list,
+            [((0,), {}), ((2,), {}), ((3,), {}), ((4,), {}), ((5,), {})])
+        self.assertEquals(mockGl.glVertexAttribPointer.call_args_list[1:], [
+            ((2, 4, gl.GL_FLOAT, False, 64, 0), {}),
+            ((3, 4, gl.GL_FLOAT, False, 64, 16), {}),
+            ((4, 4, gl.GL_FLOAT, False, 64, 32), {}),
+            ((5, 4, gl.GL_FLOAT, False, 64, 48), {}),
+        ])
+        self.assertEquals(mockGl.glVertexAttribDivisor.call_args_list,
+            [((2, 1), {}), ((3, 1), {}), ((4, 1), {}), ((5, 1), {})])
+        self.assertEquals(mockGl.glDrawArraysInstanced.call_args,
+            ((gl.GL_TRIANGLE_FAN, 0, 4, 10), {}))
+        self.assertFalse(mockGl.glDrawArrays.called)
+
+
+    @patch('vertexbuffer.gl')
+    def testDrawElementsInstanced(self, mockGl):
+        indices = VertexBuffer(array('H', [0, 1, 2, 2, 3, 0]),
+            target=gl.GL_ELEMENT_ARRAY_BUFFER)
+        vao = VertexArray(createProgram({'position': 0}), indices,
+            gl.GL_UNSIGNED_SHORT)
+        vao.setAttribute('position', VertexBuffer(array('f', [0] * 8)), 2)
+
+        vao.drawInstanced(gl.GL_TRIANGLES, 5, first=3)
+
+        self.assertEquals(mockGl.glDrawElementsInstanced.call_args,
+            ((gl.GL_TRIANGLES, 3, gl.GL_UNSIGNED_SHORT, 6, 5), {}))
+
+
+    @patch('vertexbuffer.gl')
+    def testSharedLocationsServeManyPrograms(self, mockGl):
+        locations = {'position': 0, 'normal': 1}
+        lit = createProgram({'position': 0, 'normal': 1})
+        flat = createProgram({'position': 0})
+        other = createProgram({'position': 1})
+        vao = VertexArray(None, locations=locations)
+        vao.setAttribute('position', VertexBuffer(array('f', [0] * 9)), 3)
+        vao.setAttribute('normal', VertexBuffer(array('f', [0] * 9)), 3)
+
+        vao.draw(gl.GL_TRIANGLES, program=lit)
+        vao.draw(gl.GL_TRIANGLES, program=flat)
+
+        self.assertTrue(lit.use.called)
+        self.assertTrue(flat.use.called)
+        self.assertEquals(mockGl.glGenVertexArrays.call_count, 1)
+        self.assertEquals(mockGl.glEnableVertexAttribArray.call_args_list,
+            [((0,), {}), ((1,), {})])
+        self.assertTrue(vao.isCompatible(lit))
+        self.assertTrue(vao.isCompatible(flat))
+        self.assertFalse(vao.isCompatible(other))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import
+
+import json
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from unittest import TestCase, main
+
+from mock import Mock, patch
+
+import fixpath
+
+from shader import CompileError, FragmentShader, ShaderRegistry, VertexShader
+from warmup import DONE, Entry, FAILED, loadManifest, WarmUp
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+
+class WarmUpTest(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        for name in ['a.vert', 'b.frag', 'c.frag']:
+            open(os.path.join(self.directory, name), 'w').write(name)
+        self.clock = FakeClock()
+
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+
+    def createEntry(self, name, priority=0):
+        return Entry(name, [
+            ('vertex', [os.path.join(self.directory, 'a.vert')]),
+            ('fragment', [os.path.join(self.directory, 'b.frag')]),
+        ], priority)
+
+
+    def createProgramClass(self, stepTime=0.0):
+        def createProgram(*shaders):
+            program = Mock()
+            program.shaders = shaders
+            def takeTime(*_):
+                self.clock.now += stepTime
+            program.startBuild.side_effect = takeTime
+            program.finishBuild.side_effect = takeTime
+            return program
+        return createProgram
+
+
+    def testLoadManifest(self):
+        fname = os.path.join(self.directory, 'manifest.json')
+        json.dump({'programs': [
+            {'name': 'p1', 'shaders': [
+                {'type': 'vertex', 'sources': ['a.vert']},
+                {'type': 'fragment', 'sources': ['b.frag', 'c.frag']},
+            ]},
+            {'name': 'p2', 'priority': 5, 'shaders': []},
+        ]}, open(fname, 'w'))
+
+        entries = loadManifest(fname)
+
+        self.assertEquals([entry.name for entry in entries], ['p1', 'p2'])
+        self.assertEquals([entry.priority for entry in entries], [0, 5])
+        self.assertEquals(entries[0].shaders, [
+            ('vertex', [os.path.join(self.directory, 'a.vert')]),
+            ('fragment', [os.path.join(self.directory, 'b.frag'),
+                os.path.join(self.directory, 'c.frag')]),
+        ])
+
+
+    def testBuildsProgramsInPriorityOrder(self):
+        entries = [
+            self.createEntry('low', 1),
+            self.createEntry('high', 9),
+            self.createEntry('mid', 5),
+        ]
+        warmUp = WarmUp(entries, budget=1.0, clock=self.clock)
+        programClass = self.createProgramClass()
+        created = []
+        def createProgram(*shaders):
+            created.append(programClass(*shaders))
+            return created[-1]
+        with patch('warmup.ShaderProgram', createProgram):
+            while not warmUp.isDone():
+                warmUp.update()
+
+        self.assertEquals([entry.state for entry in entries], [DONE] * 3)
+        programNames = dict((entry.program, entry.name) for entry in entries)
+        self.assertEquals([programNames[program] for program in created],
+            ['high', 'mid', 'low'])
+        self.assertEquals(warmUp.getProgress(), 1.0)
+        programs = warmUp.getPrograms()
+        self.assertEquals(sorted(programs.keys()), ['high', 'low', 'mid'])
+        shaders = programs['high'].shaders
+        self.assertTrue(isinstance(shaders[0], VertexShader))
+        self.assertTrue(isinstance(shaders[1], FragmentShader))
+        self.assertEquals(shaders[1].sources, ('b.frag',))
+
+
+    def testUpdateStaysWithinBudget(self):
+        entries = [self.createEntry('p%d' % i) for i in xrange(4)]
+        warmUp = WarmUp(entries, budget=0.005, clock=self.clock)
+        progress = []
+        frameTimes = []
+        with patch('warmup.ShaderProgram', self.createProgramClass(0.002)):
+            while not warmUp.isDone():
+                start = self.clock.now
+                progress.append(warmUp.update())
+                frameTimes.append(self.clock.now - start)
+
+        # a step is only started while there is time left in the budget
+        self.assertTrue(max(frameTimes) < 0.005 + 0.002)
+        self.assertEquals(len(progress), 3)
+        self.assertEquals(progress[-1], 1.0)
+        self.assertEquals(progress, sorted(progress))
+        self.assertEquals(warmUp.getBuildTimes(),
+            dict(('p%d' % i, 0.004) for i in xrange(4)))
+
+
+    def testUpdateAlwaysMakesProgress(self):
+        warmUp = WarmUp([self.createEntry('p')], budget=0, clock=self.clock)
+        with patch('warmup.ShaderProgram', self.createProgramClass(0.1)):
+            warmUp.update()
+            warmUp.update()
+            warmUp.update()
+
+        self.assertTrue(warmUp.isDone())
+
+
+    def testDoesNotBlockOnUnreadyPrograms(self):
+        entries = [self.createEntry('slow', 2), self.createEntry('fast', 1)]
+        warmUp = WarmUp(entries, budget=1.0, clock=self.clock)
+        programClass = self.createProgramClass()
+        created = []
+        def createProgram(*shaders):
+            program = programClass(*shaders)
+            # the first program created is 'slow', which never gets ready
+            program.isReady.return_value = bool(created)
+            created.append(program)
+            return program
+        with patch('warmup.ShaderProgram', createProgram):
+            warmUp.update()
+
+        self.assertEquals([entry.state for entry in entries], ['started', DONE])
+        self.assertFalse(entries[0].program.finishBuild.called)
+
+
+    def testFailuresAreReported(self):
+        entries = [self.createEntry('bad'), self.createEntry('good')]
+        entries[0].shaders[0][1][0] = 'missing.vert'
+        warmUp = WarmUp(entries, budget=1.0, clock=self.clock)
+        with patch('warmup.ShaderProgram', self.createProgramClass()):
+            warmUp.update()
+
+        self.assertEquals(warmUp.getFailures(), [entries[0]])
+        self.assertTrue(isinstance(entries[0].error, IOError))
+        self.assertEquals(warmUp.getPrograms().keys(), ['good'])
+
+
+    def testBuildErrorsAreReported(self):
+        warmUp = WarmUp([self.createEntry('bad')], budget=1.0, clock=self.clock)
+        programClass = self.createProgramClass()
+        def createProgram(*shaders):
+            program = programClass(*shaders)
+            def fail():
+                raise CompileError('oops')
+            program.finishBuild.side_effect = fail
+            return program
+        with patch('warmup.ShaderProgram', createProgram):
+            warmUp.update()
+
+        self.assertEquals(warmUp.entries[0].state, FAILED)
+        self.assertEquals(str(warmUp.entries[0].error), 'oops')
+
+
+    def testUsesRegistry(self):
+        registry = ShaderRegistry()
+        entries = [self.createEntry('p1'), self.createEntry('p2')]
+        warmUp = WarmUp(entries, budget=1.0, registry=registry,
+            clock=self.clock)
+        with patch('warmup.ShaderProgram', self.createProgramClass()):
+            warmUp.update()
+
+        self.assertTrue(
+            entries[0].program.shaders[0] is entries[1].program.shaders[0])
+        self.assertEquals(len(registry), 2)
+
+
+
+if __name__ == '__main__':
+    main()
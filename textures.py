@@ -0,0 +1,161 @@
+'''
+Binds textures and sampler objects to texture units, remembering what is
+bound to each unit in each GL context, so that binds of what is already in
+place are skipped.
+
+Each program's sampler uniforms are given their own units by reflection,
+when it is linked, as program.samplerUnits. Textures are then bound by the
+name of the sampler uniform using them:
+
+    units = getTextureUnits()
+    program.use()
+    units.bindProgramTextures(program, {
+        'diffuse': (gl.GL_TEXTURE_2D, brick),
+        'shadow': (gl.GL_TEXTURE_2D, depth),
+    }, samplers={'shadow': comparison.id})
+
+The sampler uniforms are set to their units the first time, and after that,
+since the program remembers their values, cost nothing.
+'''
+
+from ctypes import byref, c_uint
+from weakref import WeakKeyDictionary
+
+from glbackend import getGl
+import lifetime
+
+
+gl = getGl()
+
+
+# TextureUnits for each GL context
+_textureUnits = WeakKeyDictionary()
+
+
+def getTextureUnits():
+    '''
+    Returns the TextureUnits tracking the current GL context. Without a
+    context, returns a new one each time, so no bind is skipped.
+    '''
+    context = gl.current_context
+    if context is None:
+        return TextureUnits()
+    units = _textureUnits.get(context)
+    if units is None:
+        units = _textureUnits[context] = TextureUnits()
+    return units
+
+
+def getSamplerUnit(program, name):
+    '''
+    Returns the texture unit of the named sampler uniform of the program,
+    or of an element of an array of them, like 'shadows[1]', or None if
+    it isn't an active sampler.
+    '''
+    unit = program.samplerUnits.get(name)
+    if unit is not None or not name.endswith(']'):
+        return unit
+    arrayName, index = name[:-1].split('[')
+    unit = program.samplerUnits.get(arrayName)
+    if unit is None:
+        return None
+    return unit + int(index)
+
+
+
+class Sampler(object):
+
+    def __init__(self, parameters):
+        '''
+        Create a sampler object with the given dict of parameters, eg.
+        GL_TEXTURE_MIN_FILTER, to int value.
+        '''
+        samplerId = c_uint(0)
+        gl.glGenSamplers(1, byref(samplerId))
+        self.id = samplerId.value
+        lifetime.created('sampler', self.id, self)
+        for name, value in parameters.iteritems():
+            gl.glSamplerParameteri(self.id, name, value)
+
+
+    def delete(self):
+        if self.id is not None:
+            gl.glDeleteSamplers(1, byref(c_uint(self.id)))
+            lifetime.deleted('sampler', self.id)
+            self.id = None
+
+
+
+class TextureUnits(object):
+
+    def __init__(self):
+        # unit: (target, texture id)
+        self.textures = {}
+        # unit: sampler id
+        self.samplers = {}
+        self.activeUnit = None
+        self.bindsIssued = 0
+        self.bindsElided = 0
+
+
+    def bindTexture(self, unit, target, texture):
+        if self.textures.get(unit) == (target, texture):
+            self.bindsElided += 1
+            return
+        if self.activeUnit != unit:
+            gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+            self.activeUnit = unit
+        gl.glBindTexture(target, texture)
+        self.textures[unit] = (target, texture)
+        self.bindsIssued += 1
+
+
+    def bindSampler(self, unit, sampler):
+        '''
+        Bind a sampler object id to the unit, overriding the sampling
+        parameters of the texture bound there, or 0 to stop doing so.
+        '''
+        if self.samplers.get(unit, 0) == sampler:
+            self.bindsElided += 1
+            return
+        gl.glBindSampler(unit, sampler)
+        self.samplers[unit] = sampler
+        self.bindsIssued += 1
+
+
+    def bindProgramTextures(self, program, textures, samplers=None):
+        '''
+        Bind textures to the units of the named sampler uniforms of the
+        given program, which must be in use. textures is a dict of sampler
+        uniform name to (target, texture id), and samplers optionally a
+        dict of sampler uniform name to sampler object id. Elements of
+        arrays of samplers are named like 'shadows[1]'. Names which aren't
+        active samplers in the program are ignored.
+        '''
+        for name, (target, texture) in textures.iteritems():
+            unit = getSamplerUnit(program, name)
+            if unit is not None:
+                program.setUniformi(name, unit)
+                self.bindTexture(unit, target, texture)
+        if samplers:
+            for name, sampler in samplers.iteritems():
+                unit = getSamplerUnit(program, name)
+                if unit is not None:
+                    self.bindSampler(unit, sampler)
+
+
+    def invalidate(self):
+        '''
+        Forget what is bound, eg. after other code has bound textures
+        without going through this.
+        '''
+        self.textures = {}
+        self.samplers = {}
+        self.activeUnit = None
+
+
+    def getStats(self):
+        return {
+            'bindsIssued': self.bindsIssued,
+            'bindsElided': self.bindsElided,
+        }
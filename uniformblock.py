@@ -0,0 +1,210 @@
+'''
+Uniform buffer objects laid out with the std140 rules, backed by a NumPy
+structured array. Values are written into the array, and only the byte range
+changed since the last upload is sent to GL, with a single glBufferSubData.
+
+A block is attached to a binding point, so one UniformBlock can feed the
+same named uniform block in any number of programs.
+
+Requires NumPy.
+'''
+
+from ctypes import byref, c_uint
+
+import numpy
+
+from glbackend import getGl
+import lifetime
+
+
+gl = getGl()
+
+
+# glsl type name: (numpy base type, rows, columns)
+glslTypes = {
+    'float': (numpy.float32, 1, 1),
+    'int': (numpy.int32, 1, 1),
+    'uint': (numpy.uint32, 1, 1),
+    'bool': (numpy.int32, 1, 1),
+    'vec2': (numpy.float32, 2, 1),
+    'vec3': (numpy.float32, 3, 1),
+    'vec4': (numpy.float32, 4, 1),
+    'ivec2': (numpy.int32, 2, 1),
+    'ivec3': (numpy.int32, 3, 1),
+    'ivec4': (numpy.int32, 4, 1),
+    'uvec2': (numpy.uint32, 2, 1),
+    'uvec3': (numpy.uint32, 3, 1),
+    'uvec4': (numpy.uint32, 4, 1),
+    'mat2': (numpy.float32, 2, 2),
+    'mat3': (numpy.float32, 3, 3),
+    'mat4': (numpy.float32, 4, 4),
+    'mat2x3': (numpy.float32, 3, 2),
+    'mat2x4': (numpy.float32, 4, 2),
+    'mat3x2': (numpy.float32, 2, 3),
+    'mat3x4': (numpy.float32, 4, 3),
+    'mat4x2': (numpy.float32, 2, 4),
+    'mat4x3': (numpy.float32, 3, 4),
+}
+
+# std140 pads array elements and matrix columns to the size of a vec4
+VEC4_SIZE = 16
+
+
+def _roundUp(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+class Field(object):
+
+    def __init__(self, name, glslType, count):
+        base, rows, columns = glslTypes[glslType]
+        self.name = name
+        self.glslType = glslType
+        self.count = count
+        self.offset = None
+        self.rows = rows
+        # arrays and matrices are stored as padded vec4 slots
+        self.padded = count > 1 or columns > 1
+        if self.padded:
+            shape = (columns, VEC4_SIZE // 4)
+            if count > 1:
+                shape = (count,) + shape
+            if columns == 1:
+                shape = shape[:-2] + shape[-1:]
+            self.shape = shape
+            self.size = count * columns * VEC4_SIZE
+            self.alignment = VEC4_SIZE
+        else:
+            self.shape = (rows,) if rows > 1 else ()
+            self.size = rows * 4
+            self.alignment = 4 if rows == 1 else (8 if rows == 2 else 16)
+        self.base = base
+
+
+    def getFormat(self):
+        return (self.base, self.shape) if self.shape else self.base
+
+
+    def assign(self, view, value):
+        if self.padded:
+            # only the first 'rows' components of each vec4 slot are used
+            view[..., :self.rows] = numpy.reshape(
+                value, view.shape[:-1] + (self.rows,))
+        else:
+            view[...] = value
+
+
+
+def std140Layout(declarations):
+    '''
+    Takes a list of (name, glslType) or (name, glslType, count) tuples, in
+    the order they are declared in the GLSL uniform block. Returns a list
+    of Fields and the total size of the block in bytes.
+    '''
+    fields = []
+    offset = 0
+    for declaration in declarations:
+        name, glslType = declaration[:2]
+        count = declaration[2] if len(declaration) > 2 else 1
+        field = Field(name, glslType, count)
+        field.offset = offset = _roundUp(offset, field.alignment)
+        offset += field.size
+        fields.append(field)
+    return fields, _roundUp(offset, VEC4_SIZE)
+
+
+
+class UniformBlock(object):
+
+    def __init__(self, name, declarations, binding):
+        self.name = name
+        self.binding = binding
+        self.fields, self.size = std140Layout(declarations)
+        self.fieldsByName = dict((field.name, field) for field in self.fields)
+        self.dtype = numpy.dtype({
+            'names': [field.name for field in self.fields],
+            'formats': [field.getFormat() for field in self.fields],
+            'offsets': [field.offset for field in self.fields],
+            'itemsize': self.size,
+        })
+        self.data = numpy.zeros(1, dtype=self.dtype)
+        self.id = None
+        self.uploads = 0
+        self.bytesUploaded = 0
+        # (start, end) byte range changed since the last upload
+        self._dirty = None
+
+
+    def __getitem__(self, name):
+        return self.data[name][0]
+
+
+    def __setitem__(self, name, value):
+        field = self.fieldsByName[name]
+        field.assign(self.data[name], value)
+        self.markDirty(field.offset, field.offset + field.size)
+
+
+    def markDirty(self, start=0, end=None):
+        if end is None:
+            end = self.size
+        if self._dirty is None:
+            self._dirty = (start, end)
+        else:
+            self._dirty = (min(self._dirty[0], start), max(self._dirty[1], end))
+
+
+    def _create(self):
+        bufferId = c_uint(0)
+        gl.glGenBuffers(1, byref(bufferId))
+        self.id = bufferId.value
+        lifetime.created('buffer', self.id, self)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.id)
+        gl.glBufferData(gl.GL_UNIFORM_BUFFER, self.size, self.data.ctypes.data,
+            gl.GL_DYNAMIC_DRAW)
+        gl.glBindBufferBase(gl.GL_UNIFORM_BUFFER, self.binding, self.id)
+        self.uploads += 1
+        self.bytesUploaded += self.size
+        self._dirty = None
+
+
+    def upload(self):
+        if self.id is None:
+            self._create()
+            return
+        if self._dirty is None:
+            return
+        start, end = self._dirty
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.id)
+        gl.glBufferSubData(gl.GL_UNIFORM_BUFFER, start, end - start,
+            self.data.ctypes.data + start)
+        self.uploads += 1
+        self.bytesUploaded += end - start
+        self._dirty = None
+
+
+    def bindTo(self, program):
+        '''
+        Connect the named uniform block in the given linked program to this
+        block's binding point. Raises ValueError if the program's layout of
+        the block does not match this one.
+        '''
+        info = program.uniformBlocks.get(self.name)
+        if info is None:
+            raise ValueError('no active uniform block %s in program %s' %
+                (self.name, program.id))
+        for memberName, offset in info.offsets.iteritems():
+            field = self.fieldsByName.get(memberName.split('.')[-1])
+            if field is None or field.offset != offset:
+                raise ValueError('uniform block %s member %s at offset %d '
+                    'does not match the std140 layout' %
+                    (self.name, memberName, offset))
+        gl.glUniformBlockBinding(program.id, info.index, self.binding)
+        program.uniformBlockBindings[self.name] = self.binding
+
+
+    def delete(self):
+        if self.id is not None:
+            gl.glDeleteBuffers(1, byref(c_uint(self.id)))
+            lifetime.deleted('buffer', self.id)
+            self.id = None
@@ -0,0 +1,133 @@
+'''
+Shader permutations, made by prepending #define lines for a set of feature
+flags to the sources of each stage. Each combination of features is only
+compiled the first time it is requested, and the least recently used
+programs are deleted once more than maxPrograms are alive.
+'''
+
+from collections import OrderedDict
+
+from preprocess import findVersionLine
+from shader import ShaderProgram
+
+
+def getDefines(features):
+    lines = []
+    for name, value in features:
+        lines.append('#define %s %s\n' % (name, value))
+    return ''.join(lines)
+
+
+def insertDefines(sources, defines):
+    '''
+    Return a copy of the given list of sources, with the given defines
+    prepended. If the first source has a #version directive, with only
+    blank lines and comments before it, the defines are put after it, since
+    nothing else may come before #version.
+    '''
+    sources = list(sources)
+    if sources:
+        lines = sources[0].splitlines(True)
+        index = findVersionLine(lines)
+        if index is not None:
+            version = ''.join(lines[:index + 1])
+            if not version.endswith('\n'):
+                version += '\n'
+            return [version, defines, ''.join(lines[index + 1:])] + \
+                sources[1:]
+    return [defines] + sources
+
+
+
+class ProgramVariants(object):
+
+    def __init__(self, shaders, maxPrograms=64, registry=None):
+        # list of (shader class, list of sources)
+        self.shaders = []
+        for shaderClass, sources in shaders:
+            if isinstance(sources, basestring):
+                sources = [sources]
+            self.shaders.append((shaderClass, list(sources)))
+        self.maxPrograms = maxPrograms
+        self.registry = registry
+        self.programs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.compiles = 0
+        self.evictions = 0
+
+
+    def _getKey(self, features):
+        if hasattr(features, 'items'):
+            items = features.items()
+        else:
+            items = [(name, 1) for name in features]
+        return tuple(sorted(items))
+
+
+    def _createShader(self, shaderClass, sources):
+        if self.registry is not None:
+            return self.registry.get(shaderClass, sources)
+        return shaderClass(sources)
+
+
+    def get(self, features=()):
+        '''
+        Return the built program for the given features, which is either a
+        dict of define names to values, or a sequence of names, each of
+        which is defined as 1.
+        '''
+        key = self._getKey(features)
+        program = self.programs.pop(key, None)
+        if program is not None:
+            self.hits += 1
+            # re-insert as the most recently used
+            self.programs[key] = program
+            return program
+
+        self.misses += 1
+        defines = getDefines(key)
+        program = ShaderProgram(*[
+            self._createShader(shaderClass, insertDefines(sources, defines))
+            for shaderClass, sources in self.shaders
+        ])
+        try:
+            program.build()
+        except:
+            program.delete()
+            raise
+        self.compiles += 1
+        self.programs[key] = program
+        self._evict()
+        return program
+
+
+    def _evict(self):
+        while len(self.programs) > self.maxPrograms:
+            _, program = self.programs.popitem(last=False)
+            program.delete()
+            self.evictions += 1
+
+
+    def getHitRate(self):
+        requests = self.hits + self.misses
+        if requests == 0:
+            return 0.0
+        return float(self.hits) / requests
+
+
+    def getStats(self):
+        return {
+            'programs': len(self.programs),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.getHitRate(),
+            'compiles': self.compiles,
+            'evictions': self.evictions,
+        }
+
+
+    def delete(self):
+        for program in self.programs.itervalues():
+            program.delete()
+        self.programs.clear()
@@ -0,0 +1,263 @@
+'''
+Vertex buffer objects and vertex array objects.
+
+Buffers take any object supporting the buffer protocol, such as NumPy arrays,
+array.array or str, and pass its memory straight to glBufferData without
+copying it first. A VertexArray maps the attribute names of a ShaderProgram
+to buffers, so drawing it costs the same few GL calls whatever the number of
+vertices.
+'''
+
+from ctypes import (
+    byref, c_byte, c_double, c_float, c_int, c_short, c_ssize_t, c_ubyte,
+    c_uint, c_ushort, c_void_p, POINTER, py_object, pythonapi, sizeof,
+)
+
+from glbackend import getGl
+import lifetime
+
+
+gl = getGl()
+
+
+_asReadBuffer = pythonapi.PyObject_AsReadBuffer
+_asReadBuffer.argtypes = [py_object, POINTER(c_void_p), POINTER(c_ssize_t)]
+
+
+def getBufferAddress(data):
+    '''
+    Return the address and size in bytes of the memory underlying the given
+    buffer protocol object, without copying it. Raises TypeError for objects
+    which don't expose a single contiguous buffer.
+    '''
+    address = c_void_p()
+    size = c_ssize_t()
+    _asReadBuffer(data, byref(address), byref(size))
+    return address.value, size.value
+
+
+typeSizes = {
+    gl.GL_BYTE: sizeof(c_byte),
+    gl.GL_UNSIGNED_BYTE: sizeof(c_ubyte),
+    gl.GL_SHORT: sizeof(c_short),
+    gl.GL_UNSIGNED_SHORT: sizeof(c_ushort),
+    gl.GL_INT: sizeof(c_int),
+    gl.GL_UNSIGNED_INT: sizeof(c_uint),
+    gl.GL_FLOAT: sizeof(c_float),
+    gl.GL_DOUBLE: sizeof(c_double),
+}
+
+
+
+class VertexBuffer(object):
+
+    def __init__(self, data, target=gl.GL_ARRAY_BUFFER, usage=gl.GL_STATIC_DRAW):
+        self.target = target
+        self.usage = usage
+        self.id = None
+        self.size = 0
+        self.setData(data)
+
+
+    def bind(self):
+        gl.glBindBuffer(self.target, self.id)
+
+
+    def setData(self, data):
+        address, size = getBufferAddress(data)
+        if self.id is None:
+            bufferId = c_uint(0)
+            gl.glGenBuffers(1, byref(bufferId))
+            self.id = bufferId.value
+            lifetime.created('buffer', self.id, self)
+        self.bind()
+        gl.glBufferData(self.target, size, address, self.usage)
+        self.size = size
+
+
+    def setSubData(self, offset, data):
+        address, size = getBufferAddress(data)
+        if offset + size > self.size:
+            raise ValueError('%d bytes at offset %d overflows buffer of %d' %
+                (size, offset, self.size))
+        self.bind()
+        gl.glBufferSubData(self.target, offset, size, address)
+
+
+    def delete(self):
+        if self.id is not None:
+            gl.glDeleteBuffers(1, byref(c_uint(self.id)))
+            lifetime.deleted('buffer', self.id)
+            self.id = None
+
+
+
+class Attribute(object):
+
+    def __init__(self, name, buffer, size, type, normalized, stride, offset,
+        divisor=0, columns=1):
+        self.name = name
+        self.buffer = buffer
+        self.size = size
+        self.type = type
+        self.normalized = normalized
+        self.stride = stride
+        self.offset = offset
+        # advance once per this many instances, or once per vertex if 0
+        self.divisor = divisor
+        # matrices take one location per column
+        self.columns = columns
+
+
+    def getStride(self):
+        return self.stride or self.size * typeSizes[self.type]
+
+
+    def getVertexCount(self):
+        attributeSize = self.size * typeSizes[self.type]
+        stride = self.getStride()
+        available = self.buffer.size - self.offset - attributeSize
+        if available < 0:
+            return 0
+        return available // stride + 1
+
+
+
+class VertexArray(object):
+
+    def __init__(self, program, indices=None, indexType=gl.GL_UNSIGNED_INT,
+        locations=None):
+        '''
+        Attributes are found at the locations given by the program's
+        reflection data, or if locations is given, at those locations, eg.
+        ShaderProgram.attributeLocations, so that the vertex array can be
+        drawn with any program using them. program may then be None.
+        '''
+        self.program = program
+        self.locations = locations
+        self.indices = indices
+        self.indexType = indexType
+        self.indexSize = typeSizes[indexType]
+        self.attributes = []
+        self.id = None
+        self.count = None
+
+
+    def setAttribute(self, name, buffer, size, type=gl.GL_FLOAT,
+        normalized=False, stride=0, offset=0, divisor=0, columns=1):
+        '''
+        Source the named attribute from buffer. Per instance attributes have
+        a divisor of 1, or more to advance every few instances. Matrix
+        attributes give their number of columns, and a size of all their
+        components, eg. 16 and 4 columns for a mat4.
+        '''
+        attribute = Attribute(name, buffer, size, type, normalized, stride,
+            offset, divisor, columns)
+        self.attributes.append(attribute)
+        if divisor == 0:
+            count = attribute.getVertexCount()
+            if self.count is None or count < self.count:
+                self.count = count
+        # rebuild the vertex array on next draw
+        self.delete()
+        return attribute
+
+
+    def _getLocations(self):
+        if self.locations is not None:
+            return self.locations
+        if self.program.id is None:
+            self.program.build()
+        return self.program.attributes
+
+
+    def isCompatible(self, program):
+        '''
+        Returns whether each active attribute of the given linked program
+        is at the location this vertex array sources it at.
+        '''
+        locations = self._getLocations()
+        for name, location in program.attributes.iteritems():
+            if locations.get(name, location) != location:
+                return False
+        return True
+
+
+    def _create(self):
+        locations = self._getLocations()
+        vaoId = c_uint(0)
+        gl.glGenVertexArrays(1, byref(vaoId))
+        self.id = vaoId.value
+        lifetime.created('vertex array', self.id, self)
+        gl.glBindVertexArray(self.id)
+        for attribute in self.attributes:
+            location = locations.get(attribute.name)
+            if location is None:
+                # not an active attribute in this program
+                continue
+            attribute.buffer.bind()
+            size = attribute.size // attribute.columns
+            stride = attribute.stride
+            if attribute.columns > 1:
+                stride = attribute.getStride()
+            for column in xrange(attribute.columns):
+                offset = attribute.offset + \
+                    column * size * typeSizes[attribute.type]
+                gl.glEnableVertexAttribArray(location + column)
+                gl.glVertexAttribPointer(location + column, size,
+                    attribute.type, attribute.normalized, stride, offset)
+                if attribute.divisor:
+                    gl.glVertexAttribDivisor(location + column,
+                        attribute.divisor)
+        if self.indices is not None:
+            self.indices.bind()
+
+
+    def bind(self):
+        if self.id is None:
+            self._create()
+        else:
+            gl.glBindVertexArray(self.id)
+
+
+    def draw(self, mode, first=0, count=None, program=None):
+        (program or self.program).use()
+        self.bind()
+        self.drawBound(mode, first, count)
+
+
+    def drawInstanced(self, mode, instances, first=0, count=None,
+        program=None):
+        (program or self.program).use()
+        self.bind()
+        self.drawBound(mode, first, count, instances)
+
+
+    def drawBound(self, mode, first=0, count=None, instances=None):
+        '''
+        Draw, assuming the program is in use and this vertex array is bound.
+        If instances is given, draws that many instances, with one call.
+        '''
+        if self.indices is not None:
+            if count is None:
+                count = self.indices.size // self.indexSize - first
+            offset = first * self.indexSize
+            if instances is None:
+                gl.glDrawElements(mode, count, self.indexType, offset)
+            else:
+                gl.glDrawElementsInstanced(
+                    mode, count, self.indexType, offset, instances)
+        else:
+            if count is None:
+                count = self.count - first
+            if instances is None:
+                gl.glDrawArrays(mode, first, count)
+            else:
+                gl.glDrawArraysInstanced(mode, first, count, instances)
+
+
+    def delete(self):
+        if self.id is not None:
+            gl.glDeleteVertexArrays(1, byref(c_uint(self.id)))
+            lifetime.deleted('vertex array', self.id)
+            self.id = None
@@ -0,0 +1,196 @@
+'''
+Builds the programs listed in a manifest a little at a time, spending no
+more than a fixed time budget per frame, so that programs are ready before
+they are first used, without causing a hitch in any one frame.
+
+A manifest is a JSON file like:
+
+{
+    "programs": [
+        {
+            "name": "terrain",
+            "priority": 10,
+            "shaders": [
+                {"type": "vertex", "sources": ["common.glsl", "terrain.vert"]},
+                {"type": "fragment", "sources": ["terrain.frag"]}
+            ]
+        }
+    ]
+}
+
+Source filenames are relative to the manifest. Programs with higher priority
+are built first.
+'''
+
+import json
+from os.path import dirname, join
+try:
+    from time import perf_counter
+except ImportError:
+    from timeit import default_timer as perf_counter
+
+from shader import (
+    ComputeShader, FragmentShader, ShaderError, ShaderProgram, VertexShader,
+)
+
+
+shaderTypes = {
+    'vertex': VertexShader,
+    'fragment': FragmentShader,
+    'compute': ComputeShader,
+}
+
+
+# states that each Entry goes through, in order
+QUEUED = 'queued'
+LOADED = 'loaded'
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def read_source(fname):
+    f = open(fname)
+    try:
+        src = f.read()
+    finally:
+        f.close()
+    return src
+
+
+class Entry(object):
+
+    def __init__(self, name, shaders, priority=0):
+        self.name = name
+        # list of (shader type name, list of source filenames)
+        self.shaders = shaders
+        self.priority = priority
+        self.state = QUEUED
+        self.program = None
+        self.buildTime = 0.0
+        self.error = None
+
+
+    def __repr__(self):
+        return '<Entry %s %s>' % (self.name, self.state)
+
+
+
+def loadManifest(fname):
+    f = open(fname)
+    try:
+        manifest = json.load(f)
+    finally:
+        f.close()
+    directory = dirname(fname)
+    entries = []
+    for item in manifest['programs']:
+        shaders = [
+            (str(shader['type']),
+                [join(directory, source) for source in shader['sources']])
+            for shader in item['shaders']
+        ]
+        entries.append(
+            Entry(str(item['name']), shaders, item.get('priority', 0)))
+    return entries
+
+
+
+class WarmUp(object):
+
+    def __init__(self, entries, budget=0.004, registry=None, clock=perf_counter):
+        self.budget = budget
+        self.registry = registry
+        self.clock = clock
+        self.entries = list(entries)
+        # a stable sort, so equal priorities stay in manifest order
+        self._queue = sorted(self.entries, key=lambda entry: -entry.priority)
+
+
+    def _createShader(self, typeName, fnames):
+        shaderClass = shaderTypes[typeName]
+        sources = [read_source(fname) for fname in fnames]
+        if self.registry is not None:
+            return self.registry.get(shaderClass, sources)
+        return shaderClass(sources)
+
+
+    def _step(self, entry):
+        if entry.state == QUEUED:
+            entry.program = ShaderProgram(*[
+                self._createShader(typeName, fnames)
+                for typeName, fnames in entry.shaders
+            ])
+            entry.program.name = entry.name
+            entry.state = LOADED
+        elif entry.state == LOADED:
+            entry.program.startBuild()
+            entry.state = STARTED
+        else:
+            entry.program.finishBuild()
+            entry.state = DONE
+
+
+    def _getNext(self):
+        for entry in self._queue:
+            # don't block waiting for the driver while other work is queued
+            if entry.state != STARTED or entry.program.isReady():
+                return entry
+        return None
+
+
+    def update(self):
+        '''
+        Call once per frame. Does as much work as fits in the time budget,
+        but always at least one step, so that progress is made even when the
+        budget is tiny. Returns the fraction of programs finished.
+        '''
+        deadline = self.clock() + self.budget
+        worked = False
+        while self._queue:
+            if worked and self.clock() >= deadline:
+                break
+            entry = self._getNext()
+            if entry is None:
+                break
+            start = self.clock()
+            try:
+                self._step(entry)
+            except (IOError, ShaderError), e:
+                entry.error = e
+                entry.state = FAILED
+            entry.buildTime += self.clock() - start
+            if entry.state in (DONE, FAILED):
+                self._queue.remove(entry)
+            worked = True
+        return self.getProgress()
+
+
+    def getProgress(self):
+        if not self.entries:
+            return 1.0
+        return 1.0 - float(len(self._queue)) / len(self.entries)
+
+
+    def isDone(self):
+        return not self._queue
+
+
+    def getPrograms(self):
+        return dict(
+            (entry.name, entry.program)
+            for entry in self.entries
+            if entry.state == DONE
+        )
+
+
+    def getBuildTimes(self):
+        return dict(
+            (entry.name, entry.buildTime)
+            for entry in self.entries
+            if entry.state in (DONE, FAILED)
+        )
+
+
+    def getFailures(self):
+        return [entry for entry in self.entries if entry.state == FAILED]